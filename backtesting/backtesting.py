@@ -1,26 +1,20 @@
-from functools import partial
 import logging
-from rich.logging import RichHandler
-from rich.traceback import install
-
-#install(show_locals=True, max_frames=10)
-from rich.console import Console
-
-console = Console()
-
-logging.basicConfig(
-    format="[u]%(funcName)s[/](): %(message)s",
-    datefmt="[%x %X]",
-    level=logging.DEBUG,
-    force=True,
-    handlers=[RichHandler(rich_tracebacks=True, markup=True)],
-)
 
 log = logging.getLogger(__name__)
 
+import numpy as np
 import pandas as pd
-import betterMT5 as mt5
-from . import preprocessing
+from . import preprocessing, engine
+from .history import HistoryStore, HistoryMissError, Prefetcher
+from .runstore import RunStore
+from .ticks import TickStore
+from . import columnar
+from .columnar import ColumnarRun
+from .portfolio import Portfolio
+from .instrument import Instrument, NULL
+from .times import MINUTE, timeframe_ns, to_ns, to_timestamp
+from . import logs
+from .logs import configure_logging
 from .classes.order import Order, MarketOrder, LimitOrder, TP, StopOrder
 from .classes.position import (
     Position,
@@ -29,9 +23,15 @@ from .classes.position import (
 )
 from .classes.constants import SIDE, LABEL, ORDERTYPE
 from .classes.price import Price, Pips, candle_mean
-from typing import Union, List, Optional
+from typing import NamedTuple, Union, List, Optional
 import arrow
 from datetime import timedelta
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import nullcontext
+import itertools
+from collections import Counter
+import hashlib
+import json
 
 
 def has_candle_hit(order: Order, h: float, l: float, spread=None):
@@ -78,24 +78,290 @@ def find_hit(order: Order, position: Position):
     # gets rates stored in position obj
     l1 = position.rates
 
-    if order.price is None:
-        if order.ordertype == ORDERTYPE.MARKET:
-            try:
-                return l1[l1["time"] > order.time.datetime].iloc[0]
-            except IndexError:
-                return None
+    if order.price is None and order.ordertype != ORDERTYPE.MARKET:
         raise ValueError(f"trying to find a hit on a limit with no price, {order=}")
 
-    l1["hit"] = l1.apply(lambda x: has_candle_hit(order, x["high"], x["low"]), axis=1)
+    candles = engine.Candles.from_frame(l1, position.symbol.info.trade_tick_size)
+
+    # first candle where there is a hit, after the order
+    i = engine.first_hit(order, candles)
+    return None if i is None else l1.iloc[i]
+
+
+def _execute_orders(orders: List[Order], hits: np.ndarray, position: Position, fills=None):
+    """Sets the execution of every order that got hit. Market orders get
+    filled at the candle mean, the others at their own price. fills has
+    the tick (time and quote) of the orders settled tick by tick."""
+    tick_size = position.symbol.info.trade_tick_size
+    for j, (o, i) in enumerate(zip(orders, hits)):
+        if i == engine.NO_HIT:
+            continue
+        if fills and fills.get(j) is not None:
+            time, quote = fills[j]
+            position.orders.set_execution(
+                o,
+                pd.Timestamp(time, tz="UTC"),
+                Price(quote, tick_size) if o.ordertype == ORDERTYPE.MARKET else o.price,
+            )
+            continue
+        candle = _candle(position.rates, i)
+        position.orders.set_execution(
+            o,
+            candle["time"],
+            Price(candle_mean(candle), tick_size)
+            if o.ordertype == ORDERTYPE.MARKET
+            else o.price,
+        )
+
+
+def _candle(rates: pd.DataFrame, i: int) -> dict:
+    """Time (ns), high and low of bar i, without building a row of it"""
+    return dict(
+        time=engine.to_ns(rates["time"].iat[i]),
+        high=rates["high"].iat[i],
+        low=rates["low"].iat[i],
+    )
+
+
+def _order_arrays(orders: List[Order]):
+    """Times (ns), ordertypes, sides and price ticks of the orders"""
+    times, prices = [], []
+    for o in orders:
+        if o.price is None and o.ordertype != ORDERTYPE.MARKET:
+            raise ValueError(f"trying to find a hit on a limit with no price, {o=}")
+        times.append(o.time)
+        prices.append(0 if o.price is None else o.price.ticks)
+    return (
+        np.array(times, dtype=np.int64),
+        np.array([o.ordertype for o in orders], dtype=np.int64),
+        np.array([o.side for o in orders], dtype=np.int64),
+        np.array(prices, dtype=np.int64),
+    )
+
 
-    # this are the candles where there is a hit, after the order
-    hits = l1[l1["hit"] & (l1["time"] > order.time.datetime)]
+def fill_market_entry(p: Position) -> bool:
+    """Fills a market entry at the mean of the bar the signal was sent in
+    (or the next one, if the market was closed). Returns False if p.rates
+    has no such bar."""
+
+    times = engine.to_ns(p.rates["time"])
+    i = int(np.searchsorted(times, p.time_ns - p.time_ns % MINUTE, side="left"))
+    if i == len(times):
+        return False
+    candle = _candle(p.rates, i)
+    p.fill_entry(candle["time"], Price(candle_mean(candle), p.symbol.info.trade_tick_size))
+    return True
+
+
+def drill_down(p: Position, coarse: pd.DataFrame, eop, history: HistoryStore, timeframe, coarse_tf) -> pd.DataFrame:
+    """Bars of the position on timeframe, but only inside the coarse bars
+    that matter. For the entry, and then for every order from the entry
+    on, coarse bars whose range reaches the order price get drilled into
+    one at a time until a fine bar hits (fine bars can't reach further
+    than the coarse bar they're in); market orders only need the first
+    fine bar after their time, and the last coarse bar is there for the
+    end of period. Hits found on these bars are the same as on every bar
+    of the window.
+
+    Market entries get filled on the way, since breakeven prices depend
+    on them."""
+
+    tick_size = p.symbol.info.trade_tick_size
+    candles = engine.Candles.from_frame(coarse, tick_size)
+    bar = timeframe_ns(coarse_tf)
+    start, end = p.time_ns - p.time_ns % MINUTE, engine.to_ns(eop)
+    loaded = dict()
+    fine_candles = dict()
+
+    def fine(k: int) -> engine.Candles:
+        if k not in loaded:
+            a = max(int(candles.time[k]), start)
+            b = min(int(candles.time[k]) + bar, end)
+            loaded[k] = history.get(
+                p.symbol.name, timeframe, pd.Timestamp(a, tz="UTC"), pd.Timestamp(max(a, b), tz="UTC")
+            )
+            fine_candles[k] = engine.Candles.from_frame(loaded[k], tick_size)
+        return fine_candles[k]
+
+    def first_bar(after: int, side="right") -> Optional[int]:
+        """Time of the first fine bar after the given time"""
+        k = max(int(np.searchsorted(candles.time, after, side="right")) - 1, 0)
+        for k in range(k, len(candles)):
+            times = fine(k).time
+            i = int(np.searchsorted(times, after, side=side))
+            if i < len(times):
+                return int(times[i])
+        return None
 
-    try:
-        return hits.iloc[0]
-    except IndexError:
+    def first_hit(o: Order, after: int) -> Optional[int]:
+        """Time of the first fine bar after the given time that hits o"""
+        if o.ordertype == ORDERTYPE.MARKET:
+            return first_bar(after)
+        k = max(int(np.searchsorted(candles.time, after, side="right")) - 1, 0)
+        mask = engine.hit_mask(o.ordertype, o.side, o.price.ticks, candles.high[k:], candles.low[k:])
+        for k in k + np.flatnonzero(mask):
+            bars = fine(k)
+            s = int(np.searchsorted(bars.time, after, side="right"))
+            hits = engine.hit_mask(o.ordertype, o.side, o.price.ticks, bars.high[s:], bars.low[s:])
+            if hits.any():
+                return int(bars.time[s + int(hits.argmax())])
         return None
 
+    def rates() -> pd.DataFrame:
+        if not loaded:
+            return history.get(p.symbol.name, timeframe, pd.Timestamp(start, tz="UTC"), pd.Timestamp(start, tz="UTC"))
+        return pd.concat([loaded[k] for k in sorted(loaded)], ignore_index=True)
+
+    if len(candles):
+        fine(len(candles) - 1)
+
+    if p.entry.execution is not None:
+        entry_time = p.entry.execution.time
+    elif p.entry.ordertype == ORDERTYPE.MARKET:
+        first_bar(start, side="left")
+        p.rates = rates()
+        if not fill_market_entry(p):
+            return p.rates
+        entry_time = p.entry.execution.time
+    else:
+        entry_time = first_hit(p.entry, p.entry.time)
+        if entry_time is None:
+            return rates()
+
+    for o in p.get_orders():
+        first_hit(o, max(o.time, entry_time))
+
+    return rates()
+
+
+def _resolution_task(p: Position):
+    """Orders of the position, and the arguments engine.resolve needs for
+    them (plain arrays only, cheap to send to a worker process)"""
+
+    tick_size = p.symbol.info.trade_tick_size
+    candles = engine.Candles.from_frame(p.rates, tick_size)
+    orders = p.get_orders()
+
+    if p.entry.execution is None:
+        entry, entry_time = _order_arrays([p.entry]), None
+    else:
+        entry, entry_time = None, p.entry.execution.time
+
+    return orders, (candles, _order_arrays(orders), entry, entry_time)
+
+
+# positions resolved per task sent to a worker process: one task each
+# would spend more on pickling the candles than on the search
+RESOLVE_CHUNK = 32
+
+
+def _resolve_many(tasks: list) -> list:
+    """engine.resolve of every task, in one call to a worker"""
+    return [engine.resolve(*task) for task in tasks]
+
+
+class _Pending(NamedTuple):
+    """Resolution of a position sent to a worker, k-th of its chunk"""
+
+    future: Future
+    k: int
+
+    def result(self):
+        return self.future.result()[self.k]
+
+
+def _refine_with_ticks(p: Position, orders: List[Order], hits: np.ndarray, ticks: TickStore, timeframe) -> dict:
+    """Settles the candles where more than one order got hit tick by tick,
+    with the real spread. Returns {order index: (tick time, quote)} for
+    the orders it settled (None for the ones it couldn't, for lack of
+    ticks). Orders that don't trigger on the ticks of their candle get
+    searched for again from the next one, so hits is updated in place."""
+
+    tick_size = p.symbol.info.trade_tick_size
+    candles = engine.Candles.from_frame(p.rates, tick_size)
+    times, ordertypes, sides, prices = _order_arrays(orders)
+    bar = timeframe_ns(timeframe)
+
+    fills = dict()
+    while True:
+        candle_ids, counts = np.unique(hits[hits != engine.NO_HIT], return_counts=True)
+        ambiguous = [
+            c for c, n in zip(candle_ids, counts)
+            if n > 1 and any(j not in fills for j in np.flatnonzero(hits == c))
+        ]
+        if not ambiguous:
+            return fills
+
+        c = ambiguous[0]
+        js = np.flatnonzero(hits == c)
+        start = int(candles.time[c])
+        try:
+            frame = ticks.get(
+                p.symbol.name, pd.Timestamp(start, tz="UTC"), pd.Timestamp(start + bar, tz="UTC")
+            )
+        except HistoryMissError as e:
+            log.error("%s", e)
+            frame = None
+        if frame is None or not len(frame):
+            fills.update((j, None) for j in js)
+            continue
+
+        tick_time = engine.to_ns(frame["time"])
+        bid = frame["bid"].to_numpy()
+        ask = frame["ask"].to_numpy()
+        tick_hits = engine.tick_hits(
+            tick_time,
+            engine.to_ticks(bid, tick_size),
+            engine.to_ticks(ask, tick_size),
+            np.maximum(times[js], start),
+            ordertypes[js],
+            sides[js],
+            prices[js],
+        )
+        for j, t in zip(js, tick_hits):
+            if t != engine.NO_HIT:
+                fills[j] = (tick_time[t], ask[t] if sides[j] == SIDE.BUY else bid[t])
+                continue
+            # the bars said so, but the ticks didn't trigger it
+            fills.pop(j, None)
+            hits[j] = engine.first_hits(
+                candles, [c + 1], ordertypes[j:j + 1], sides[j:j + 1], prices[j:j + 1]
+            )[0]
+
+
+def _apply_resolution(p: Position, orders: List[Order], entry_hit, hits, fills=None) -> bool:
+    """Sets the executions engine.resolve found (and _refine_with_ticks
+    settled). Returns False if the entry never got hit."""
+
+    if p.entry.execution is None:
+        if entry_hit == engine.NO_HIT:
+            return False
+        entry_candle = _candle(p.rates, entry_hit)
+        p.entry.set_execution(
+            entry_candle["time"],
+            Price(candle_mean(entry_candle), p.symbol.info.trade_tick_size),
+        )
+
+    p.sl_delta = abs(p.entry.execution.price - p.sl.price)
+    _execute_orders(orders, hits, p, fills)
+    return True
+
+
+def resolve_position(p: Position) -> bool:
+    """Resolves entry, sl, every tp and all of the updates of a position
+    in one go over p.rates. Returns False if the entry never got hit."""
+    orders, task = _resolution_task(p)
+    return _apply_resolution(p, orders, *engine.resolve(*task))
+
+
+def history_window(p: Position, eop, coarse_tf=None) -> tuple:
+    """(symbol, start, end) of the bars a position gets simulated on"""
+    # from the bar the signal was sent in, for market entries
+    start = p.time_ns - p.time_ns % MINUTE
+    if coarse_tf is not None:
+        start -= start % timeframe_ns(coarse_tf)
+    return (p.symbol.name, pd.Timestamp(start, tz="UTC"), eop)
+
 
 def get_pos_eop(time, end_of_period=0, end_of_day="18:30"):
     """Gets position end of period, where 0 means "same day" and 1, 2, 3
@@ -115,16 +381,23 @@ def get_pos_eop(time, end_of_period=0, end_of_day="18:30"):
     return day_end if end_of_period == 0 else weekly
 
 
-def make_positions(prep_data: List[dict]) -> list:
+def make_positions(
+    prep_data: List[dict], report: bool = True, last: Optional[Position] = None
+) -> list:
     """Gets positions data for all messages, including tp and sl updates
     from following ones and close signals as well. (Includes anything
-    the interpreter module is able to parse)"""
+    the interpreter module is able to parse). Updates before the first
+    new position go to last, if given (for callers making positions a
+    signal at a time). What got rejected or dropped on the way is logged
+    once at the end, unless report is False (for callers that report
+    once for all of them)"""
 
     positions = []
+    before = logs.counts()
 
     for data in prep_data:
         try:
-            p = positions[-1] if len(positions) > 0 else None
+            p = positions[-1] if len(positions) > 0 else last
             tick_size = p.symbol.info.trade_tick_size if p else None
             flag = data["interpretation"]["flag"]
 
@@ -165,128 +438,329 @@ def make_positions(prep_data: List[dict]) -> list:
                 p.add_order(MarketOrder(data["time"], SIDE(-p.side), name=LABEL.CLOSE))
 
         except (UnreasonableOrderPlacementError, PriceNotReasonableError) as e:
-            log.error(e)
+            logs.count("signals or updates rejected for unreasonable prices")
+            log.debug("rejected %r", e)
             continue
 
+    if report:
+        logs.report(log, logs.counts() - before)
     return positions
 
 
+def split_chains(prep_data: List[dict]) -> List[List[dict]]:
+    """Splits signals into one list per position: the position signal and
+    the updates that follow it (make_positions applies them to the last
+    position). Updates before the first position are dropped."""
+    chains = []
+    for data in prep_data:
+        if data["interpretation"]["flag"] == "POSITION":
+            chains.append([data])
+        elif chains:
+            chains[-1].append(data)
+    return chains
+
+
+def chain_key(chain: List[dict], **params) -> str:
+    """Hash of a position's signal, its updates and the run parameters"""
+    content = [(to_ns(d["time"]), d["interpretation"]) for d in chain]
+    return hashlib.sha256(
+        json.dumps([content, params], sort_keys=True, default=str).encode("utf8")
+    ).hexdigest()
+
+
 class Backtest:
-    def __init__(self, path: Optional[str] = None, verbose=False):
-
-        # SETS LOGGING LEVELS
-        modules = [
-            "hermes.core",
-            "backtesting.preprocessing",
-            "backtesting.classes.position",
-            "backtesting.classes.price",
-            __name__
-        ]
-        for mod in modules:
-            if verbose is None:
-                logging.getLogger(mod).setLevel(logging.CRITICAL)
-            elif verbose:
-                logging.getLogger(mod).setLevel(logging.DEBUG)
-            elif not verbose:
-                logging.getLogger(mod).setLevel(logging.INFO)
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        verbose=False,
+        history: Optional[HistoryStore] = None,
+        workers: Optional[int] = None,
+        instrument: Optional[Instrument] = None,
+    ):
 
-        if path:
-            self.trades = self.prepare(path)
-        else:
-            self.trades = []
+        # verbose is only kept for the callers that still pass it: levels
+        # and handlers are up to the application, see logs.configure_logging
 
+        # bars are read from the local store, the terminal is only asked for
+        # what isn't in there yet
+        self.history = history if history is not None else HistoryStore()
 
-    def prepare(self, path: str) -> list:
-        relevant_signals = preprocessing.preprocess(path)
-        return make_positions(relevant_signals)
+        # stages and counters of every run go to it, see instrument.py
+        self.instrument = instrument if instrument is not None else NULL
 
-    def run(self, matrix_tf=mt5.TIMEFRAME.M1):
+        if path:
+            self.trades = self.prepare(path, workers=workers)
+        else:
+            self.trades = []
+        # positions that got an entry, after a run
+        self.run_results = []
+
+
+    def prepare(
+        self,
+        path: str,
+        workers: Optional[int] = None,
+        cache: Optional[preprocessing.InterpretationCache] = None,
+    ) -> list:
+        with self.instrument.stage("preprocess"):
+            relevant_signals = preprocessing.preprocess(
+                path, workers=workers, cache=cache, instrument=self.instrument
+            )
+        with self.instrument.stage("make_positions"):
+            return make_positions(relevant_signals)
+
+    def run(
+        self,
+        matrix_tf="M1",
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        end_of_period: int = 0,
+        end_of_day: str = "18:30",
+        ticks: Optional[TickStore] = None,
+        coarse_tf=None,
+    ):
+        """With ticks, candles where more than one order got hit get
+        settled tick by tick instead of by the order of the bars. With
+        coarse_tf (e.g. H1), matrix_tf bars only get loaded inside the
+        coarse bars that can matter, see drill_down. The two can't be used
+        together: an order the ticks didn't trigger gets searched for
+        again on bars drill_down never loaded. Timeframes are names
+        ("M1", "H1") or members of betterMT5's TIMEFRAME."""
+
+        if ticks is not None and coarse_tf is not None:
+            raise ValueError("ticks and coarse_tf can't be used together")
+
+        # get test end of period
+        eops = [get_pos_eop(p.time, end_of_period, end_of_day) for p in self.trades]
+        self._simulate(eops, matrix_tf, workers, executor, ticks, coarse_tf)
+        return self.make_results(self.run_results)
 
+    def _simulate(
+        self,
+        eops: list,
+        matrix_tf="M1",
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        ticks: Optional[TickStore] = None,
+        coarse_tf=None,
+    ):
+        """Simulates every trade up to its end of period (eops[i] is the
+        one of self.trades[i]) and keeps the ones that got an entry in
+        self.run_results. Returns the indices of the trades that failed
+        (no history, unreasonable orders), which another run might not."""
+
+        with self.instrument.stage("simulate", positions=len(self.trades)):
+            return self._simulate_trades(eops, matrix_tf, workers, executor, ticks, coarse_tf)
+
+    def _simulate_trades(self, eops, matrix_tf, workers, executor, ticks, coarse_tf):
+        ins = self.instrument
+        debug = log.isEnabledFor(logging.DEBUG)
         trades = self.trades[:]
-        for i, p in enumerate(trades):
-
-            # get test end of period
-            eop = get_pos_eop(p.time)
+        # what happened to the positions that didn't get simulated,
+        # summed up at the end instead of a line each
+        skipped = Counter()
+        failed = Counter()
+        failed_trades = set()
+        first_error = None
+        counted = logs.counts()
+        history_hits, history_misses = self.history.hits, self.history.misses
+
+        # plans every history request first, so that overlapping
+        # windows on the same symbol get fetched only once
+        windows = dict()
+        for i, (p, eop) in enumerate(zip(trades, eops)):
 
             # signal was too late, skip it
             if p.time >= eop:
-                log.info(f"signal {i} was too late, skip it")
+                skipped["were too late"] += 1
+                if debug:
+                    log.debug("signal %d was too late, skip it", i)
                 continue
 
             if p.sl is None:
-                log.warning(f"signal {i} sl is None")
+                skipped["had no sl"] += 1
+                if debug:
+                    log.debug("signal %d sl is None", i)
                 continue
 
-            # 1. get matrix_tf rates from starting time to eop
-            # 2. check for entry hit
-            # 3. save matrix_tf R data
-            # 4. if no entry, continue
-            # 5. check for all other orders hit
-            # 6. save data
-
-            try:
-                p.rates = p.symbol.history(
-                    matrix_tf, datetime_from=p.time, datetime_to=eop, include_last=False
-                )["time open high low close".split(" ")]
-            except mt5.UnexpectedValueError as e:
-                if isinstance(e.diff, int) and e.diff <= 3:
-                    p.rates = e.rates
-                else:
-                    log.error(e)
-                    continue
-
-            tick_size = p.symbol.info.trade_tick_size
+            windows[i] = history_window(p, eop, coarse_tf)
 
-            if p.entry.execution is None:
-                entry_candle = find_hit(order=p.entry, position=p)
-                if entry_candle is None:
-                    log.info(f"No entry on position {i}")
+        # simulation can be spread over worker processes, history I/O
+        # stays on the prefetcher thread
+        if executor is None and workers is not None and workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            pool = nullcontext(executor)
+
+        prefetch_tf = matrix_tf if coarse_tf is None else coarse_tf
+        bars = 0
+        with pool as executor, Prefetcher(self.history, prefetch_tf, ins) as prefetcher:
+            prefetcher.plan(windows)
+
+            resolutions = dict()
+            chunk = list()
+
+            def submit():
+                future = executor.submit(_resolve_many, [task for _, task in chunk])
+                for k, (j, _) in enumerate(chunk):
+                    resolutions[j] = (resolutions[j][0], _Pending(future, k))
+                chunk.clear()
+
+            for i in windows:
+                p = trades[i]
+
+                # 1. get matrix_tf rates from starting time to eop
+                # 2. check for entry hit
+                # 3. save matrix_tf R data
+                # 4. if no entry, continue
+                # 5. check for all other orders hit
+                # 6. save data
+
+                try:
+                    with ins.stage("history", position=i):
+                        p.rates = prefetcher.rates(i)
+                    if coarse_tf is not None:
+                        with ins.stage("drill_down", position=i):
+                            p.rates = drill_down(p, p.rates, eops[i], self.history, matrix_tf, coarse_tf)
+                except (HistoryMissError, UnreasonableOrderPlacementError, PriceNotReasonableError) as e:
+                    failed[type(e).__name__] += 1
+                    failed_trades.add(i)
+                    first_error = first_error or (i, e)
+                    if debug:
+                        log.debug("position %d failed: %r", i, e)
                     continue
-                p.entry.set_execution(
-                    entry_candle["time"],
-                    Price(candle_mean(entry_candle), tick_size),
-                )
-
-            p.sl_delta = abs(p.entry.execution.price - p.sl.price)
-
-            for o in p.get_orders():
-                # adjust order time (they must be after entry)
-                if o.time < p.entry.execution.time:
-                    o.time = p.entry.execution.time
-                o_candle = find_hit(order=o, position=p)
-                if o_candle is None:
+                bars += len(p.rates)
+
+                if p.entry.ordertype == ORDERTYPE.MARKET and p.entry.execution is None:
+                    try:
+                        if not fill_market_entry(p):
+                            skipped["had no entry"] += 1
+                            if debug:
+                                log.debug("No entry on position %d", i)
+                            continue
+                    except (UnreasonableOrderPlacementError, PriceNotReasonableError) as e:
+                        failed[type(e).__name__] += 1
+                        failed_trades.add(i)
+                        first_error = first_error or (i, e)
+                        if debug:
+                            log.debug("position %d failed: %r", i, e)
+                        continue
+
+                orders, task = _resolution_task(p)
+                ins.count("orders resolved", len(orders))
+                if executor is None:
+                    with ins.stage("resolve", position=i):
+                        resolutions[i] = (orders, engine.resolve(*task))
+                else:
+                    resolutions[i] = (orders, None)
+                    chunk.append((i, task))
+                    if len(chunk) == RESOLVE_CHUNK:
+                        submit()
+            if chunk:
+                submit()
+
+            # executions are applied in order, whichever worker finishes first
+            run_results = list()
+            for i, (orders, resolution) in resolutions.items():
+                if isinstance(resolution, _Pending):
+                    with ins.stage("resolve", position=i):
+                        resolution = resolution.result()
+                entry_hit, hits = resolution
+                fills = None
+                if ticks is not None and hits is not None:
+                    with ins.stage("ticks", position=i):
+                        fills = _refine_with_ticks(trades[i], orders, hits, ticks, matrix_tf)
+                with ins.stage("apply", position=i):
+                    entered = _apply_resolution(trades[i], orders, entry_hit, hits, fills)
+                if not entered:
+                    skipped["had no entry"] += 1
+                    if debug:
+                        log.debug("No entry on position %d", i)
                     continue
-                o.set_execution(
-                    o_candle["time"],
-                    Price(candle_mean(o_candle), tick_size)
-                    if o.ordertype == ORDERTYPE.MARKET
-                    else o.price,
-                )
-
-        self.run_results = [tr for tr in trades if tr.entry.execution]
-        return self.make_results(self.run_results)
+                run_results.append(trades[i])
+
+        self.prefetch_stats = prefetcher.stats
+        ins.count("positions", len(trades))
+        ins.count("positions simulated", len(run_results))
+        ins.count("bars scanned", bars)
+        ins.count("history windows", prefetcher.stats.windows)
+        ins.count("history fetches", prefetcher.stats.fetches)
+        ins.count("history store hits", self.history.hits - history_hits)
+        ins.count("history store misses", self.history.misses - history_misses)
+        log.info(
+            "fetched history %d times for %d positions (%d saved), simulated on %d bars",
+            prefetcher.stats.fetches,
+            prefetcher.stats.windows,
+            prefetcher.stats.saved,
+            bars,
+        )
+        log.info(
+            "%d positions, %d simulated%s",
+            len(trades),
+            len(run_results),
+            "".join(f", {n} {reason}" for reason, n in skipped.items()),
+        )
+        if failed:
+            log.error(
+                "%d positions failed (%s), the first one (%d) with %s",
+                sum(failed.values()),
+                ", ".join(f"{n} {name}" for name, n in failed.items()),
+                *first_error,
+            )
+        # e.g. updates dropped once market entries got their price
+        counted = logs.counts() - counted
+        for what, n in counted.items():
+            ins.count(what, n)
+        logs.report(log, counted)
+
+        # only the simulated positions have results
+        self.run_results = run_results
+        return failed_trades
+
+    def columns(self) -> ColumnarRun:
+        """self.run_results as columns, built once per run"""
+        if getattr(self, "_columns", None) is None or self._columns[0] is not self.run_results:
+            with self.instrument.stage("columns"):
+                self._columns = (self.run_results, ColumnarRun(self.run_results))
+        return self._columns[1]
 
     @staticmethod
-    def _determine_position_result(p: Position, partials: List[float], ignore: List[str]):
+    def _position_events(p: Position, ignore: List[str]) -> list:
+        """(time (ns), label, R) of every execution, in execution order"""
         events = p.get_orders(by="execution")
-        events = [e for e in events if str(e.name.name) not in ignore]
-        
+        return [
+            (
+                e.execution.time,
+                e.name,
+                p.side * (e.execution.price - p.entry.execution.price) / p.sl_delta,
+            )
+            for e in events
+            if str(e.name.name) not in ignore
+        ]
+
+    @staticmethod
+    def _eop_event(p: Position, last_candle) -> tuple:
+        """(time (ns), R) of closing the position at the last candle"""
+        r = p.side * (candle_mean(last_candle) - p.entry.execution.price.value) / p.sl_delta
+        return (engine.to_ns(last_candle["time"]), r)
+
+    @staticmethod
+    def _result_from_events(events: list, eop: tuple, partials: List[float]):
         if len(events) == 0:
-            last_candle = p.rates.iloc[-1]
-            r = p.side * (candle_mean(last_candle) - p.entry.execution.price.value) / p.sl_delta
-            return (last_candle.time, r, 'EOP')
-        
+            return (eop[0], eop[1], 'EOP')
+
         result = 0
+        result_type = events[0][1].name
         for i, partial in enumerate(partials):
-            if i == 0:
-                result_type = events[i].name.name
-            if i == len(partials) - 1:
-                close = events[i].execution.time
+            if i == len(events):
+                # ran out of events, what's left gets closed at the end of period
+                result += eop[1] * sum(partials[i:])
+                return (eop[0], result, result_type)
+
+            close, name, r = events[i]
 
-            r = p.side * (events[i].execution.price - p.entry.execution.price) / p.sl_delta
-            
             # Closing events
-            if events[i].name in [LABEL.SL, LABEL.SL_TO_BE]:
+            if name in [LABEL.SL, LABEL.SL_TO_BE]:
                 # if it's the first event record the loss,
                 # otherwise i'm assuming the second losing 
                 # partial is always at breakeven
@@ -298,40 +772,206 @@ class Backtest:
 
         return (close, result, result_type)
 
+    @staticmethod
+    def _determine_position_result(p: Position, partials: List[float], ignore: List[str]):
+        events = Backtest._position_events(p, ignore)
+        eop = Backtest._eop_event(p, _candle(p.rates, -1))
+        return Backtest._result_from_events(events, eop, partials)
+
+    @staticmethod
+    def _result_row(p: Position, res: tuple) -> dict:
+        # same types as the columns of make_results
+        return dict(
+            open=to_timestamp(p.time_ns),
+            close=to_timestamp(res[0]),
+            symbol=p.symbol.name,
+            side=p.side.name,
+            sl_pips=p.sl_delta/p.symbol.info.trade_tick_size/10,
+            result=res[1],
+            type=res[2]
+            )
+
     def make_results(self, given=None, partials: List[float] = None, ignore: List[str] = None):
         '''Returns a dataframe containing data from the test run provided'''
-        if given is None:
-            given = self.run_results
-
-        if partials is None:
-            partials = [1]
-        
-        if ignore is None:
-            ignore = list()
+        if given is None or given is self.run_results:
+            run = self.columns()
+        elif len(given) and all(isinstance(p, columnar.PositionView) for p in given):
+            with self.instrument.stage("make_results"):
+                return columnar.view_results(given, partials, ignore)
+        else:
+            run = ColumnarRun(given)
+
+        with self.instrument.stage("make_results"):
+            return columnar.results(run, partials, ignore)
+
+    def portfolio(self, risk: float = 0.01, **kwargs) -> Portfolio:
+        """self.run_results traded on one account, see portfolio.Portfolio"""
+        return Portfolio(self.columns(), risk, **kwargs)
+
+    def refresh(
+        self,
+        path: str,
+        store: RunStore,
+        matrix_tf="M1",
+        workers: Optional[int] = None,
+        end_of_period: int = 0,
+        end_of_day: str = "18:30",
+        cache: Optional[preprocessing.InterpretationCache] = None,
+    ) -> pd.DataFrame:
+        '''Results for the whole export at path, reusing what store knows
+        from previous runs: only new or edited messages get interpreted,
+        and only positions whose signal or updates changed (or that weren't
+        finished, or failed) get rebuilt and simulated. self.trades and
+        self.run_results only hold the positions simulated this time.'''
+
+        prep = preprocessing.TelegramChatPreprocessor()
+        known = store.messages()
+
+        pieces = dict()
+        new = list()
+        for message in prep.iter_json(path):
+            key = preprocessing.text_key(message.text)
+            if message.id in known and known[message.id][0] == key:
+                pieces[message.id] = known[message.id][1]
+            else:
+                pieces[message.id] = None
+                new.append(message)
+
+        # the default cache is only open while interpreting
+        with nullcontext(cache) if cache is not None else preprocessing.InterpretationCache() as cache:
+            for piece in prep.iter_preprocess(new, workers, cache):
+                pieces[piece["message_id"]] = piece
+        store.put_messages(
+            (m.id, preprocessing.text_key(m.text), pieces[m.id]) for m in new
+        )
+        log.info("%d new messages, %d already known", len(new), len(pieces) - len(new))
+
+        signals = [
+            p for p in pieces.values() if p is not None and "flag" in p["interpretation"]
+        ]
+        chains = split_chains(signals)
+        params = dict(
+            matrix_tf=getattr(matrix_tf, "name", str(matrix_tf)),
+            end_of_period=end_of_period,
+            end_of_day=end_of_day,
+        )
+        keys = [chain_key(chain, **params) for chain in chains]
+
+        cached = store.positions()
+        rows = {key: cached[key] for key in keys if key in cached}
+
+        # rebuilds and simulates only what isn't cached
+        self.trades = list()
+        trade_keys = dict()
+        counted = logs.counts()
+        for key, chain in zip(keys, chains):
+            if key in rows:
+                continue
+            for p in make_positions(chain, report=False):
+                trade_keys[id(p)] = key
+                self.trades.append(p)
+                rows[key] = list()
+        logs.report(log, logs.counts() - counted)
+
+        eops = [get_pos_eop(p.time, end_of_period, end_of_day) for p in self.trades]
+        failed = self._simulate(eops, matrix_tf, workers)
+        for p, row in zip(self.run_results, self.make_results().to_dict("records")):
+            rows[trade_keys[id(p)]] = [row]
+        log.info("%d positions simulated, %d reused", len(self.trades), len(keys) - len(self.trades))
+
+        # the last position might still get updates, positions whose
+        # period isn't over yet might still get bars, and the ones that
+        # failed (terminal down, history missing) get another go
+        now = arrow.utcnow()
+        done = {
+            trade_keys[id(p)]: rows[trade_keys[id(p)]]
+            for i, (p, eop) in enumerate(zip(self.trades, eops))
+            if eop <= now and trade_keys[id(p)] != keys[-1] and i not in failed
+        }
+        store.put_positions(done)
+        store.keep_positions(keys)
+
+        return pd.DataFrame([row for key in keys for row in rows.get(key, [])])
+
+    def sweep(
+        self,
+        partials: List[List[float]] = None,
+        ignore: List[List[str]] = None,
+        end_of_period: List[int] = None,
+        end_of_day: List[str] = None,
+        matrix_tf="M1",
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ) -> pd.DataFrame:
+        '''Results for every combination of the given partials, ignore,
+        end_of_period and end_of_day values, in one long dataframe.
+
+        Every trade is simulated once, up to the latest of its ends of
+        period; an execution only counts for a grid point if it happened
+        before that grid point's end of period, which is exactly what a
+        separate run() with it would have found.'''
+
+        grid = list(
+            itertools.product(
+                [tuple(x) for x in partials or [[1]]],
+                [tuple(x) for x in ignore or [[]]],
+                end_of_period or [0],
+                end_of_day or ["18:30"],
+            )
+        )
+        periods = sorted({(eop, eod) for _, _, eop, eod in grid})
+
+        # eops[i][k] is the end of period of trade i for periods[k]
+        eops = [[get_pos_eop(p.time, *period) for period in periods] for p in self.trades]
+        self._simulate([max(e) for e in eops], matrix_tf, workers, executor)
 
         results = list()
-        for p in given:
-            res = Backtest._determine_position_result(p, partials=partials, ignore=ignore)
-            results.append(
-                dict(
-                    open=p.time,
-                    close=res[0],
-                    symbol=p.symbol.name,
-                    side=p.side.name,
-                    sl_pips=p.sl_delta/p.symbol.info.trade_tick_size/10,
-                    result=res[1],
-                    type=res[2]
+        simulated = {id(p) for p in self.run_results}
+        for i, p in enumerate(self.trades):
+            if id(p) not in simulated:
+                continue
+
+            # R of every event is computed once and reused by the whole grid
+            events = {x: Backtest._position_events(p, x) for x in {g[1] for g in grid}}
+            event_times = {x: [e[0] for e in ev] for x, ev in events.items()}
+            rate_times = engine.to_ns(p.rates["time"])
+            entry_time = p.entry.execution.time
+
+            for k, period in enumerate(periods):
+                eop = engine.to_ns(eops[i][k])
+                last = int(np.searchsorted(rate_times, eop, side="left")) - 1
+                if p.time >= eops[i][k] or entry_time >= eop or last < 0:
+                    continue
+                eop_event = Backtest._eop_event(p, _candle(p.rates, last))
+
+                for g_partials, g_ignore, g_eop, g_eod in grid:
+                    if (g_eop, g_eod) != period:
+                        continue
+                    n = int(np.searchsorted(event_times[g_ignore], eop, side="left"))
+                    res = Backtest._result_from_events(
+                        events[g_ignore][:n], eop_event, g_partials
+                    )
+                    results.append(
+                        dict(
+                            partials=g_partials,
+                            ignore=g_ignore,
+                            end_of_period=g_eop,
+                            end_of_day=g_eod,
+                            **Backtest._result_row(p, res),
+                        )
                     )
-                )
 
         return pd.DataFrame(results)
 
 
 def main():
+    import betterMT5 as mt5
+
+    configure_logging()
     with mt5.connected():
         test = Backtest("../chats/results_daniel.json", verbose=None)
         res = test.run()
-        console.print(res)
+        print(res)
 
 
 if __name__ == "__main__":
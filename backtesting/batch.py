@@ -0,0 +1,252 @@
+"""Backtests of many channels at once, on one shared history store.
+
+Every export is prepared first, then the history windows of all of
+their positions are merged per symbol and fetched once, so channels
+trading the same EURUSD hours don't each go to the terminal for them.
+Channels then run one after the other on the warm store, with their hit
+searches going to one process pool (workers > 1) shared by all of them.
+Results come out as one table, with a channel column.
+
+Channels aren't scheduled over the pool themselves: the store isn't
+thread-safe, and once it's warm what's left of a channel besides its
+hit searches is Python work on the GIL, which threads wouldn't overlap.
+The pool gets the part that takes the time (positions go to it in
+chunks), whichever channel they're from.
+
+    batch = Batch({"daniel": "results_daniel.json", "mark": "mark.json"})
+    results = batch.run()
+    batch.timings()
+    batch.portfolio(risk=0.01).stats()
+
+or from the command line:
+
+    python -m backtesting.batch chats/*.json --workers 4 --out results.csv
+"""
+
+import argparse
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Union
+import pandas as pd
+from . import preprocessing, symbols
+from .backtesting import Backtest, get_pos_eop, history_window
+from .times import to_ns
+from .history import HistoryMissError, HistoryStore, PrefetchStats, merge_windows
+from .instrument import Instrument, NULL
+from .logs import configure_logging
+from .portfolio import Portfolio
+
+log = logging.getLogger(__name__)
+
+
+def channel_names(paths: List[str]) -> Dict[str, str]:
+    """{channel: path}, channels named after the files (without the
+    extension), or after the whole path when two files share a name"""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(set(stems)) < len(stems):
+        return {path: path for path in paths}
+    return dict(zip(stems, paths))
+
+
+class Batch:
+    """exports is {channel: path}, or a list of paths (see channel_names).
+    workers goes to hermes when preparing, and sizes the pool the hit
+    searches of every channel share; verbose works like in Backtest."""
+
+    def __init__(
+        self,
+        exports: Union[Dict[str, str], List[str]],
+        history: Optional[HistoryStore] = None,
+        workers: Optional[int] = None,
+        cache: Optional[preprocessing.InterpretationCache] = None,
+        verbose=False,
+        instrument: Instrument = NULL,
+    ):
+        self.exports = exports if isinstance(exports, dict) else channel_names(exports)
+        self.history = history if history is not None else HistoryStore()
+        self.workers = workers
+        self.cache = cache
+        self.verbose = verbose
+        self.instrument = instrument
+
+        # {channel: Backtest} of the channels that got prepared
+        self.backtests = dict()
+        # {channel: exception} of the ones that couldn't be
+        self.failed = dict()
+        self._timings = defaultdict(dict)
+        self.prefetch_stats = PrefetchStats()
+        self.results = None
+
+    def prepare(self):
+        """Interprets every export. One that can't be read is left out of
+        the batch (with an error in the log), the others go on."""
+        # the default cache is only open while preparing
+        with nullcontext(self.cache) if self.cache is not None else preprocessing.InterpretationCache() as cache:
+            for k, (channel, path) in enumerate(self.exports.items(), 1):
+                self._prepare(k, channel, path, cache)
+
+    def _prepare(self, k: int, channel: str, path: str, cache: preprocessing.InterpretationCache):
+        b = Backtest(verbose=self.verbose, history=self.history, instrument=self.instrument)
+        start = time.perf_counter()
+        try:
+            with self.instrument.stage("prepare", channel=channel):
+                b.trades = b.prepare(path, workers=self.workers, cache=cache)
+        except Exception as e:
+            self.failed[channel] = e
+            log.error("[%d/%d] %s: couldn't prepare %s: %r", k, len(self.exports), channel, path, e)
+            return
+        self.backtests[channel] = b
+        self._timings[channel].update(prepare=time.perf_counter() - start, positions=len(b.trades))
+        log.info("[%d/%d] %s: %d positions", k, len(self.exports), channel, len(b.trades))
+
+    def warm(self, matrix_tf="M1", end_of_period: int = 0, end_of_day: str = "18:30", coarse_tf=None):
+        """Gets the bars of every channel into the store, each merged
+        window of a symbol once whichever channels it came from"""
+
+        by_symbol = defaultdict(list)
+        windows = 0
+        for b in self.backtests.values():
+            for p in b.trades:
+                eop = get_pos_eop(p.time, end_of_period, end_of_day)
+                if p.time >= eop or p.sl is None:
+                    continue
+                symbol, start, end = history_window(p, eop, coarse_tf)
+                by_symbol[symbol].append((to_ns(start), to_ns(end)))
+                windows += 1
+
+        fetches = sorted(
+            (start, end, symbol)
+            for symbol, items in by_symbol.items()
+            for start, end in merge_windows(items)
+        )
+        timeframe = matrix_tf if coarse_tf is None else coarse_tf
+        missed = 0
+        with self.instrument.stage("warm", fetches=len(fetches)):
+            for start, end, symbol in fetches:
+                try:
+                    with self.instrument.stage("fetch", symbol=symbol):
+                        self.history.get(
+                            symbol, timeframe, pd.Timestamp(start, tz="UTC"), pd.Timestamp(end, tz="UTC")
+                        )
+                except HistoryMissError as e:
+                    # the channels that need it report it when they run
+                    missed += 1
+                    log.debug("%r", e)
+
+        self.prefetch_stats = PrefetchStats(windows, len(fetches))
+        log.info(
+            "fetched history %d times for %d positions of %d channels (%d saved)",
+            len(fetches),
+            windows,
+            len(self.backtests),
+            self.prefetch_stats.saved,
+        )
+        if missed:
+            log.warning("%d of %d history windows couldn't be fetched", missed, len(fetches))
+
+    def run(
+        self,
+        matrix_tf="M1",
+        end_of_period: int = 0,
+        end_of_day: str = "18:30",
+        ticks=None,
+        coarse_tf=None,
+    ) -> pd.DataFrame:
+        """Results of every channel (see Backtest.run for the settings),
+        in one dataframe with the channel in the first column. Channels
+        run one at a time, their hit searches on the shared pool."""
+
+        if ticks is not None and coarse_tf is not None:
+            raise ValueError("ticks and coarse_tf can't be used together")
+        if not self.backtests and not self.failed:
+            self.prepare()
+        self.warm(matrix_tf, end_of_period, end_of_day, coarse_tf)
+
+        if self.workers is not None and self.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            pool = nullcontext()
+
+        frames = []
+        with pool as executor:
+            for k, (channel, b) in enumerate(self.backtests.items(), 1):
+                start = time.perf_counter()
+                with self.instrument.stage("channel", channel=channel):
+                    results = b.run(
+                        matrix_tf,
+                        executor=executor,
+                        end_of_period=end_of_period,
+                        end_of_day=end_of_day,
+                        ticks=ticks,
+                        coarse_tf=coarse_tf,
+                    )
+                seconds = time.perf_counter() - start
+                self._timings[channel].update(run=seconds, simulated=len(b.run_results))
+                log.info(
+                    "[%d/%d] %s: %d of %d positions simulated in %.2fs",
+                    k,
+                    len(self.backtests),
+                    channel,
+                    len(b.run_results),
+                    len(b.trades),
+                    seconds,
+                )
+                results.insert(0, "channel", channel)
+                frames.append(results)
+
+        self.results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return self.results
+
+    def timings(self) -> pd.DataFrame:
+        """Positions, simulated positions and seconds spent preparing and
+        running, per channel"""
+        return pd.DataFrame.from_dict(self._timings, orient="index").rename_axis("channel")
+
+    def portfolio(self, risk: float = 0.01, **kwargs) -> Portfolio:
+        """Every channel traded on one account, see portfolio.Portfolio"""
+        return Portfolio({channel: b.columns() for channel, b in self.backtests.items()}, risk, **kwargs)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backtests many channel exports on one history store.")
+    parser.add_argument("exports", nargs="+", help="telegram exports, one per channel")
+    parser.add_argument("--out", help="where to write the combined results (csv)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--matrix-tf", default="M1")
+    parser.add_argument("--end-of-period", type=int, default=0)
+    parser.add_argument("--end-of-day", default="18:30")
+    parser.add_argument("--history", default=None, help="root of the history store")
+    parser.add_argument("--offline", action="store_true", help="only use the bars and symbols already stored")
+    parser.add_argument("--risk", type=float, default=0.01, help="risk per position of the combined portfolio")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    configure_logging(logging.DEBUG if args.verbose else logging.INFO)
+    root = dict() if args.history is None else dict(root=args.history)
+    history = HistoryStore(**root, offline=args.offline)
+    batch = Batch(args.exports, history=history, workers=args.workers, verbose=args.verbose)
+    if args.offline:
+        # specs of symbols have to be stored too, see symbols.py
+        symbols.set_registry(symbols.SymbolRegistry(offline=True))
+        connection = nullcontext()
+    else:
+        import betterMT5 as mt5
+
+        connection = mt5.connected()
+    with connection:
+        results = batch.run(args.matrix_tf, args.end_of_period, args.end_of_day)
+
+    print(batch.timings())
+    if len(results):
+        print(pd.Series(batch.portfolio(args.risk).stats()))
+    if args.out:
+        results.to_csv(args.out, index=False)
+    return 1 if batch.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,12 +2,11 @@ from .constants import SIDE, ORDERTYPE, LABEL
 from typing import Union, Optional
 from .price import Price
 from dataclasses import dataclass, field
+from ..times import to_ns, isoformat
 import arrow
 import logging
 
-logging.basicConfig()
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
 
 
 class ExecutionAlreadySetError(AttributeError):
@@ -16,9 +15,15 @@ class ExecutionAlreadySetError(AttributeError):
 
 @dataclass
 class Execution:
-    time: arrow.Arrow
+    time: int  # UTC epoch ns
     price: Price
 
+    def __post_init__(self):
+        self.time = to_ns(self.time)
+
+    def __repr__(self):
+        return f"Execution(time={isoformat(self.time)}, price={self.price!r})"
+
     def __lt__(self, other: 'Execution'):
         if not isinstance(other, Execution):
             log.warning(' < operation is only supported with another Execution instance')
@@ -27,7 +32,10 @@ class Execution:
 
 @dataclass
 class Order:
-    time: Union[arrow.Arrow, 'datetimelike']
+    """Times (of the order and of its execution) are UTC epoch ns,
+    anything datetimelike given gets converted"""
+
+    time: Union[int, 'datetimelike']
     side: SIDE
     ordertype: ORDERTYPE
     price: Union[None, Price] = None
@@ -35,13 +43,19 @@ class Order:
     execution: Union[None, Execution] = None
 
     def __post_init__(self):
-        if not isinstance(self.time, arrow.Arrow):
-            self.time = arrow.get(self.time)
+        self.time = to_ns(self.time)
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}(time={isoformat(self.time)}, side={self.side!r}, "
+            f"ordertype={self.ordertype!r}, price={self.price!r}, name={self.name!r}, "
+            f"execution={self.execution!r})"
+        )
 
     def set_execution(self, time: 'datetimelike', price: Price):
         if self.execution is not None:
             raise ExecutionAlreadySetError(self)
-        self.execution = Execution(arrow.get(time), price)
+        self.execution = Execution(time, price)
 
     def __eq__(self, other: 'Order'):
         '''This allows to check for order already there in Position.get_orders()'''
@@ -54,27 +68,27 @@ class Order:
 
 
 class MarketOrder(Order):
-    def __init__(self, time: arrow.Arrow, side: SIDE, **kwargs):
+    def __init__(self, time: 'datetimelike', side: SIDE, **kwargs):
         super().__init__(time, side, ORDERTYPE.MARKET, **kwargs)
 
 
 class LimitOrder(Order):
-    def __init__(self, time: arrow.Arrow, side: SIDE, price: Price, **kwargs):
+    def __init__(self, time: 'datetimelike', side: SIDE, price: Price, **kwargs):
         super().__init__(time, side, ORDERTYPE.LIMIT, price=price, **kwargs)
 
 
 class StopOrder(Order):
-    def __init__(self, time: arrow.Arrow, side: SIDE, price: Price, **kwargs):
+    def __init__(self, time: 'datetimelike', side: SIDE, price: Price, **kwargs):
         super().__init__(time, side, ORDERTYPE.STOP, price=price, **kwargs)
 
 
 class SL(StopOrder):
-    def __init__(self, time: arrow.Arrow, side: SIDE, price: Price, **kwargs):
+    def __init__(self, time: 'datetimelike', side: SIDE, price: Price, **kwargs):
         super().__init__(time, side, price=price, name=LABEL.SL, **kwargs)
 
 
 class TP(LimitOrder):
-    def __init__(self, time: arrow.Arrow, side: SIDE, price: Price, **kwargs):
+    def __init__(self, time: 'datetimelike', side: SIDE, price: Price, **kwargs):
         super().__init__(time, side, price=price, name=LABEL.TP, **kwargs)
 
 
@@ -0,0 +1,84 @@
+from bisect import bisect_right
+from collections import Counter
+from typing import Iterator, List, Optional
+from .order import Order
+from .price import Price
+
+
+def order_key(order: Order) -> tuple:
+    """What Order.__eq__ compares, as something hashable"""
+    return (order.time, order.side, order.ordertype, order.price)
+
+
+class OrderBook:
+    """Orders of a position, kept sorted by time (and by execution time
+    once they get executed), with a hash index for duplicates and a
+    running sum of the prices for Position.is_price_reasonable.
+
+    Ties keep the order the orders were added in, like the stable sorts
+    Position.get_orders used to do. Executions have to be set through
+    set_execution for the book to see them."""
+
+    def __init__(self):
+        self._seq = 0
+        self._by_time = []  # (time, seq, order)
+        self._by_execution = []  # (execution time, seq, order)
+        self._seqs = dict()  # id(order): seq
+        self._index = Counter()
+        self.price_sum = 0.0
+        self.price_count = 0
+
+    def __len__(self):
+        return len(self._by_time)
+
+    def __iter__(self) -> Iterator[Order]:
+        return (o for _, _, o in self._by_time)
+
+    def __contains__(self, order: Order) -> bool:
+        return self._index[order_key(order)] > 0
+
+    def _insort(self, items: list, key: tuple, order: Order):
+        # seqs are unique, so orders themselves never get compared
+        items.insert(bisect_right(items, key), (*key, order))
+
+    def add(self, order: Order, seq: Optional[int] = None):
+        if seq is None:
+            seq = self._seq
+            self._seq += 1
+        self._seqs[id(order)] = seq
+        self._insort(self._by_time, (order.time, seq), order)
+        if order.execution is not None:
+            self._insort(self._by_execution, (order.execution.time, seq), order)
+        self._index[order_key(order)] += 1
+        if order.price is not None:
+            self.price_sum += order.price.value
+            self.price_count += 1
+
+    def remove(self, order: Order) -> int:
+        """Removes the order, returns its position in the insertion order"""
+        seq = self._seqs.pop(id(order))
+        self._by_time = [item for item in self._by_time if item[2] is not order]
+        self._by_execution = [item for item in self._by_execution if item[2] is not order]
+        self._index[order_key(order)] -= 1
+        if order.price is not None:
+            self.price_sum -= order.price.value
+            self.price_count -= 1
+        return seq
+
+    def set_price(self, order: Order, price: Price):
+        seq = self.remove(order)
+        order.price = price
+        self.add(order, seq)
+
+    def set_execution(self, order: Order, time: "datetimelike", price: Price):
+        order.set_execution(time, price)
+        self._insort(self._by_execution, (order.execution.time, self._seqs[id(order)]), order)
+
+    def by_insertion(self) -> List[Order]:
+        return sorted(self, key=lambda o: self._seqs[id(o)])
+
+    def by_time(self) -> List[Order]:
+        return [o for _, _, o in self._by_time]
+
+    def by_execution(self) -> List[Order]:
+        return [o for _, _, o in self._by_execution]
@@ -3,14 +3,14 @@ from .constants import SIDE, LABEL, ORDERTYPE
 from typing import Union, List
 import logging
 from .order import Order, MarketOrder, LimitOrder, SL, TP
-from .price import Price, Pips, candle_mean
+from .orderbook import OrderBook
+from .price import Price, Pips
+from .. import logs, symbols
+from ..times import DAY, to_ns
+from ..symbols import Symbol
 import arrow
-import betterMT5 as mt5
-from datetime import timedelta
 
-logging.basicConfig()
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
 
 
 class PriceNotReasonableError(ValueError):
@@ -26,7 +26,7 @@ class PositionInitMissingDataError(ValueError):
 @dataclass
 class Position:
     time: arrow.Arrow
-    symbol: Union[str, mt5.Symbol]
+    symbol: Union[str, Symbol]
     side: Union[str, SIDE]
     entry_price: Union[str, float, None]
     sl_price: Union[str, float]
@@ -36,11 +36,15 @@ class Position:
     def __post_init__(self):
 
         # needed for orders management
-        self.orders = list()
+        self.orders = OrderBook()
 
-        # enforces self.symbol type
+        # what orders are timed on, see times.py; self.time stays the
+        # time the channel sent the signal at, in its timezone
+        self.time_ns = to_ns(self.time)
+
+        # enforces self.symbol type, one Symbol per name for every position
         if isinstance(self.symbol, str):
-            self.symbol = mt5.Symbol(self.symbol)
+            self.symbol = symbols.get(self.symbol)
 
         # enforces self.side type
         if isinstance(self.side, str):
@@ -53,14 +57,17 @@ class Position:
         tick_size = self.symbol.info.trade_tick_size
 
         self.sl_price = Price(self.sl_price, tick_size)
-        self.sl = self.add_order(SL(self.time, SIDE(-self.side), self.sl_price))
+        self.sl = self.add_order(SL(self.time_ns, SIDE(-self.side), self.sl_price))
 
         enforced_tp_prices = list()
         self.tps = list()
         for tp in self.tp_prices:
             tp_price = Price(tp, tick_size)
             enforced_tp_prices.append(tp_price)
-            self.tps.append(self.add_order(TP(self.time, SIDE(-self.side), tp_price)))
+            tp_order = self.add_order(TP(self.time_ns, SIDE(-self.side), tp_price))
+            # the same tp twice is a duplicate, not a second tp
+            if tp_order is not None:
+                self.tps.append(tp_order)
         self.tp_prices = enforced_tp_prices
     
     @classmethod
@@ -87,32 +94,28 @@ class Position:
         """Adds entry order"""
 
         if price is None:
-
-            entry = MarketOrder(self.time, self.side, name=LABEL.ENTRY)
-
-            # this is so that we don't have to do too many shenanigans with sl_to_be
-            sh = self.symbol.history(mt5.TIMEFRAME.M1, datetime_from=self.time, count=1)
-
-            # sets execution so we don't have to look it up again later
-            tick_size = self.symbol.info.trade_tick_size
-            self.entry_price = Price(candle_mean(sh.iloc[0]), tick_size)
-            entry.price = self.entry_price
-            entry.set_execution(sh.loc[0, "time"], self.entry_price)
-            return entry
+            # gets its price (and execution) once the backtest has the
+            # rates, see fill_entry
+            return MarketOrder(self.time_ns, self.side, name=LABEL.ENTRY)
 
         self.entry_price = Price(price, self.symbol.info.trade_tick_size)
-        return LimitOrder(self.time, self.side, self.entry_price, name=LABEL.ENTRY)
+        return LimitOrder(self.time_ns, self.side, self.entry_price, name=LABEL.ENTRY)
 
     def is_price_reasonable(self, order: Order):
         """Checks that the order price is inside a 200 pips range from the
         mean of all of the other order prices."""
 
-        orders = [self.entry, *self.get_orders()]
-        all_prices = [o.price.value for o in orders if o.price is not None]
-        prices = [p for p in all_prices if p is not None]
-
-        if order.price is not None:
-            avg_p = sum(prices) / len(prices)
+        total, count = self.orders.price_sum, self.orders.price_count
+        if self.entry.price is not None:
+            total += self.entry.price.value
+            count += 1
+        return self._is_near(order, total, count)
+
+    def _is_near(self, order: Order, total: float, count: int):
+        """Whether the order price is within range of the mean of count
+        prices adding up to total"""
+        if order.price is not None and count:
+            avg_p = total / count
             pips_range = Pips(150, self.symbol.info.trade_tick_size)
             if not abs(order.price.value - avg_p) < pips_range.value:
                 return False
@@ -122,7 +125,8 @@ class Position:
     def is_placement_reasonable(self, order: Order):
         """Checks whether the placement of the order (SL and TP) makes sense
         compared to the entry (SL MUST be before entry in a long)"""
-        if order.price is None:
+        if order.price is None or self.entry.price is None:
+            # market entries get checked in fill_entry
             return True
         if self.side * (order.price - self.entry.price) < 0:
             if order.name == LABEL.TP:
@@ -132,34 +136,76 @@ class Position:
             return False
         return True
 
+    def fill_entry(self, time: "datetimelike", price: Price):
+        """Fills a market entry, gives its price to the sl to be orders
+        that were waiting for it and runs the checks that couldn't be
+        run without it, in the order the orders were added, each price
+        against the mean of the entry and the orders kept before it. An
+        unreasonable sl or tp from the signal itself raises
+        PriceNotReasonableError or UnreasonableOrderPlacementError, like
+        it would have when the position was made; unreasonable ones from
+        updates get dropped."""
+
+        self.entry_price = price
+        self.entry.price = price
+        self.entry.set_execution(time, price)
+
+        total, count = price.value, 1
+        for order in self.orders.by_time():
+            if order.name == LABEL.SL_TO_BE and order.price is None:
+                self.orders.set_price(order, price)
+            near = self._is_near(order, total, count)
+            if near and self.is_placement_reasonable(order):
+                if order.price is not None:
+                    total += order.price.value
+                    count += 1
+                continue
+            if order is self.sl or order in self.tps:
+                raise (UnreasonableOrderPlacementError if near else PriceNotReasonableError)(order)
+            if near:
+                logs.count("misplaced updates dropped")
+                log.debug("dropping misplaced order %s", order)
+            else:
+                logs.count("signals or updates rejected for unreasonable prices")
+                log.debug("dropping order with an unreasonable price %s", order)
+            self.orders.remove(order)
+
     def add_order(self, order: Order):
 
-        if order.time - self.time > timedelta(hours=24):
-            log.warning(f'order is over 24 hours after the position was opened')
-        if order in self.get_orders():
-            log.warning(f'duplicate order')
+        if order.time - self.time_ns > DAY:
+            logs.count("orders over 24 hours after their position")
+            log.debug('order is over 24 hours after the position was opened: %s', order)
+        if order in self.orders:
+            logs.count("duplicate orders dropped")
+            log.debug('duplicate order %s', order)
             return None
         if not self.is_price_reasonable(order):
             raise PriceNotReasonableError(order)
         if not self.is_placement_reasonable(order):
             raise UnreasonableOrderPlacementError(order)
-        self.orders.append(order)
+        self.orders.add(order)
         return order
 
     def get_orders(self, by="time"):
+        if by == "time":
+            return self.orders.by_time()
+        if by == "execution":
+            return self.orders.by_execution()
         present_orders = [o for o in self.orders if getattr(o, by, None) is not None]
         return sorted(present_orders, key=lambda x: getattr(x, by))
 
 
 def main():
+    import betterMT5 as mt5
+
     with mt5.connected():
         p1 = Position(
             arrow.get(2022, 2, 17), "EURUSD", "buys", None, 1.1355, [1.1380, 1.1390], "test"
         )
         print(f"{p1=}")
 
-        p1.tps[0].set_execution(arrow.get(2022,2,17,2), Price(1.1381, 0.00001))
-        p1.tps[1].set_execution(arrow.get(2022,2,17,1), Price(1.13905, 0.00001))
+        p1.orders.set_execution(p1.tps[0], arrow.get(2022,2,17,2), Price(1.1381, 0.00001))
+        p1.orders.set_execution(p1.tps[1], arrow.get(2022,2,17,1), Price(1.13905, 0.00001))
 
         print(f'\n{p1.get_orders("execution")=}')
 
@@ -1,12 +1,10 @@
-from dataclasses import dataclass
 from typing import Union
 from math import log10
 from pandas import Series
 import logging
+from .. import logs
 
-logging.basicConfig()
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
 
 
 def candle_mean(candle: Union[Series, dict]) -> float:
@@ -18,35 +16,93 @@ class PriceFormatError(ValueError):
     pass
 
 
+# candle means fall on half ticks, so prices are kept as integer
+# counts of tenths of a tick
+SUBTICKS = 10
+
+_scales = dict()
+
+
+def _scale(tick_size: float) -> tuple:
+    """Digits, and units per 1.0 of price, for a tick size"""
+    try:
+        return _scales[tick_size]
+    except KeyError:
+        _scales[tick_size] = (abs(int(log10(tick_size))), round(SUBTICKS / tick_size))
+        return _scales[tick_size]
+
+
 class Price:
+    __slots__ = ("tick_size", "digits", "_scale", "_units")
+
     def __init__(self, value: Union[str, float], tick_size: float):
         self.tick_size = tick_size
-        self.digits = abs(int(log10(self.tick_size)))
-        self.value = value
+        self.digits, self._scale = _scale(tick_size)
+        if isinstance(value, float):
+            self._units = round(value * self._scale)
+        else:
+            self.value = value
+
+    @classmethod
+    def from_units(cls, units: int, tick_size: float) -> 'Price':
+        """Builds a price straight from its internal integer representation"""
+        price = cls.__new__(cls)
+        price.tick_size = tick_size
+        price.digits, price._scale = _scale(tick_size)
+        price._units = units
+        return price
 
     def __repr__(self):
         return f"%.{self.digits}f" % self.value
 
+    def __eq__(self, other):
+        if not isinstance(other, Price):
+            return NotImplemented
+        return self.tick_size == other.tick_size and self._units == other._units
+
+    def __hash__(self):
+        return hash((self.tick_size, self._units))
+
+    def _result(self, units: int) -> float:
+        # exact, including the half ticks of candle means (which used to
+        # get rounded either way, depending on float error)
+        return units / self._scale
+
     def __add__(self, other: Union['Pips', 'Price']) -> float:
-        result = self._value + other.value
-        return float(f"%.{self.digits}f" % result)
+        if other.tick_size == self.tick_size:
+            return self._result(self._units + other._units)
+        return round(self.value + other.value, self.digits)
 
     def __sub__(self, other: Union['Pips', 'Price']) -> float:
-        result = self._value - other.value
-        return float(f"%.{self.digits}f" % result)
+        if other.tick_size == self.tick_size:
+            return self._result(self._units - other._units)
+        return round(self.value - other.value, self.digits)
+
+    @property
+    def ticks(self) -> int:
+        return round(self._units / SUBTICKS)
+
+    @property
+    def units(self) -> int:
+        """Integer representation, see from_units"""
+        return self._units
 
     @property
     def value(self) -> float:
-        return self._value
+        return self._units / self._scale
 
     @value.setter
     def value(self, num: Union[float, str]) -> None:
-        subbing = Price.sub_misspells(str(num))
-        inferring = self.infer_dot_position(subbing)
-        try:
-            self._value = float(inferring)
-        except ValueError:
-            raise PriceFormatError(num)
+        # numbers need no cleaning up, only text (and ints, which
+        # might be missing their dot) goes through parsing
+        if not isinstance(num, float):
+            subbing = Price.sub_misspells(str(num))
+            inferring = self.infer_dot_position(subbing)
+            try:
+                num = float(inferring)
+            except ValueError:
+                raise PriceFormatError(num)
+        self._units = round(num * self._scale)
 
     @staticmethod
     def sub_misspells(num: str) -> str:
@@ -63,31 +119,37 @@ class Price:
             # so we can take the 6 leftmost chars and
             # add the dot based on the known number of digits
             new_price = str(num)[: 6 - self.digits] + "." + str(num)[6 - self.digits :]
-            log.warning(
-                f"inferring dot position for {num} -> {new_price} ({self.tick_size})"
-            )
+            logs.count("prices with an inferred dot")
+            log.debug("inferring dot position for %s -> %s (%s)", num, new_price, self.tick_size)
             return new_price
         return str(num)
 
-@dataclass
+
 class Pips:
-    _value: int
-    tick_size: float
+    __slots__ = ("_value", "tick_size", "digits", "_scale", "_units")
 
-    def __post_init__(self):
-        self.value = self._value * self.tick_size * 10
-        self.digits = abs(int(log10(self.tick_size)))
+    def __init__(self, _value: int, tick_size: float):
+        self._value = _value
+        self.tick_size = tick_size
+        self.digits, self._scale = _scale(tick_size)
+        # a pip is 10 ticks
+        self._units = _value * 10 * SUBTICKS
+
+    @property
+    def value(self) -> float:
+        return self._units / self._scale
 
     def __repr__(self):
         return f"%.{self.digits}f" % self.value
 
-    def __add__(self, other: Union['Pips', Price]) -> float:
-        result = self.value + other.value
-        return float(f"%.{self.digits}f" % result)
+    def __eq__(self, other):
+        if not isinstance(other, Pips):
+            return NotImplemented
+        return (self._value, self.tick_size) == (other._value, other.tick_size)
 
-    def __sub__(self, other: Union['Pips', Price]) -> float:
-        result = self.value - other.value
-        return float(f"%.{self.digits}f" % result)
+    __add__ = Price.__add__
+    __sub__ = Price.__sub__
+    _result = Price._result
 
 def main():
     p1 = Price(10, 0.01)
@@ -0,0 +1,415 @@
+"""Struct-of-arrays representation of the positions of a run.
+
+Every order of every position (entries included) is a row of a handful
+of NumPy columns: times in UTC epoch ns, side, ordertype and label as
+small ints, prices in Price units. A row costs a few dozen bytes instead
+of an Order dataclass with its Price objects, and whole runs can be
+worked on with vectorized operations. PositionView and OrderView keep
+the Position/Order interface on top of it, building Arrow and Price
+objects only for the fields that get read."""
+
+from typing import List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+import arrow
+from .classes.constants import SIDE, ORDERTYPE, LABEL
+from .classes.order import Execution
+from .classes.position import Position
+from .classes.price import Price, SUBTICKS, candle_mean
+from .symbols import Symbol
+from .times import to_arrow, to_ns
+
+# missing times and prices
+NONE = np.iinfo(np.int64).min
+
+ORDER_COLUMNS = (
+    ("position", np.int32),
+    ("time", np.int64),
+    ("side", np.int8),
+    ("ordertype", np.int8),
+    ("label", np.int8),
+    ("price", np.int64),
+    ("exec_time", np.int64),
+    ("exec_price", np.int64),
+)
+
+
+def _times(times: list) -> np.ndarray:
+    """Order and execution times are ns already, missing ones are None"""
+    return np.array([NONE if t is None else t for t in times], dtype=np.int64)
+
+
+def _last_candle(rates: Optional[pd.DataFrame]) -> tuple:
+    """Time and mean of the last candle, without building a row of it"""
+    if rates is None or not len(rates):
+        return NONE, np.nan
+    candle = {col: rates[col].iat[-1] for col in ("high", "low")}
+    return to_ns(rates["time"].iat[-1]), candle_mean(candle)
+
+
+class ColumnarRun:
+    """Positions and orders of a run as columns. Orders of position j are
+    the rows first[j]:first[j + 1], entry first and the others in the
+    order they were added to the position."""
+
+    def __init__(self, positions: List[Position]):
+        by_name = {p.symbol.name: p.symbol for p in positions}
+        self.symbols = sorted(by_name)
+        # the Symbol objects of the positions, for the views
+        self._symbol_objects = [by_name[name] for name in self.symbols]
+        symbol_index = {name: k for k, name in enumerate(self.symbols)}
+
+        rows = []
+        first = [0]
+        sl = []
+        for p in positions:
+            rows.append(p.entry)
+            orders = p.orders.by_insertion()
+            rank = {id(o): k for k, o in enumerate(orders)}
+            if id(p.sl) not in rank:
+                raise ValueError(f"{p.sl=} is not one of the position orders")
+            sl.append(len(rows) + rank[id(p.sl)])
+            rows.extend(orders)
+            first.append(len(rows))
+
+        self.first = np.array(first, dtype=np.int64)
+        self.time = _times([p.time_ns for p in positions])
+        self.side = np.array([p.side for p in positions], dtype=np.int8)
+        self.symbol = np.array([symbol_index[p.symbol.name] for p in positions], dtype=np.int16)
+        self.tick_size = np.array(
+            [p.symbol.info.trade_tick_size for p in positions], dtype=np.float64
+        )
+        # Price.value is units / scale
+        self.scale = np.rint(SUBTICKS / self.tick_size)
+        self.sl_delta = np.array(
+            [getattr(p, "sl_delta", np.nan) for p in positions], dtype=np.float64
+        )
+
+        # the last candle the position was simulated on, for closing
+        # it at the end of period
+        last = [_last_candle(getattr(p, "rates", None)) for p in positions]
+        self.eop_time = np.array([c[0] for c in last], dtype=np.int64)
+        self.eop_price = np.array([c[1] for c in last], dtype=np.float64)
+        self.sl = np.array(sl, dtype=np.int64)
+
+        counts = np.diff(self.first)
+        executions = [o.execution for o in rows]
+        self.orders = {
+            "position": np.repeat(np.arange(len(positions)), counts),
+            "time": _times([o.time for o in rows]),
+            "side": [o.side for o in rows],
+            "ordertype": [o.ordertype for o in rows],
+            "label": [0 if o.name is None else o.name for o in rows],
+            "price": [NONE if o.price is None else o.price.units for o in rows],
+            "exec_time": _times([None if e is None else e.time for e in executions]),
+            "exec_price": [NONE if e is None else e.price.units for e in executions],
+        }
+        for name, dtype in ORDER_COLUMNS:
+            self.orders[name] = np.asarray(self.orders[name], dtype=dtype)
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, j: int) -> "PositionView":
+        return PositionView(self, j)
+
+    def __iter__(self):
+        return (PositionView(self, j) for j in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.orders.values()) + sum(
+            a.nbytes
+            for a in (
+                self.first, self.time, self.side, self.symbol, self.tick_size,
+                self.scale, self.sl, self.sl_delta, self.eop_time, self.eop_price,
+            )
+        )
+
+    def entry_values(self) -> np.ndarray:
+        """Entry fill price of every position (NaN if not filled)"""
+        units = self.orders["exec_price"][self.first[:-1]]
+        return np.where(units == NONE, np.nan, units / self.scale)
+
+    def r_multiples(self) -> np.ndarray:
+        """R of every order execution (NaN for orders that didn't get
+        executed, and for the entries themselves)"""
+
+        o = self.orders
+        entries = self.first[:-1]
+        position = o["position"]
+        entry_price = o["exec_price"][entries][position]
+
+        r = np.full(len(o["time"]), np.nan)
+        keep = (o["exec_price"] != NONE) & (entry_price != NONE)
+        keep[entries] = False
+        position = position[keep]
+        # same operations as Position, Price - Price is a float already
+        r[keep] = (
+            self.side[position]
+            * ((o["exec_price"][keep] - entry_price[keep]) / self.scale[position])
+            / self.sl_delta[position]
+        )
+        return r
+
+    def eop_r_multiples(self) -> np.ndarray:
+        """R of closing every position at its last candle"""
+        return self.side * (self.eop_price - self.entry_values()) / self.sl_delta
+
+    def execution_order(self) -> np.ndarray:
+        """Rows of the executed orders (entries excluded), by position and
+        execution time; ties keep the order the orders were added in"""
+
+        o = self.orders
+        rows = np.flatnonzero(o["exec_time"] != NONE)
+        rows = rows[o["label"][rows] != LABEL.ENTRY]
+        return rows[np.lexsort((rows, o["exec_time"][rows], o["position"][rows]))]
+
+
+class Closes(NamedTuple):
+    """How the executions of a run close its positions, see results.
+    Rows of the counted executions are grouped by position, rank is their
+    place in it; first_stop is the rank of the first stop (m if none) and
+    left[k] is what's still open after k partials."""
+
+    m: int
+    rows: np.ndarray
+    position: np.ndarray
+    rank: np.ndarray
+    counts: np.ndarray
+    first_row: np.ndarray
+    r: np.ndarray
+    weights: np.ndarray
+    label: np.ndarray
+    first_stop: np.ndarray
+    stopped: np.ndarray
+    open_at_eop: np.ndarray
+    eop_r: np.ndarray
+    left: np.ndarray
+
+
+def closes(run: ColumnarRun, partials: List[float] = None, ignore: List[str] = None) -> Closes:
+    partials = [1] if partials is None else list(partials)
+    ignore = list() if ignore is None else ignore
+    m, n_pos = len(partials), len(run)
+    o = run.orders
+
+    rows = run.execution_order()
+    ignored = [LABEL[name] for name in ignore if name in LABEL.__members__]
+    rows = rows[~np.isin(o["label"][rows], ignored)]
+
+    # rank of every execution inside its position, only the first m count
+    position = o["position"][rows]
+    rank = np.arange(len(rows)) - np.searchsorted(position, position, side="left")
+    counts = np.minimum(np.bincount(position, minlength=n_pos), m)
+    keep = rank < m
+    rows, position, rank = rows[keep], position[keep], rank[keep]
+
+    label = o["label"][rows]
+    stop = np.isin(label, [LABEL.SL, LABEL.SL_TO_BE])
+    first_stop = np.full(n_pos, m, dtype=np.int64)
+    np.minimum.at(first_stop, position[stop], rank[stop])
+    stopped = first_stop < m
+
+    return Closes(
+        m=m,
+        rows=rows,
+        position=position,
+        rank=rank,
+        counts=counts,
+        first_row=np.cumsum(counts) - counts,
+        r=run.r_multiples()[rows],
+        weights=np.asarray(partials, dtype=np.float64),
+        label=label,
+        first_stop=first_stop,
+        stopped=stopped,
+        open_at_eop=~stopped & (counts < m),
+        eop_r=run.eop_r_multiples(),
+        left=np.array([sum(partials[k:]) for k in range(m + 1)], dtype=np.float64),
+    )
+
+
+def results(run: ColumnarRun, partials: List[float] = None, ignore: List[str] = None) -> pd.DataFrame:
+    """Backtest.make_results for a whole run at once. Works on the flat
+    table of executions: the first len(partials) executions of every
+    position close one partial each, a stop closes all that's left (the
+    whole position if it's the first execution) and whatever is still
+    open gets closed at the end of period."""
+
+    c = closes(run, partials, ignore)
+    n_pos = len(run)
+    o = run.orders
+
+    # partials closed before the first stop add up, the stop itself only
+    # counts if it's the first execution (the rest would be breakeven)
+    before = c.rank < c.first_stop[c.position]
+    result = np.bincount(
+        c.position[before], weights=c.r[before] * c.weights[c.rank[before]], minlength=n_pos
+    ).astype(np.float64)
+    stopped_first = c.first_stop == 0
+    result[stopped_first] = c.r[c.first_row[stopped_first]]
+
+    # what's left open gets closed at the end of period
+    open_at_eop = c.open_at_eop
+    result[open_at_eop] += c.eop_r[open_at_eop] * c.left[c.counts[open_at_eop]]
+    result[c.counts == 0] = c.eop_r[c.counts == 0]
+
+    close_row = c.first_row + np.where(c.stopped, c.first_stop, c.m - 1)
+    close = run.eop_time.copy()
+    closed = ~open_at_eop
+    close[closed] = o["exec_time"][c.rows[close_row[closed]]]
+
+    names = np.array(["EOP"] + [label.name for label in LABEL], dtype=object)
+    first_label = np.zeros(n_pos, dtype=np.int64)
+    has_events = c.counts > 0
+    first_label[has_events] = c.label[c.first_row[has_events]]
+
+    return pd.DataFrame(
+        dict(
+            open=pd.to_datetime(run.time, unit="ns", utc=True),
+            close=pd.to_datetime(close, unit="ns", utc=True),
+            symbol=np.array(run.symbols, dtype=object)[run.symbol] if n_pos else [],
+            side=np.where(run.side == SIDE.BUY, SIDE.BUY.name, SIDE.SELL.name),
+            sl_pips=run.sl_delta / run.tick_size / 10,
+            result=result,
+            type=names[first_label],
+        )
+    )
+
+
+def view_results(views: List["PositionView"], partials: List[float] = None, ignore: List[str] = None) -> pd.DataFrame:
+    """results for positions that are views (of one run or more), in the
+    order given"""
+
+    runs = dict()
+    for k, view in enumerate(views):
+        runs.setdefault(id(view._run), (view._run, []))[1].append((k, view._j))
+    frames, order = [], []
+    for run, items in runs.values():
+        ks, js = zip(*items)
+        frames.append(results(run, partials, ignore).iloc[list(js)])
+        order.extend(ks)
+    frame = pd.concat(frames, ignore_index=True)
+    return frame.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+
+
+class OrderView:
+    """Order interface on a row of a ColumnarRun"""
+
+    __slots__ = ("_run", "_row")
+
+    def __init__(self, run: ColumnarRun, row: int):
+        self._run = run
+        self._row = row
+
+    def _get(self, column: str):
+        return self._run.orders[column][self._row]
+
+    @property
+    def _tick_size(self) -> float:
+        return self._run.tick_size[self._get("position")]
+
+    @property
+    def time(self) -> int:
+        return int(self._get("time"))
+
+    @property
+    def side(self) -> SIDE:
+        return SIDE(self._get("side"))
+
+    @property
+    def ordertype(self) -> ORDERTYPE:
+        return ORDERTYPE(self._get("ordertype"))
+
+    @property
+    def name(self) -> Optional[LABEL]:
+        label = self._get("label")
+        return LABEL(label) if label else None
+
+    @property
+    def price(self) -> Optional[Price]:
+        units = self._get("price")
+        return None if units == NONE else Price.from_units(int(units), self._tick_size)
+
+    @property
+    def execution(self) -> Optional[Execution]:
+        time = self._get("exec_time")
+        if time == NONE:
+            return None
+        price = Price.from_units(int(self._get("exec_price")), self._tick_size)
+        return Execution(int(time), price)
+
+    def __eq__(self, other):
+        return (
+            self.time == other.time
+            and self.side == other.side
+            and self.ordertype == other.ordertype
+            and self.price == other.price
+        )
+
+    def __repr__(self):
+        return (
+            f"OrderView(time={self.time!r}, side={self.side!r}, ordertype={self.ordertype!r}, "
+            f"price={self.price!r}, name={self.name!r}, execution={self.execution!r})"
+        )
+
+
+class PositionView:
+    """Position interface on a position of a ColumnarRun"""
+
+    __slots__ = ("_run", "_j")
+
+    def __init__(self, run: ColumnarRun, j: int):
+        self._run = run
+        self._j = j
+
+    @property
+    def time(self) -> arrow.Arrow:
+        return to_arrow(self._run.time[self._j])
+
+    @property
+    def time_ns(self) -> int:
+        return int(self._run.time[self._j])
+
+    @property
+    def symbol(self) -> Symbol:
+        return self._run._symbol_objects[self._run.symbol[self._j]]
+
+    @property
+    def side(self) -> SIDE:
+        return SIDE(self._run.side[self._j])
+
+    @property
+    def entry(self) -> OrderView:
+        return OrderView(self._run, self._run.first[self._j])
+
+    @property
+    def entry_price(self) -> Optional[Price]:
+        return self.entry.price
+
+    @property
+    def sl(self) -> OrderView:
+        return OrderView(self._run, self._run.sl[self._j])
+
+    @property
+    def sl_delta(self) -> float:
+        return abs(self.entry.execution.price - self.sl.price)
+
+    def _rows(self) -> np.ndarray:
+        return np.arange(self._run.first[self._j] + 1, self._run.first[self._j + 1])
+
+    @property
+    def orders(self) -> List[OrderView]:
+        return [OrderView(self._run, row) for row in self._rows()]
+
+    @property
+    def tps(self) -> List[OrderView]:
+        return [o for o in self.orders if o.name == LABEL.TP]
+
+    def get_orders(self, by="time") -> List[OrderView]:
+        rows = self._rows()
+        column = "time" if by == "time" else "exec_time"
+        times = self._run.orders[column][rows]
+        rows = rows[times != NONE]
+        order = np.lexsort((rows, self._run.orders[column][rows]))
+        return [OrderView(self._run, row) for row in rows[order]]
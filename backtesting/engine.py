@@ -0,0 +1,227 @@
+"""Vectorized candle hit detection. Works on the high/low columns of
+the rates as integer tick counts, so a whole window of candles is checked
+at once instead of building Price objects and calling has_candle_hit row
+by row."""
+
+import bisect
+from typing import Optional
+import numpy as np
+import pandas as pd
+from .classes.constants import SIDE, ORDERTYPE
+from .classes.order import Order
+from .times import to_ns
+
+# has_candle_hit uses a fixed 1 pip spread, which is 10 ticks
+DEFAULT_SPREAD = 10
+
+
+def to_ticks(values, tick_size: float) -> np.ndarray:
+    """Converts prices to integer tick counts"""
+    return np.rint(np.asarray(values, dtype=float) / tick_size).astype(np.int64)
+
+
+class Candles:
+    """Array view of a rates frame: times in ns, high and low in ticks"""
+
+    __slots__ = ("time", "high", "low", "tick_size")
+
+    def __init__(self, time: np.ndarray, high: np.ndarray, low: np.ndarray, tick_size: float):
+        self.time = time
+        self.high = high
+        self.low = low
+        self.tick_size = tick_size
+
+    @classmethod
+    def from_frame(cls, rates: pd.DataFrame, tick_size: float):
+        return cls(
+            to_ns(rates["time"]),
+            to_ticks(rates["high"], tick_size),
+            to_ticks(rates["low"], tick_size),
+            tick_size,
+        )
+
+    def __len__(self):
+        return len(self.time)
+
+    def start(self, after) -> int:
+        """Index of the first candle strictly after the given time"""
+        return int(np.searchsorted(self.time, to_ns(after), side="right"))
+
+
+def hit_mask(
+    ordertype: ORDERTYPE,
+    side: SIDE,
+    price: int,
+    high: np.ndarray,
+    low: np.ndarray,
+    spread: int = DEFAULT_SPREAD,
+) -> np.ndarray:
+    """Same rules as has_candle_hit, for a whole array of candles.
+    Price, high, low and spread are all in ticks."""
+
+    if ordertype == ORDERTYPE.LIMIT:
+        if side == SIDE.BUY:
+            return low <= price
+        return high >= price
+
+    if ordertype == ORDERTYPE.STOP:
+        # on stops we need spreads in order
+        # to make sure that sl aren't actually hit
+        if side == SIDE.BUY:
+            return high - spread >= price
+        return low + spread <= price
+
+    return np.zeros(len(high), dtype=bool)
+
+
+def first_hit(order: Order, candles: Candles, spread: int = DEFAULT_SPREAD) -> Optional[int]:
+    """Returns the index of the first candle after order.time that hits
+    the order, or None if there isn't one"""
+
+    start = candles.start(order.time)
+
+    if order.price is None:
+        if order.ordertype == ORDERTYPE.MARKET:
+            return start if start < len(candles) else None
+        raise ValueError(f"trying to find a hit on a limit with no price, {order=}")
+
+    price = order.price.ticks
+    mask = hit_mask(
+        order.ordertype,
+        order.side,
+        price,
+        candles.high[start:],
+        candles.low[start:],
+        spread,
+    )
+
+    if not mask.size:
+        return None
+    i = int(mask.argmax())
+    return start + i if mask[i] else None
+
+
+NO_HIT = -1
+
+
+def first_hits(
+    candles: Candles,
+    starts,
+    ordertypes,
+    sides,
+    prices,
+    spread: int = DEFAULT_SPREAD,
+) -> np.ndarray:
+    """Resolves many orders over the same candles at once. Each order only
+    becomes active from its own start index; prices are in ticks (ignored
+    for market orders). Returns the first hit index of every order, or
+    NO_HIT.
+
+    The distinct starts split the candles into segments, and running
+    extremes are built over each segment, restarting at its start: one
+    pass over the candles however many starts there are. An order then
+    finds the first segment from its own on whose extreme reaches its
+    price, and binary-searches inside it. O(candles + orders * (starts +
+    log candles))."""
+
+    starts = np.asarray(starts, dtype=np.int64)
+    hits = np.full(len(starts), NO_HIT, dtype=np.int64)
+    n = len(candles)
+
+    bounds = np.unique(starts[starts < n])
+    if not len(bounds):
+        return hits
+    ends = np.append(bounds[1:], n)
+    first = bounds[0]
+    highs = np.empty(n - first, dtype=candles.high.dtype)
+    lows = np.empty(n - first, dtype=candles.low.dtype)
+    for a, b in zip(bounds.tolist(), ends.tolist()):
+        np.maximum.accumulate(candles.high[a:b], out=highs[a - first : b - first])
+        np.minimum.accumulate(candles.low[a:b], out=lows[a - first : b - first])
+    np.negative(lows, out=lows)
+    # extremes of each whole segment
+    segment_highs = highs[ends - first - 1].tolist()
+    segment_lows = lows[ends - first - 1].tolist()
+    bounds, ends = bounds.tolist(), ends.tolist()
+
+    for j, s in enumerate(starts.tolist()):
+        if s >= n:
+            continue
+        ordertype, side, price = ordertypes[j], sides[j], prices[j]
+
+        if ordertype == ORDERTYPE.MARKET:
+            hits[j] = s
+            continue
+
+        if ordertype == ORDERTYPE.LIMIT:
+            if side == SIDE.BUY:
+                running, extremes, target = lows, segment_lows, -price
+            else:
+                running, extremes, target = highs, segment_highs, price
+        elif ordertype == ORDERTYPE.STOP:
+            if side == SIDE.BUY:
+                running, extremes, target = highs, segment_highs, price + spread
+            else:
+                running, extremes, target = lows, segment_lows, spread - price
+        else:
+            continue
+
+        m = bisect.bisect_left(bounds, s)
+        while m < len(bounds) and extremes[m] < target:
+            m += 1
+        if m == len(bounds):
+            continue
+        a, b = bounds[m] - first, ends[m] - first
+        hits[j] = first + a + int(np.searchsorted(running[a:b], target, side="left"))
+
+    return hits
+
+
+def resolve(candles: Candles, orders, entry=None, entry_time=None, spread: int = DEFAULT_SPREAD):
+    """Resolves a whole position. orders (and entry, if it still has to
+    get hit) are (times, ordertypes, sides, prices) arrays, with times in
+    ns and prices in ticks. Orders only become active after the entry
+    fill, at entry_time when it's already known.
+
+    Returns the entry hit index (None if it was already filled, NO_HIT if
+    it never gets hit) and the hit index of every order. Only takes and
+    returns plain arrays, so it can run in a worker process."""
+
+    entry_hit = None
+    if entry is not None:
+        times, ordertypes, sides, prices = entry
+        starts = np.searchsorted(candles.time, times, side="right")
+        entry_hit = int(first_hits(candles, starts, ordertypes, sides, prices, spread)[0])
+        if entry_hit == NO_HIT:
+            return entry_hit, None
+        entry_time = candles.time[entry_hit]
+
+    times, ordertypes, sides, prices = orders
+    starts = np.searchsorted(candles.time, np.maximum(times, entry_time), side="right")
+    return entry_hit, first_hits(candles, starts, ordertypes, sides, prices, spread)
+
+
+def tick_hits(ticks_time, bid, ask, starts, ordertypes, sides, prices) -> np.ndarray:
+    """Index of the first tick that triggers each order, from its own
+    start time (ns) on, or NO_HIT. Bid, ask and prices are in ticks: buys
+    trade at the ask and sells at the bid, so the spread is the real one."""
+
+    hits = np.full(len(starts), NO_HIT, dtype=np.int64)
+    for j, (start, ordertype, side, price) in enumerate(zip(starts, ordertypes, sides, prices)):
+        s = int(np.searchsorted(ticks_time, start, side="left"))
+        quote = ask[s:] if side == SIDE.BUY else bid[s:]
+
+        if ordertype == ORDERTYPE.MARKET:
+            mask = np.ones(len(quote), dtype=bool)
+        elif ordertype == ORDERTYPE.LIMIT:
+            mask = quote <= price if side == SIDE.BUY else quote >= price
+        elif ordertype == ORDERTYPE.STOP:
+            mask = quote >= price if side == SIDE.BUY else quote <= price
+        else:
+            continue
+
+        if mask.size:
+            i = int(mask.argmax())
+            if mask[i]:
+                hits[j] = s + i
+    return hits
@@ -0,0 +1,400 @@
+"""Local on-disk store for OHLC bars, in front of the terminal.
+
+Bars are kept per symbol and timeframe as segments, one per fetched
+range, merged with the ones next to it while they're small. A segment
+is a folder holding one .npy file per column (time in UTC epoch ns,
+prices as float64) that gets memory-mapped on read, so slicing a window
+out of it does not copy anything. Only the parts of a request that no
+segment covers yet go to the terminal."""
+
+import bisect
+import os
+import shutil
+import time as _time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+import logging
+from .times import bar_open, to_ns
+from .instrument import Instrument, NULL
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ("time", "open", "high", "low", "close")
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".signals-backtesting", "history")
+
+# segments get merged with their neighbours up to this size (about 45
+# days of M1 bars), bigger ones would take too long to rewrite
+MAX_SEGMENT_BARS = 1 << 16
+
+
+class HistoryMissError(LookupError):
+    pass
+
+
+def terminal_source(symbol: str, timeframe, datetime_from, datetime_to) -> pd.DataFrame:
+    """Gets bars in [datetime_from, datetime_to) from the terminal"""
+
+    # only needed on a cache miss, so offline runs work without it
+    import betterMT5 as mt5
+
+    if isinstance(timeframe, str):
+        timeframe = mt5.TIMEFRAME[timeframe]
+    try:
+        rates = mt5.Symbol(symbol).history(
+            timeframe, datetime_from=datetime_from, datetime_to=datetime_to, include_last=False
+        )
+    except mt5.UnexpectedValueError as e:
+        if isinstance(e.diff, int) and e.diff <= 3:
+            rates = e.rates
+        else:
+            raise HistoryMissError(f"{symbol} {_timeframe_name(timeframe)}: {e}") from e
+    return rates[list(COLUMNS)]
+
+
+def _timeframe_name(timeframe) -> str:
+    return getattr(timeframe, "name", str(timeframe))
+
+
+def _subtract(start: int, end: int, covered: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Parts of [start, end) that are not in any of the covered ranges"""
+    gaps = []
+    for c_start, c_end in sorted(covered):
+        if c_end <= start or c_start >= end:
+            continue
+        if c_start > start:
+            gaps.append((start, c_start))
+        start = max(start, c_end)
+        if start >= end:
+            break
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+
+class _Listing(NamedTuple):
+    """Segments of a folder, sorted, with their starts and ends apart
+    for bisecting"""
+
+    segments: List[Tuple[int, int]]
+    starts: List[int]
+    ends: List[int]
+
+
+class HistoryStore:
+    columns = COLUMNS
+
+    def __init__(
+        self,
+        root: str = DEFAULT_ROOT,
+        source: Optional[Callable] = terminal_source,
+        offline: bool = False,
+    ):
+        self.root = root
+        self.source = source
+        self.offline = offline or source is None
+        self.hits = 0
+        self.misses = 0
+        # segments never change once written, their maps can be reused
+        self._maps = dict()
+        # folder: _Listing
+        self._segments = dict()
+
+    def _folder(self, symbol: str, timeframe) -> str:
+        return os.path.join(self.root, symbol, _timeframe_name(timeframe))
+
+    def _listing(self, symbol: str, timeframe) -> "_Listing":
+        folder = self._folder(symbol, timeframe)
+        if folder in self._segments:
+            return self._segments[folder]
+        if not os.path.isdir(folder):
+            return _Listing([], [], [])
+        found = []
+        for name in os.listdir(folder):
+            start, _, end = name.partition("-")
+            if start.isdigit() and end.isdigit():
+                found.append((int(start), int(end)))
+        # drops the ones inside another, left behind by a merge that
+        # couldn't remove them: the rest have their ends in order too
+        segments = []
+        for segment in sorted(found, key=lambda s: (s[0], -s[1])):
+            if not segments or segment[1] > segments[-1][1]:
+                segments.append(segment)
+        listing = _Listing(segments, [s for s, _ in segments], [e for _, e in segments])
+        self._segments[folder] = listing
+        return listing
+
+    def segments(self, symbol: str, timeframe) -> List[Tuple[int, int]]:
+        """Covered [start, end) ranges (ns), sorted"""
+        return self._listing(symbol, timeframe).segments
+
+    def _around(self, symbol: str, timeframe, start: int, end: int) -> List[Tuple[int, int]]:
+        """Segments that overlap or touch [start, end], found by bisecting"""
+        listing = self._listing(symbol, timeframe)
+        a = bisect.bisect_left(listing.ends, start)
+        b = bisect.bisect_right(listing.starts, end)
+        return listing.segments[a:b]
+
+    def _write_segment(self, symbol: str, timeframe, start: int, end: int, rates: pd.DataFrame):
+        """Writes the bars of [start, end) as a segment, merged with the
+        segments it touches as long as that keeps it under
+        MAX_SEGMENT_BARS, so that fetching a bar at a time (drill_down
+        does) doesn't pile up tiny segments"""
+        folder = self._folder(symbol, timeframe)
+
+        times = to_ns(rates["time"]) if len(rates) else np.empty(0, dtype=np.int64)
+        order = np.argsort(times, kind="stable")
+        keep = (times[order] >= start) & (times[order] < end)
+        order = order[keep]
+        columns = dict(time=times[order])
+        for col in self.columns[1:]:
+            values = rates[col].to_numpy(dtype=np.float64) if len(rates) else np.empty(0)
+            columns[col] = values[order]
+
+        merged, size = [], len(order)
+        for segment in self._around(symbol, timeframe, start, end):
+            loaded = self._load(symbol, timeframe, segment)
+            if size + len(loaded["time"]) > MAX_SEGMENT_BARS:
+                continue
+            merged.append(segment)
+            size += len(loaded["time"])
+        if merged:
+            pieces = [self._load(symbol, timeframe, segment) for segment in merged] + [columns]
+            times = np.concatenate([p["time"] for p in pieces])
+            # bars already stored win over the new ones
+            order = np.argsort(times, kind="stable")
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = times[order][1:] != times[order][:-1]
+            order = order[first]
+            columns = {col: np.concatenate([p[col] for p in pieces])[order] for col in self.columns}
+            start = min(start, merged[0][0])
+            end = max(end, merged[-1][1])
+
+        final = os.path.join(folder, f"{start}-{end}")
+        tmp = os.path.join(folder, f".tmp-{start}-{end}-{os.getpid()}")
+        os.makedirs(tmp, exist_ok=True)
+        for col in self.columns:
+            np.save(os.path.join(tmp, f"{col}.npy"), columns[col])
+        try:
+            os.replace(tmp, final)
+        except OSError:
+            # another process (a batch worker, another Backtest) wrote the
+            # same range first: its bars are the same, keeps them
+            if not os.path.isdir(final):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+        for segment in merged:
+            if segment == (start, end):
+                continue
+            old = os.path.join(folder, "%d-%d" % segment)
+            self._maps.pop(old, None)
+            # fails where mapped files can't be removed (Windows), the
+            # listing skips it then
+            shutil.rmtree(old, ignore_errors=True)
+        self._segments.pop(folder, None)
+
+    def put(self, symbol: str, timeframe, rates: pd.DataFrame, datetime_from=None, datetime_to=None):
+        """Stores bars, and marks [datetime_from, datetime_to) as covered
+        (defaults to the range of the bars given). Already covered parts
+        are left as they are."""
+        times = to_ns(rates["time"])
+        start = to_ns(datetime_from) if datetime_from is not None else int(times.min())
+        end = to_ns(datetime_to) if datetime_to is not None else int(times.max()) + 1
+        for g_start, g_end in _subtract(start, end, self._around(symbol, timeframe, start, end)):
+            self._write_segment(symbol, timeframe, g_start, g_end, rates)
+
+    def _forming(self, now: int, timeframe) -> int:
+        """Open time of the bar that isn't over yet at now"""
+        return bar_open(now, timeframe)
+
+    def _fill(self, symbol: str, timeframe, start: int, end: int) -> Optional[pd.DataFrame]:
+        """Stores what's missing of [start, end) before the bar that's
+        still forming. That one (and anything after it) isn't over yet,
+        its high, low and close would still change: it comes straight
+        from the source every time, and is returned instead."""
+        now = _time.time_ns()
+        forming = self._forming(now, timeframe)
+        gaps = _subtract(start, min(end, forming), self._around(symbol, timeframe, start, end))
+        if gaps:
+            # other processes (batch workers, another Backtest) might have
+            # stored them since the folder was listed
+            self._segments.pop(self._folder(symbol, timeframe), None)
+            gaps = _subtract(start, min(end, forming), self._around(symbol, timeframe, start, end))
+        # bars that don't exist yet aren't asked for at all
+        live = min(end, now) > max(start, forming) and not self.offline
+        if not gaps and not live:
+            self.hits += 1
+            return None
+        if self.offline:
+            raise HistoryMissError(f"{symbol} {_timeframe_name(timeframe)} not stored for {gaps}")
+        self.misses += 1
+        for g_start, g_end in gaps:
+            rates = self.source(
+                symbol,
+                timeframe,
+                pd.Timestamp(g_start, tz="UTC").to_pydatetime(),
+                pd.Timestamp(g_end, tz="UTC").to_pydatetime(),
+            )
+            self._write_segment(symbol, timeframe, g_start, g_end, rates)
+        if live:
+            return self.source(
+                symbol,
+                timeframe,
+                pd.Timestamp(max(start, forming), tz="UTC").to_pydatetime(),
+                pd.Timestamp(min(end, now), tz="UTC").to_pydatetime(),
+            )
+        return None
+
+    def _load(self, symbol: str, timeframe, segment: Tuple[int, int]) -> dict:
+        folder = os.path.join(self._folder(symbol, timeframe), "%d-%d" % segment)
+        if folder not in self._maps:
+            self._maps[folder] = {
+                col: np.load(os.path.join(folder, f"{col}.npy"), mmap_mode="r")
+                for col in self.columns
+            }
+        return self._maps[folder]
+
+    def _pieces(self, symbol: str, timeframe, start: int, end: int) -> Tuple[List[dict], int]:
+        """Columns of the stored bars of [start, end), a piece per
+        segment, and where the stored bars end"""
+        pieces = []
+        # segments written by different processes can overlap, each bar
+        # is taken from the first one that has it
+        taken = start
+        for s_start, s_end in self._around(symbol, timeframe, start, end):
+            if s_end <= taken or s_start >= end:
+                continue
+            columns = self._load(symbol, timeframe, (s_start, s_end))
+            a, b = np.searchsorted(columns["time"], [taken, end], side="left")
+            taken = min(s_end, end)
+            # plain arrays on the mapped memory: every access to a memmap
+            # column makes pandas go through memmap's own view handling
+            pieces.append({col: values[a:b].view(np.ndarray) for col, values in columns.items()})
+        return pieces, taken
+
+    def get(self, symbol: str, timeframe, datetime_from, datetime_to) -> pd.DataFrame:
+        """Returns the bars in [datetime_from, datetime_to), going to the
+        source only for what isn't stored yet. Windows that fall inside a
+        single segment are views on the memory-mapped files."""
+
+        start, end = to_ns(datetime_from), to_ns(datetime_to)
+        live = self._fill(symbol, timeframe, start, end)
+
+        try:
+            pieces, taken = self._pieces(symbol, timeframe, start, end)
+        except FileNotFoundError:
+            # merged into a bigger one by another process meanwhile
+            self._segments.pop(self._folder(symbol, timeframe), None)
+            pieces, taken = self._pieces(symbol, timeframe, start, end)
+        if live is not None and len(live):
+            times = to_ns(live["time"])
+            keep = (times >= taken) & (times < end)
+            pieces.append(dict(
+                time=times[keep],
+                **{col: live[col].to_numpy(dtype=np.float64)[keep] for col in self.columns[1:]},
+            ))
+
+        if len(pieces) == 1:
+            columns = pieces[0]
+        elif pieces:
+            columns = {col: np.concatenate([p[col] for p in pieces]) for col in self.columns}
+        else:
+            columns = {
+                col: np.empty(0, dtype=np.int64 if col == "time" else np.float64)
+                for col in self.columns
+            }
+
+        frame = pd.DataFrame(
+            {col: columns[col] for col in self.columns[1:]}, copy=False
+        )
+        frame.insert(0, "time", pd.to_datetime(columns["time"], unit="ns", utc=True))
+        return frame
+
+
+def merge_windows(windows: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merges overlapping (or touching) [start, end) windows"""
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+@dataclass
+class PrefetchStats:
+    windows: int = 0
+    fetches: int = 0
+
+    @property
+    def saved(self) -> int:
+        """Round-trips saved by merging windows"""
+        return self.windows - self.fetches
+
+
+class Prefetcher:
+    """Fetches the history of a whole run ahead of the simulation. Windows
+    of the same symbol that overlap are merged and fetched once, on a
+    single background thread, in the order the positions will need them;
+    each position then gets a slice of the shared frame."""
+
+    def __init__(self, history: HistoryStore, timeframe, instrument: Instrument = NULL):
+        self.history = history
+        self.timeframe = timeframe
+        self.instrument = instrument
+        self.stats = PrefetchStats()
+        self._windows = dict()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch(self, symbol: str, start: int, end: int):
+        with self.instrument.stage("fetch", symbol=symbol):
+            rates = self.history.get(
+                symbol,
+                self.timeframe,
+                pd.Timestamp(start, tz="UTC"),
+                pd.Timestamp(end, tz="UTC"),
+            )
+        return rates, to_ns(rates["time"])
+
+    def plan(self, windows: Dict[Hashable, Tuple[str, "datetimelike", "datetimelike"]]):
+        """Takes {key: (symbol, datetime_from, datetime_to)} and schedules
+        one fetch per merged window"""
+
+        by_symbol = defaultdict(list)
+        for key, (symbol, start, end) in windows.items():
+            by_symbol[symbol].append((to_ns(start), to_ns(end), key))
+
+        fetches = []
+        for symbol, items in by_symbol.items():
+            for start, end in merge_windows([(s, e) for s, e, _ in items]):
+                keys = [(k, s, e) for s, e, k in items if start <= s and e <= end]
+                fetches.append((start, end, symbol, keys))
+
+        for start, end, symbol, keys in sorted(fetches, key=lambda f: f[:2]):
+            future = self._executor.submit(self._fetch, symbol, start, end)
+            for key, s, e in keys:
+                self._windows[key] = (future, s, e)
+
+        self.stats.windows += len(windows)
+        self.stats.fetches += len(fetches)
+
+    def rates(self, key: Hashable) -> pd.DataFrame:
+        """Rates of a planned window. Raises whatever its fetch raised."""
+        future, start, end = self._windows.pop(key)
+        rates, times = future.result()
+        a, b = np.searchsorted(times, [start, end], side="left")
+        return rates.iloc[a:b]
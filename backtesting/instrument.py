@@ -0,0 +1,133 @@
+"""Instrumentation of a run, for finding out where the time of a slow
+backtest goes (the terminal, hermes, the simulation or pandas).
+
+Backtest calls stage() around each stage of a run, and around each step
+of every position, and count() for counters (history fetches, bars
+scanned, orders resolved, cache hits). The default Instrument does
+nothing, at the cost of a method call. Recorder keeps it all and gives
+it back as a report or as a Chrome trace, to open in chrome://tracing or
+https://ui.perfetto.dev. Anything else (a progress bar, a metrics
+client) plugs in by subclassing Instrument.
+
+    rec = Recorder()
+    Backtest(path, instrument=rec).run()
+    rec.report()
+    rec.save_chrome_trace("run.json")
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import NamedTuple
+
+_NOTHING = nullcontext()
+
+
+class Instrument:
+    """Does nothing. stage(name, **args) is entered around every stage,
+    with what it's working on as args (e.g. position=3), count(name, n)
+    adds n to a counter."""
+
+    enabled = False
+
+    def stage(self, name: str, **args):
+        return _NOTHING
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+
+NULL = Instrument()
+
+
+class Span(NamedTuple):
+    name: str
+    start: int  # ns since the recorder was made
+    duration: int  # ns
+    thread: int
+    args: dict
+
+
+class _Stage:
+    __slots__ = ("recorder", "name", "args", "start")
+
+    def __init__(self, recorder: "Recorder", name: str, args: dict):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.recorder.spans.append(
+            Span(
+                self.name,
+                self.start - self.recorder.origin,
+                end - self.start,
+                threading.get_ident(),
+                self.args,
+            )
+        )
+
+
+class Recorder(Instrument):
+    """Keeps every stage as a Span, and the counters"""
+
+    enabled = True
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.spans = []
+        self.counters = Counter()
+
+    def stage(self, name: str, **args):
+        return _Stage(self, name, args)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def report(self) -> dict:
+        """{"stages": {name: calls, seconds, mean and max}, "counters": ...}
+        with the stages in the order they first started"""
+        stages = dict()
+        for span in sorted(self.spans, key=lambda s: s.start):
+            s = stages.setdefault(span.name, dict(calls=0, seconds=0.0, max=0.0))
+            s["calls"] += 1
+            s["seconds"] += span.duration / 1e9
+            s["max"] = max(s["max"], span.duration / 1e9)
+        for s in stages.values():
+            s["mean"] = s["seconds"] / s["calls"]
+        return dict(stages=stages, counters=dict(self.counters))
+
+    def chrome_trace(self) -> dict:
+        """The spans as complete events (and the counters as a counter
+        event at the end), in the Trace Event Format"""
+        pid = os.getpid()
+        events = [
+            dict(
+                name=span.name,
+                cat="backtesting",
+                ph="X",
+                ts=span.start / 1e3,
+                dur=span.duration / 1e3,
+                pid=pid,
+                tid=span.thread,
+                args=span.args,
+            )
+            for span in self.spans
+        ]
+        if self.counters:
+            end = max((e["ts"] + e["dur"] for e in events), default=0)
+            events.append(
+                dict(name="counters", ph="C", ts=end, pid=pid, args=dict(self.counters))
+            )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def save_chrome_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
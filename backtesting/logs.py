@@ -0,0 +1,67 @@
+"""Logging setup, opt-in. Modules of the package only get their logger:
+nothing is configured at import time, so an application's own setup is
+left alone, and until configure_logging is called only warnings and
+errors get through (to stderr, through Python's last resort handler).
+
+Things that happen to single orders or prices (duplicates, inferred
+dots, ...) get counted with count instead of logged one line each, and
+the step they happen in (making positions, a run) reports how many of
+each there were once it's done."""
+
+import logging
+import threading
+from collections import Counter
+
+PACKAGE = "backtesting"
+
+_counts = Counter()
+_lock = threading.Lock()
+
+
+def count(what: str, n: int = 1):
+    """Counts something that happened, for the summary of the step it
+    happened in"""
+    with _lock:
+        _counts[what] += n
+
+
+def counts() -> Counter:
+    """What has been counted so far, the difference of two of these is
+    what happened in between"""
+    with _lock:
+        return Counter(_counts)
+
+
+def report(logger: logging.Logger, counted: Counter, level=logging.WARNING):
+    """One line with everything counted, if anything was"""
+    if counted:
+        logger.log(level, "%s", ", ".join(f"{n} {what}" for what, n in counted.items()))
+
+
+def configure_logging(level=logging.INFO, rich: bool = True, loggers=(PACKAGE, "hermes.core")):
+    """Logs of the package (and of hermes) from level on, to stderr,
+    through rich if it's installed and rich is True. Calling it again
+    replaces the handler it added the previous time."""
+
+    handler = None
+    if rich:
+        try:
+            from rich.logging import RichHandler
+
+            handler = RichHandler(rich_tracebacks=True, markup=True)
+            handler.setFormatter(logging.Formatter("[u]%(funcName)s[/](): %(message)s", "[%x %X]"))
+        except ImportError:
+            pass
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler._backtesting = True
+
+    for name in loggers:
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        for old in [h for h in logger.handlers if getattr(h, "_backtesting", False)]:
+            logger.removeHandler(old)
+        logger.addHandler(handler)
+        # or the root logger would print them again, if it's set up
+        logger.propagate = False
@@ -0,0 +1,279 @@
+"""Streaming backtest of an export, with every stage running at once.
+
+Backtest prepares the whole export before run starts, and run goes
+through all the history before the results come out. Here messages go
+through four stages connected by bounded queues:
+
+    read + interpret -> make positions -> fetch history -> simulate
+
+Reading and interpreting run on their own thread, history I/O on
+another one (the store isn't thread-safe, so it only ever has one), and
+hit searches on a process pool (or a third thread), while the event
+loop hands positions from one stage to the next. A full queue stops the
+stage before it, so memory stays bounded whatever the export size, and
+each position's result comes out as soon as it's simulated: the whole
+run takes about as long as its slowest stage.
+
+    async for index, p, row in Pipeline().results("export.json"):
+        ...
+
+or Pipeline().run("export.json"), for the same dataframe Backtest.run
+gives. ticks and coarse_tf aren't supported here."""
+
+import asyncio
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from typing import AsyncIterator, List, Optional, Tuple
+import pandas as pd
+from . import engine, logs, preprocessing
+from .backtesting import (
+    Backtest,
+    _apply_resolution,
+    _resolution_task,
+    fill_market_entry,
+    get_pos_eop,
+    history_window,
+    make_positions,
+)
+from .classes.constants import ORDERTYPE
+from .classes.position import Position, PriceNotReasonableError, UnreasonableOrderPlacementError
+from .history import HistoryMissError, HistoryStore
+from .instrument import Instrument, NULL
+
+log = logging.getLogger(__name__)
+
+# ends a queue
+_DONE = object()
+
+# messages interpreted at a time, small enough for the first positions
+# to get going early
+READ_CHUNK = 1000
+
+
+class _Failed:
+    """A stage's exception, on its way to whoever reads the results"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Pipeline:
+    """Settings are the ones of Backtest.run (and make_results, for
+    partials and ignore); queue_size bounds every queue between stages."""
+
+    def __init__(
+        self,
+        history: Optional[HistoryStore] = None,
+        matrix_tf="M1",
+        end_of_period: int = 0,
+        end_of_day: str = "18:30",
+        workers: Optional[int] = None,
+        queue_size: int = 64,
+        cache_root: Optional[str] = None,
+        partials: Optional[List[float]] = None,
+        ignore: Optional[List[str]] = None,
+        instrument: Instrument = NULL,
+    ):
+        self.history = history if history is not None else HistoryStore()
+        self.matrix_tf = matrix_tf
+        self.end_of_period = end_of_period
+        self.end_of_day = end_of_day
+        self.workers = workers
+        self.queue_size = queue_size
+        self.cache_root = cache_root
+        self.partials = [1] if partials is None else partials
+        self.ignore = [] if ignore is None else ignore
+        self.instrument = instrument
+
+        # positions that got an entry, in signal order, after a run
+        self.run_results = []
+
+    def _read(self, path: str, put):
+        """Runs on its own thread: interprets the export a chunk at a
+        time and puts every signal with a flag"""
+        # sqlite connections stay on the thread that made them
+        with preprocessing.InterpretationCache(self.cache_root) as cache:
+            prep = preprocessing.TelegramChatPreprocessor(instrument=self.instrument)
+            pieces = prep.iter_preprocess(prep.iter_json(path), self.workers, cache, READ_CHUNK)
+            for piece in pieces:
+                if "flag" in piece["interpretation"]:
+                    put(piece)
+
+    async def _build(self, signals: asyncio.Queue, positions: asyncio.Queue):
+        """A position is done when the next one gets made: updates that
+        follow a rejected signal still go to the one before, like in
+        make_positions"""
+
+        last = None
+        index = 0
+
+        async def flush():
+            nonlocal index
+            eop = get_pos_eop(last.time, self.end_of_period, self.end_of_day)
+            if last.time < eop and last.sl is not None:
+                await positions.put((index, last, eop))
+            index += 1
+
+        while (data := await signals.get()) is not _DONE:
+            for p in make_positions([data], report=False, last=last):
+                if last is not None:
+                    await flush()
+                last = p
+        if last is not None:
+            await flush()
+
+    def _fetch_one(self, p: Position, eop) -> bool:
+        """Runs on the history thread: sets p.rates, and fills market
+        entries. False if the position has no entry."""
+        symbol, start, end = history_window(p, eop)
+        with self.instrument.stage("history"):
+            p.rates = self.history.get(symbol, self.matrix_tf, start, end)
+        if p.entry.ordertype == ORDERTYPE.MARKET and p.entry.execution is None:
+            return fill_market_entry(p)
+        return True
+
+    async def _fetch(self, positions: asyncio.Queue, fetched: asyncio.Queue, io: ThreadPoolExecutor):
+        """Positions whose history is missing (or whose market entry
+        makes their sl or tp unreasonable) are left out, and logged once
+        at the end"""
+        loop = asyncio.get_running_loop()
+        failed, first_error = Counter(), None
+        while (item := await positions.get()) is not _DONE:
+            index, p, eop = item
+            try:
+                if not await loop.run_in_executor(io, self._fetch_one, p, eop):
+                    continue
+            except (HistoryMissError, UnreasonableOrderPlacementError, PriceNotReasonableError) as e:
+                failed[type(e).__name__] += 1
+                if first_error is None:
+                    first_error = (index, e)
+                log.debug("position %d failed: %r", index, e)
+                continue
+            await fetched.put((index, p))
+        if failed:
+            log.error(
+                "%d positions failed (%s), the first one (%d) with %s",
+                sum(failed.values()),
+                ", ".join(f"{n} {name}" for name, n in failed.items()),
+                *first_error,
+            )
+
+    async def _simulate(self, fetched: asyncio.Queue, out: asyncio.Queue, pool):
+        """Resolves up to queue_size positions at a time, results go out
+        as they finish"""
+
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.queue_size)
+
+        async def one(index: int, p: Position):
+            try:
+                orders, task = _resolution_task(p)
+                with self.instrument.stage("resolve"):
+                    entry_hit, hits = await loop.run_in_executor(pool, engine.resolve, *task)
+                if _apply_resolution(p, orders, entry_hit, hits):
+                    res = Backtest._determine_position_result(p, self.partials, self.ignore)
+                    await out.put((index, p, Backtest._result_row(p, res)))
+            finally:
+                slots.release()
+
+        running, failed = set(), []
+
+        def done(task: asyncio.Future):
+            running.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failed.append(task.exception())
+
+        while (item := await fetched.get()) is not _DONE:
+            await slots.acquire()
+            if failed:
+                raise failed[0]
+            task = asyncio.ensure_future(one(*item))
+            running.add(task)
+            task.add_done_callback(done)
+        if failed:
+            raise failed[0]
+        if running:
+            # raises the first exception of the positions still running
+            await asyncio.gather(*running)
+
+    async def results(self, path: str) -> AsyncIterator[Tuple[int, Position, dict]]:
+        """(index, position, make_results row) of every position that got
+        an entry, as they finish; index is the place of the position in
+        the export, they don't come out in that order"""
+
+        loop = asyncio.get_running_loop()
+        signals, positions, fetched, out = (asyncio.Queue(self.queue_size) for _ in range(4))
+        reader = ThreadPoolExecutor(max_workers=1)
+        io = ThreadPoolExecutor(max_workers=1)
+        if self.workers is not None and self.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            pool = ThreadPoolExecutor(max_workers=1)
+
+        stop = threading.Event()
+        # rejected signals, dropped updates, ... of the whole run
+        counted = logs.counts()
+
+        def put(item):
+            # blocks the reader thread while the queue is full, until
+            # the results stop being read
+            future = asyncio.run_coroutine_threadsafe(signals.put(item), loop)
+            while True:
+                try:
+                    return future.result(timeout=0.1)
+                except TimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        raise asyncio.CancelledError
+
+        async def read():
+            await loop.run_in_executor(reader, self._read, path, put)
+
+        async def stage(coroutine, queue: asyncio.Queue):
+            """Runs a stage, then tells the next one it's done; failures
+            go straight to the results"""
+            try:
+                await coroutine
+                await queue.put(_DONE)
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                await out.put(_Failed(e))
+
+        tasks = [
+            asyncio.ensure_future(stage(read(), signals)),
+            asyncio.ensure_future(stage(self._build(signals, positions), positions)),
+            asyncio.ensure_future(stage(self._fetch(positions, fetched, io), fetched)),
+            asyncio.ensure_future(stage(self._simulate(fetched, out, pool), out)),
+        ]
+        try:
+            while (item := await out.get()) is not _DONE:
+                if isinstance(item, _Failed):
+                    raise item.error
+                yield item
+            logs.report(log, logs.counts() - counted)
+        finally:
+            # nothing here can wait on the loop before the reader is gone:
+            # an early stop gets here from asyncio.run's cleanup, which
+            # cancels whatever gets awaited and then closes the loop
+            stop.set()
+            for task in tasks:
+                task.cancel()
+            for executor in (io, pool):
+                executor.shutdown(wait=False, cancel_futures=True)
+            reader.shutdown(wait=True)
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def arun(self, path: str) -> pd.DataFrame:
+        done = []
+        async for index, p, row in self.results(path):
+            done.append((index, p, row))
+        done.sort(key=lambda d: d[0])
+        self.run_results = [p for _, p, _ in done]
+        return pd.DataFrame([row for _, _, row in done])
+
+    def run(self, path: str) -> pd.DataFrame:
+        """Results of every position, in signal order, like Backtest.run"""
+        return asyncio.run(self.arun(path))
@@ -0,0 +1,249 @@
+"""Portfolio view of one or more runs: every position sized and traded
+on one account, with the equity curve, drawdown, time under water and
+concurrent exposure that follow.
+
+The executions of every run are turned into one stream of events (an
+open per position, then every partial close, stop and end of period
+close, with the R it realizes, the same ones make_results adds up), all
+merged into time order. Sizing is fixed-fractional: a position risks a
+fraction of the equity at the time it opens, so a 1R loss costs that
+much. Everything past the sizing is cumulative sums over the stream.
+
+    portfolio = Portfolio({"channel": backtest.columns()}, risk=0.01)
+    portfolio.stats()
+    portfolio.mark_to_market(prices)  # equity with open positions marked
+"""
+
+from typing import Dict, List, Optional, Union
+import numpy as np
+import pandas as pd
+from .columnar import ColumnarRun, NONE, closes
+from .times import to_ns
+
+
+def _events(run: ColumnarRun, partials: List[float] = None, ignore: List[str] = None) -> dict:
+    """Events of a run, not sorted: time (ns), position, fraction opened
+    (> 0) or closed (< 0), and R realized"""
+
+    c = closes(run, partials, ignore)
+    o = run.orders
+    exec_time = o["exec_time"][c.rows]
+    is_entered = o["exec_time"][run.first[:-1]] != NONE
+    entered = np.flatnonzero(is_entered)
+
+    # partials closed before the first stop
+    before = (c.rank < c.first_stop[c.position]) & is_entered[c.position]
+    # the first stop closes what's left, at a loss only if it's first
+    stopped = np.flatnonzero(c.stopped & is_entered)
+    stop_row = c.first_row[stopped] + c.first_stop[stopped]
+    stop_r = np.where(c.first_stop[stopped] == 0, c.r[stop_row], 0.0)
+    # what's still open gets closed at the end of period
+    eop = np.flatnonzero((c.open_at_eop | (c.counts == 0)) & is_entered)
+    eop_r = np.where(
+        c.counts[eop] == 0, c.eop_r[eop], c.eop_r[eop] * c.left[c.counts[eop]]
+    )
+
+    return dict(
+        time=np.concatenate(
+            [o["exec_time"][run.first[entered]], exec_time[before], exec_time[stop_row], run.eop_time[eop]]
+        ),
+        position=np.concatenate([entered, c.position[before], stopped, eop]),
+        fraction=np.concatenate(
+            [
+                np.full(len(entered), c.left[0]),
+                -c.weights[c.rank[before]],
+                -c.left[c.first_stop[stopped]],
+                -c.left[c.counts[eop]],
+            ]
+        ),
+        r=np.concatenate([np.zeros(len(entered)), c.r[before] * c.weights[c.rank[before]], stop_r, eop_r]),
+    )
+
+
+_EMPTY = dict(
+    time=np.empty(0, dtype=np.int64),
+    position=np.empty(0, dtype=np.int64),
+    fraction=np.empty(0),
+    r=np.empty(0),
+)
+
+
+def drawdown(equity: np.ndarray) -> np.ndarray:
+    """Drawdown from the running peak, as a fraction of it (<= 0)"""
+    return equity / np.maximum.accumulate(equity) - 1
+
+
+def time_under_water(time: np.ndarray, equity: np.ndarray) -> int:
+    """Longest time (ns) from a peak to the next time equity got back to
+    it, or to the end if it never did"""
+
+    if not len(equity):
+        return 0
+    highs = np.flatnonzero(equity >= np.maximum.accumulate(equity))
+    # a spell under water goes from a high to the next one, when there's
+    # something in between (the last one to the end)
+    ends = np.append(highs[1:], len(equity) - 1)
+    under = np.append(np.diff(highs) > 1, highs[-1] < len(equity) - 1)
+    spells = time[ends[under]] - time[highs[under]]
+    return int(spells.max()) if len(spells) else 0
+
+
+class Portfolio:
+    """Positions of one or more runs ({channel: ColumnarRun}, or just a
+    ColumnarRun) traded on one account of the given capital, each risking
+    risk times the equity when it opens (times the capital if not
+    compounding). partials and ignore work like in make_results."""
+
+    def __init__(
+        self,
+        runs: Union[ColumnarRun, Dict[str, ColumnarRun]],
+        risk: float = 0.01,
+        capital: float = 1.0,
+        compounding: bool = True,
+        partials: Optional[List[float]] = None,
+        ignore: Optional[List[str]] = None,
+    ):
+        if isinstance(runs, ColumnarRun):
+            runs = {"": runs}
+        self.runs = runs
+        self.risk = risk
+        self.capital = capital
+
+        # positions of every run, one after the other
+        events, offset = [_EMPTY], 0
+        channel, symbol, side, entry, sl_delta = [], [], [], [], []
+        for name, run in runs.items():
+            e = _events(run, partials, ignore)
+            e["position"] = e["position"] + offset
+            events.append(e)
+            offset += len(run)
+            channel.append(np.full(len(run), name, dtype=object))
+            symbol.append(np.array(run.symbols, dtype=object)[run.symbol] if len(run) else [])
+            side.append(run.side)
+            entry.append(run.entry_values())
+            sl_delta.append(run.sl_delta)
+        self.channel = np.concatenate(channel) if channel else np.empty(0, dtype=object)
+        self.symbol = np.concatenate(symbol).astype(object) if symbol else np.empty(0, dtype=object)
+        self.side = np.concatenate(side).astype(np.float64) if side else np.empty(0)
+        self.entry = np.concatenate(entry) if entry else np.empty(0)
+        self.sl_delta = np.concatenate(sl_delta) if sl_delta else np.empty(0)
+
+        # merged into time order: opens go before closes at the same time,
+        # a position can be closed in the bar it opened in
+        e = {k: np.concatenate([x[k] for x in events]) for k in _EMPTY}
+        order = np.lexsort((e["fraction"] <= 0, e["time"]))
+        self.time = e["time"][order].astype(np.int64)
+        self.position = e["position"][order].astype(np.int64)
+        self.fraction = e["fraction"][order]
+        self.r = e["r"][order]
+        self.opens = self.fraction > 0
+
+        self.risked = self._size(compounding)
+        self.pnl = self.r * self.risked[self.position]
+        self.equity = capital + np.cumsum(self.pnl)
+
+        # what's open after each event
+        _, from_end = np.unique(self.position[::-1], return_index=True)
+        is_last = np.zeros(len(self.time), dtype=np.int64)
+        is_last[len(self.time) - 1 - from_end] = 1
+        self.open_positions = np.cumsum(self.opens.astype(np.int64) - is_last)
+        self.open_risk = np.cumsum(self.fraction * self.risked[self.position])
+
+    def _size(self, compounding: bool) -> np.ndarray:
+        """Money a position loses on -1R"""
+        n = len(self.entry)
+        if not compounding:
+            return np.full(n, self.risk * self.capital)
+
+        # each position's size depends on what the ones before it made,
+        # the one part that has to go event by event
+        risked = [0.0] * n
+        equity = self.capital
+        for opens, j, r in zip(self.opens.tolist(), self.position.tolist(), self.r.tolist()):
+            if opens:
+                risked[j] = self.risk * equity
+            else:
+                equity += r * risked[j]
+        return np.array(risked, dtype=np.float64)
+
+    def curve(self) -> pd.DataFrame:
+        """Equity, drawdown and exposure after every event"""
+        return pd.DataFrame(
+            dict(
+                time=pd.to_datetime(self.time, unit="ns", utc=True),
+                channel=self.channel[self.position],
+                symbol=self.symbol[self.position],
+                r=self.r,
+                pnl=self.pnl,
+                equity=self.equity,
+                drawdown=drawdown(self.equity),
+                open_positions=self.open_positions,
+                open_risk=self.open_risk,
+            )
+        )
+
+    def mark_to_market(self, prices: Dict[str, pd.DataFrame], every: str = "1h") -> pd.DataFrame:
+        """Equity every `every`, with the open positions marked at the
+        close of the last bar of their symbol that opened before then
+        (prices has the bars of every symbol, e.g. H1 from a HistoryStore).
+
+        Marking doesn't go position by position: the open P/L of a symbol
+        is price * sum(size / sl delta) - sum(size / sl delta * entry) over
+        its open positions, and both sums only change on events."""
+
+        if not len(self.time):
+            return pd.DataFrame(dict(time=[], equity=[], drawdown=[]))
+        grid = to_ns(
+            pd.date_range(
+                pd.Timestamp(self.time[0], tz="UTC").floor(every),
+                pd.Timestamp(self.time[-1], tz="UTC"),
+                freq=every,
+            )
+        )
+        grid = np.union1d(grid, self.time[-1:])
+
+        # realized equity up to (and including) each grid time
+        k = np.searchsorted(self.time, grid, side="right") - 1
+        equity = np.where(k >= 0, self.equity[np.maximum(k, 0)], self.capital)
+
+        # exposure per unit of price of every event's position
+        weight = (
+            self.side[self.position] * self.fraction * self.risked[self.position]
+            / self.sl_delta[self.position]
+        )
+        symbols = self.symbol[self.position]
+        for name in np.unique(symbols):
+            mine = symbols == name
+            a = np.cumsum(weight[mine])
+            b = np.cumsum(weight[mine] * self.entry[self.position[mine]])
+            # what's open, apart from its side: a long and a short can
+            # cancel out in a and still be worth something
+            size = np.cumsum(self.fraction[mine])
+            k = np.searchsorted(self.time[mine], grid, side="right") - 1
+            bars = prices[name]
+            bar_times = to_ns(bars["time"])
+            i = np.searchsorted(bar_times, grid, side="left") - 1
+            close = np.where(i >= 0, bars["close"].to_numpy()[np.maximum(i, 0)], np.nan)
+            open_pl = np.where(k >= 0, close * a[np.maximum(k, 0)] - b[np.maximum(k, 0)], 0.0)
+            # nothing open is worth nothing, whatever the price
+            equity = equity + np.where(size[np.maximum(k, 0)] > 1e-12, np.nan_to_num(open_pl), 0.0)
+
+        return pd.DataFrame(
+            dict(
+                time=pd.to_datetime(grid, unit="ns", utc=True),
+                equity=equity,
+                drawdown=drawdown(equity),
+            )
+        )
+
+    def stats(self) -> dict:
+        dd = drawdown(self.equity) if len(self.equity) else np.zeros(1)
+        return dict(
+            positions=len(self.entry),
+            final_equity=float(self.equity[-1]) if len(self.equity) else self.capital,
+            total_return=float(self.equity[-1] / self.capital - 1) if len(self.equity) else 0.0,
+            max_drawdown=float(dd.min()),
+            time_under_water=pd.Timedelta(time_under_water(self.time, self.equity)),
+            max_open_positions=int(self.open_positions.max()) if len(self.time) else 0,
+            max_open_risk=float(self.open_risk.max()) if len(self.time) else 0.0,
+        )
@@ -1,72 +1,297 @@
-import hermes
 import json
+import os
+import re
+import pickle
+import sqlite3
+import hashlib
 import pytz
 import pandas as pd
-from typing import List
-from flatten_json import flatten
-import arrow
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from importlib import metadata
+from itertools import islice
 import logging
+from .instrument import Instrument, NULL
 
-logging.basicConfig()
 log = logging.getLogger(__name__)
-log.setLevel(logging.DEBUG)
+
+DEFAULT_CACHE_ROOT = os.path.join(
+    os.path.expanduser("~"), ".signals-backtesting", "interpretations"
+)
+
+
+def _hermes():
+    # slow to import, and only needed for what the cache doesn't have
+    import hermes
+
+    return hermes
+
+
+def hermes_version() -> str:
+    try:
+        return metadata.version("hermes")
+    except metadata.PackageNotFoundError:
+        return getattr(_hermes(), "__version__", None) or "unknown"
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+def _interpret(text: str) -> tuple:
+    """("ok", interpretation) or ("error", message), picklable either way"""
+    hermes = _hermes()
+    try:
+        return ("ok", hermes.interpret(text))
+    except hermes.TooManyFeatures as error:
+        return ("error", repr(error))
+
+
+class InterpretationCache:
+    """On-disk cache of hermes interpretations, keyed by a hash of the
+    message text. Each hermes version gets its own file, so upgrading
+    hermes starts from an empty cache. root defaults to DEFAULT_CACHE_ROOT
+    (in the home folder). Close it when done, or use it as a context
+    manager."""
+
+    def __init__(self, root: Optional[str] = None, version: Optional[str] = None):
+        root = root if root is not None else DEFAULT_CACHE_ROOT
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"hermes-{version or hermes_version()}.sqlite")
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS interpretations (key TEXT PRIMARY KEY, value BLOB)"
+        )
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, tuple]:
+        keys = list(keys)
+        found = dict()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            rows = self.conn.execute(
+                "SELECT key, value FROM interpretations WHERE key IN (%s)"
+                % ",".join("?" * len(chunk)),
+                chunk,
+            )
+            found.update((key, pickle.loads(value)) for key, value in rows)
+        return found
+
+    def put_many(self, items: Dict[str, tuple]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO interpretations VALUES (?, ?)",
+                [(key, pickle.dumps(value)) for key, value in items.items()],
+            )
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Message(NamedTuple):
+    Index: int
+    time: pd.Timestamp
+    text: str
+    id: Optional[int] = None
+
+
+# messages read (and their times localized) at a time
+INGEST_CHUNK = 1000
+
+MESSAGES_START = re.compile(r'"messages"\s*:\s*\[')
+
+
+def iter_json_messages(f, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """Yields the objects of the "messages" array of a telegram export one
+    at a time, reading the file in chunks instead of all at once"""
+
+    decoder = json.JSONDecoder()
+    buf = ""
+
+    # finds where the messages start
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+        match = MESSAGES_START.search(buf)
+        if match:
+            pos = match.end()
+            break
+        # keeps a tail, the key might be split between chunks
+        buf = buf[-32:]
+
+    while True:
+        # skips separators
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            if pos == len(buf):
+                raise json.JSONDecodeError("need more data", buf, pos)
+            message, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield message
+
+        # drops what has been read already every now and then
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+def message_text(message: dict) -> str:
+    """Joins the text of a message, which telegram splits into a list of
+    strings and entities ({"type": "bold", "text": ...}) when formatted"""
+    text = message.get("text", "")
+    if isinstance(text, str):
+        return text.strip()
+    parts = [t if isinstance(t, str) else t.get("text", "") for t in text]
+    return " ".join(part for part in parts if part).strip()
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 class TelegramChatPreprocessor:
-    def __init__(self, tz_messages=pytz.timezone("Europe/Rome")):
+    def __init__(self, tz_messages=pytz.timezone("Europe/Rome"), instrument: Instrument = NULL):
         self.tz_messages = tz_messages
+        self.instrument = instrument
 
-    def prepare_json(self, json_path: str) -> List[tuple]:
-        """Takes in a the messy telegram json, flatten it and keep relevant data"""
+    def iter_json(self, json_path: str) -> Iterator[Message]:
+        """Streams the relevant data out of the messy telegram json, one
+        message at a time, so memory stays flat whatever the export size"""
 
         with open(json_path, "r", encoding="utf8") as f:
-            data = json.loads(f.read())
+            # drops empty messages
+            texts = ((m, text) for m in iter_json_messages(f) if (text := message_text(m)) != "")
+            index = 0
+            for chunk in _chunks(texts, INGEST_CHUNK):
+                # localized a chunk at a time, not message by message
+                times = pd.to_datetime([m["date"] for m, _ in chunk], format="ISO8601")
+                times = times.tz_localize(self.tz_messages)
+                for (message, text), time in zip(chunk, times):
+                    yield Message(index, time, text, message.get("id"))
+                    index += 1
 
-        # use flatten module to unnest values
-        raw_data = [flatten(d) for d in data["messages"]]
+    def prepare_json(self, json_path: str) -> List[Message]:
+        """Takes in a the messy telegram json and keeps relevant data"""
+        return list(self.iter_json(json_path))
 
-        # it's easier to manipulate with pandas
-        df = pd.DataFrame(raw_data)
+    def interpret(
+        self,
+        texts: Iterable[str],
+        workers: Optional[int] = None,
+        cache: Optional[InterpretationCache] = None,
+        executor: Optional[Executor] = None,
+    ) -> Dict[str, tuple]:
+        """Interprets every distinct text once, skipping the ones already
+        in the cache and spreading the rest over a process pool"""
 
-        # merges different nesting-level texts
-        text_cols = df.columns.intersection(
-            [f"text_{i}" for i in range(0, 100)]
-            + [f"text_{i}_text" for i in range(0, 100)]
-        )
+        texts = {text_key(text): text for text in texts}
+        results = cache.get_many(texts) if cache is not None else dict()
+        missing = {key: text for key, text in texts.items() if key not in results}
+        log.debug("%d interpretations cached, %d to go", len(results), len(missing))
+        self.instrument.count("interpretation cache hits", len(results))
+        self.instrument.count("interpretations", len(missing))
+
+        if executor is None and workers is not None and workers > 1 and len(missing) > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            pool = nullcontext(executor)
+
+        with pool as executor, self.instrument.stage("hermes", texts=len(missing)):
+            if executor is not None:
+                chunksize = max(1, len(missing) // 64)
+                fresh = dict(zip(missing, executor.map(_interpret, missing.values(), chunksize=chunksize)))
+            else:
+                fresh = {key: _interpret(text) for key, text in missing.items()}
+
+        if cache is not None and fresh:
+            cache.put_many(fresh)
+        results.update(fresh)
+        return results
+
+    def iter_preprocess(
+        self,
+        data: Iterable[Message],
+        workers: Optional[int] = None,
+        cache: Optional[InterpretationCache] = None,
+        chunksize: int = 5000,
+    ) -> Iterator[dict]:
+        """Interprets messages as they come, a chunk at a time"""
+
+        if workers is not None and workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            pool = nullcontext()
+
+        errors = 0
+        with pool as executor:
+            for chunk in _chunks(data, chunksize):
+                texts = (piece.text for piece in chunk)
+                interpretations = self.interpret(texts, cache=cache, executor=executor)
+
+                for piece in chunk:
+                    new_piece = dict(
+                        id=piece.Index,
+                        time=piece.time,
+                        text=piece.text,
+                        message_id=piece.id,
+                    )
+                    status, value = interpretations[text_key(piece.text)]
+                    if status == "error":
+                        errors += 1
+                        log.debug("message %s not interpreted: %s", piece.id, value)
+                        continue
+                    new_piece['interpretation'] = value
+                    yield new_piece
+
+        if errors:
+            log.warning("%d messages could not be interpreted", errors)
+
+    def preprocess(
+        self,
+        data: Iterable[Message],
+        to: str = None,
+        workers: Optional[int] = None,
+        cache: Optional[InterpretationCache] = None,
+    ) -> List[dict]:
+        return list(self.iter_preprocess(data, workers, cache))
 
-        df["agg_text"] = (
-            df.text.fillna("").str.cat(df[text_cols].fillna(""), sep=" ").str.strip()
-        )
 
-        # drops empty rows
-        df.drop(df[df["agg_text"].str.strip() == ""].index, inplace=True)
-
-        # last fix-ups
-        df["text"] = df["agg_text"]
-        df["time"] = pd.to_datetime(df["date"]).dt.tz_localize(self.tz_messages)
-
-        df.reset_index(inplace=True, drop=True)
-
-        # the python dict is a bit faster to iterate over
-        return list(df[["time", "text"]].itertuples())
-
-    def preprocess(self, data: List[tuple], to: str = None) -> List[dict]:
-        result = list()
-        for piece in data:
-            new_piece = dict(id=piece.Index, time=arrow.get(piece.time), text=piece.text)
-            try:
-                new_piece['interpretation'] = hermes.interpret(piece.text)
-                result.append(new_piece)
-            except hermes.TooManyFeatures as error:
-                log.warning(f'{error=}')
-                continue
-        return result
-
-def preprocess(json_path, tz_messages=pytz.timezone("Europe/Rome")):
-    prep = TelegramChatPreprocessor()
-    data = prep.prepare_json(json_path)
-    processed = prep.preprocess(data)
-    # this only keeps signals that have a flag
-    r = [{k:v for k,v in d.items()} for d in processed if 'flag' in d['interpretation']]
+def preprocess(
+    json_path,
+    tz_messages=pytz.timezone("Europe/Rome"),
+    workers: Optional[int] = None,
+    cache: Optional[InterpretationCache] = None,
+    instrument: Instrument = NULL,
+):
+    prep = TelegramChatPreprocessor(tz_messages, instrument)
+    data = prep.iter_json(json_path)
+    # the default cache is only open for this export
+    with nullcontext(cache) if cache is not None else InterpretationCache() as cache:
+        processed = prep.iter_preprocess(data, workers=workers, cache=cache)
+        # this only keeps signals that have a flag
+        r = [{k:v for k,v in d.items()} for d in processed if 'flag' in d['interpretation']]
     return r
 
 
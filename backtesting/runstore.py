@@ -0,0 +1,59 @@
+"""Persistent record of a channel's previous runs, so that a refresh only
+has to deal with what changed since.
+
+Messages are stored by telegram id together with a hash of their text
+(edited messages get interpreted again), and finished positions by a
+hash of their signal, their updates and the run parameters."""
+
+import os
+import pickle
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class RunStore:
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages "
+                "(id INTEGER PRIMARY KEY, text_key TEXT, piece BLOB)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS positions (key TEXT PRIMARY KEY, rows BLOB)"
+            )
+
+    def messages(self) -> Dict[int, Tuple[str, Optional[dict]]]:
+        """{message id: (text key, preprocessed piece or None)}"""
+        rows = self.conn.execute("SELECT id, text_key, piece FROM messages")
+        return {id_: (key, pickle.loads(piece)) for id_, key, piece in rows}
+
+    def put_messages(self, items: Iterable[Tuple[int, str, Optional[dict]]]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?)",
+                [(id_, key, pickle.dumps(piece)) for id_, key, piece in items],
+            )
+
+    def positions(self) -> Dict[str, List[dict]]:
+        """{position key: result rows}"""
+        rows = self.conn.execute("SELECT key, rows FROM positions")
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def put_positions(self, items: Dict[str, List[dict]]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO positions VALUES (?, ?)",
+                [(key, pickle.dumps(rows)) for key, rows in items.items()],
+            )
+
+    def keep_positions(self, keys: Iterable[str]):
+        """Forgets every position that is not in keys"""
+        keys = set(keys)
+        stale = [key for key in self.positions() if key not in keys]
+        with self.conn:
+            self.conn.executemany("DELETE FROM positions WHERE key = ?", [(k,) for k in stale])
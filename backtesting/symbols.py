@@ -0,0 +1,250 @@
+"""Symbols positions are made of, one object per name for the whole
+process.
+
+A channel's "GJ" and "gbpjpy" both become GBPJPY through the aliases,
+and the first time a symbol comes up its specs (tick size, digits) are
+read from the terminal and kept in a json file next to the history, so
+making positions doesn't go to the terminal again for them, and works
+without one once every symbol has been seen. Stored specs are never
+read again from the terminal on their own, refresh (or forget) them
+when the broker changes one.
+
+    symbols.get("GJ")  # Symbol('GBPJPY'), with .info.trade_tick_size
+
+Positions get theirs from the process-wide registry, set_registry
+swaps it (for another file, other aliases, or offline)."""
+
+import json
+import math
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".signals-backtesting", "symbols.json")
+
+# short names channels use, on top of the names themselves
+DEFAULT_ALIASES = {
+    "EU": "EURUSD",
+    "GU": "GBPUSD",
+    "UJ": "USDJPY",
+    "GJ": "GBPJPY",
+    "EJ": "EURJPY",
+    "AU": "AUDUSD",
+    "NU": "NZDUSD",
+    "UC": "USDCAD",
+    "GOLD": "XAUUSD",
+}
+
+
+# a name, and what brokers put after it
+SUFFIX = re.compile(r"([^._]*)(.*)", re.DOTALL)
+
+
+class SymbolMissError(LookupError):
+    pass
+
+
+@dataclass(frozen=True)
+class SymbolSpec:
+    """What positions need of a symbol, none of which changes"""
+
+    name: str
+    trade_tick_size: float
+    digits: int
+
+
+class Symbol:
+    """Stands in for betterMT5's Symbol in positions: name, and the specs
+    as info"""
+
+    __slots__ = ("name", "info")
+
+    def __init__(self, spec: SymbolSpec):
+        self.name = spec.name
+        self.info = spec
+
+    def __repr__(self):
+        return f"Symbol({self.name!r})"
+
+    def __reduce__(self):
+        # the same object again when unpickled in the same process, and
+        # no terminal needed in another one
+        return _restore, (self.info,)
+
+
+def terminal_spec(name: str) -> SymbolSpec:
+    """Specs of a symbol, from the terminal"""
+
+    # only needed on a miss, so offline runs work without it
+    import betterMT5 as mt5
+
+    info = mt5.Symbol(name).info
+    if info is None:
+        raise SymbolMissError(f"{name} isn't a symbol of the terminal")
+    tick_size = float(info.trade_tick_size)
+    digits = getattr(info, "digits", None)
+    if digits is None:
+        digits = max(0, -math.floor(math.log10(tick_size) + 1e-9))
+    return SymbolSpec(name, tick_size, int(digits))
+
+
+class SymbolRegistry:
+    """Interns a Symbol per name. Specs come from path, or from source on
+    a miss (and are saved to path then); offline (or no source) raises
+    SymbolMissError instead. Names and aliases are matched whatever the
+    case."""
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_PATH,
+        source: Optional[Callable[[str], SymbolSpec]] = terminal_spec,
+        offline: bool = False,
+        aliases: Optional[Dict[str, str]] = None,
+    ):
+        self.path = path
+        self.source = source
+        self.offline = offline or source is None
+        self.aliases = {k.upper(): v for k, v in (DEFAULT_ALIASES if aliases is None else aliases).items()}
+        # the ones added with alias, the only ones that get saved
+        self._added = dict()
+        self._symbols = dict()
+        self._specs = None
+        # positions get made on more than one thread, e.g. by the pipeline
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, SymbolSpec]:
+        if self._specs is None:
+            specs = dict()
+            if self.path is not None and os.path.exists(self.path):
+                with open(self.path) as f:
+                    saved = json.load(f)
+                specs = {name: SymbolSpec(**spec) for name, spec in saved["specs"].items()}
+                self._added = saved.get("aliases", {})
+                self.aliases.update(self._added)
+            self._specs = specs
+        return self._specs
+
+    def _save(self):
+        if self.path is None:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(
+                dict(specs={name: asdict(spec) for name, spec in self._specs.items()}, aliases=self._added),
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(tmp, self.path)
+
+    def resolve(self, name: str) -> str:
+        """The name of the symbol name stands for: an alias's symbol, or
+        name in upper case (a broker suffix after a dot or underscore,
+        as in "EURUSD.a", is kept as it is)"""
+        name = name.strip()
+        # saved aliases come with the specs
+        self._load()
+        if name.upper() in self.aliases:
+            return self.aliases[name.upper()]
+        base, suffix = SUFFIX.match(name).groups()
+        return base.upper() + suffix
+
+    def alias(self, name: str, symbol: str):
+        """Makes name stand for symbol from now on (saved with the specs)"""
+        with self._lock:
+            self._load()
+            self.aliases[name.upper()] = self._added[name.upper()] = symbol
+            self._save()
+
+    def put(self, spec: SymbolSpec):
+        """Adds (or replaces) the specs of a symbol"""
+        with self._lock:
+            self._load()[spec.name] = spec
+            self._symbols.pop(spec.name, None)
+            self._save()
+
+    def forget(self, *names: str):
+        """Drops the stored specs of the given symbols (of every one if
+        none is given), the next get asks the source again"""
+        with self._lock:
+            specs = self._load()
+            for name in [self.resolve(name) for name in names] or list(specs):
+                specs.pop(name, None)
+                self._symbols.pop(name, None)
+            self._save()
+
+    def refresh(self, *names: str):
+        """Asks the source again for the specs of the given symbols (of
+        every stored one if none is given), e.g. after the broker changed
+        them. Positions made before keep the Symbol they had."""
+        if self.offline:
+            raise SymbolMissError("can't refresh specs offline")
+        names = [self.resolve(name) for name in names] or list(self._load())
+        fresh = [self.source(name) for name in names]
+        with self._lock:
+            specs = self._load()
+            for spec in fresh:
+                specs[spec.name] = spec
+                self._symbols.pop(spec.name, None)
+            self._save()
+
+    def spec(self, name: str) -> SymbolSpec:
+        return self.get(name).info
+
+    def get(self, name: str) -> Symbol:
+        name = self.resolve(name)
+        symbol = self._symbols.get(name)
+        if symbol is not None:
+            return symbol
+
+        with self._lock:
+            if name in self._symbols:
+                return self._symbols[name]
+            specs = self._load()
+            if name not in specs:
+                if self.offline:
+                    raise SymbolMissError(f"no specs stored for {name}")
+                specs[name] = self.source(name)
+                self._save()
+            symbol = self._symbols[name] = Symbol(specs[name])
+            return symbol
+
+    def _adopt(self, spec: SymbolSpec) -> Symbol:
+        """The Symbol of spec, taking spec as it is if it's a new one"""
+        with self._lock:
+            if spec.name not in self._symbols:
+                self._load().setdefault(spec.name, spec)
+                self._symbols[spec.name] = Symbol(self._specs[spec.name])
+            return self._symbols[spec.name]
+
+
+_registry = None
+
+
+def registry() -> SymbolRegistry:
+    """The process-wide registry"""
+    global _registry
+    if _registry is None:
+        _registry = SymbolRegistry()
+    return _registry
+
+
+def set_registry(new: SymbolRegistry) -> SymbolRegistry:
+    """Replaces the process-wide registry, returns the one it replaced"""
+    global _registry
+    old, _registry = _registry, new
+    return old
+
+
+def get(name: str) -> Symbol:
+    """The Symbol for name (or one of its aliases)"""
+    return registry().get(name)
+
+
+def _restore(spec: SymbolSpec) -> Symbol:
+    return registry()._adopt(spec)
@@ -0,0 +1,60 @@
+"""Local on-disk store for bid/ask ticks, in front of the terminal.
+
+Same layout as the bars of HistoryStore (memory-mapped segments of one
+.npy file per column), with bid and ask instead of OHLC. Ticks are only
+ever needed for the few candles the bars can't settle, so they get
+fetched one candle at a time."""
+
+import os
+import numpy as np
+import pandas as pd
+import logging
+from .history import HistoryStore, HistoryMissError
+
+log = logging.getLogger(__name__)
+
+TICK_COLUMNS = ("time", "bid", "ask")
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".signals-backtesting", "ticks")
+
+# ticks have no timeframe, their folder is named after this
+TICKS = "TICKS"
+
+
+def terminal_tick_source(symbol: str, timeframe, datetime_from, datetime_to) -> pd.DataFrame:
+    """Gets every tick in [datetime_from, datetime_to) from the terminal"""
+
+    # only needed on a cache miss, so offline runs work without it
+    import MetaTrader5
+
+    ticks = MetaTrader5.copy_ticks_range(
+        symbol, datetime_from, datetime_to, MetaTrader5.COPY_TICKS_ALL
+    )
+    if ticks is None:
+        raise HistoryMissError(f"no ticks for {symbol}: {MetaTrader5.last_error()}")
+    ticks = pd.DataFrame(ticks)
+    return pd.DataFrame(
+        dict(
+            time=pd.to_datetime(ticks["time_msc"], unit="ms", utc=True),
+            bid=ticks["bid"].astype(np.float64),
+            ask=ticks["ask"].astype(np.float64),
+        )
+    )
+
+
+class TickStore(HistoryStore):
+    columns = TICK_COLUMNS
+
+    def __init__(self, root: str = DEFAULT_ROOT, source=terminal_tick_source, offline: bool = False):
+        super().__init__(root, source, offline)
+
+    def _forming(self, now: int, timeframe) -> int:
+        # a tick is over as soon as it's there
+        return now
+
+    def put(self, symbol: str, ticks: pd.DataFrame, datetime_from=None, datetime_to=None):
+        super().put(symbol, TICKS, ticks, datetime_from, datetime_to)
+
+    def get(self, symbol: str, datetime_from, datetime_to) -> pd.DataFrame:
+        """Returns the ticks in [datetime_from, datetime_to)"""
+        return super().get(symbol, TICKS, datetime_from, datetime_to)
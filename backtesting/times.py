@@ -0,0 +1,72 @@
+"""The time axis of the backtester: UTC epoch nanoseconds, as plain ints
+(and int64 arrays for columns of them).
+
+Orders, executions and the rates frames all work on it, so comparing or
+searching times never has to go through Arrow or pandas objects. Arrow
+is left at the edges: the times of signals (which keep the timezone of
+the channel, ends of day depend on it) and what gets shown to people."""
+
+from datetime import datetime, timedelta, timezone
+from typing import Union
+import arrow
+import numpy as np
+import pandas as pd
+
+MINUTE = 60 * 10**9
+DAY = 24 * 60 * MINUTE
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_ns(times) -> Union[int, np.ndarray]:
+    """Converts a datetimelike (or a column of them) to UTC epoch
+    nanoseconds. Naive datetimes are taken as UTC, ints as already
+    converted."""
+    if isinstance(times, (int, np.integer)):
+        return int(times)
+    if isinstance(times, pd.Timestamp):
+        return (times if times.tzinfo is not None else times.tz_localize("UTC")).value
+    if isinstance(times, arrow.Arrow):
+        times = times.datetime
+    if isinstance(times, datetime):
+        if times.tzinfo is None:
+            times = times.replace(tzinfo=timezone.utc)
+        return (times - _EPOCH) // _MICROSECOND * 1000
+    if isinstance(times, (pd.Series, pd.Index)) and times.dtype.kind == "M":
+        # already datetime64, e.g. the time column of rates: no parsing,
+        # and tz-aware ones are stored as UTC ns anyway
+        return pd.DatetimeIndex(times).as_unit("ns").asi8
+    if np.ndim(times) == 0:
+        ts = pd.Timestamp(times)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize("UTC")
+        return ts.value
+    return pd.DatetimeIndex(pd.to_datetime(times, utc=True)).as_unit("ns").asi8
+
+
+def timeframe_ns(timeframe) -> int:
+    """Length of a bar of the timeframe (M1, M15, H1, D1, W1...) in ns"""
+    name = getattr(timeframe, "name", str(timeframe))
+    units = dict(M=60, H=3600, D=86400, W=604800)
+    return int(name[1:]) * units[name[0]] * 10**9
+
+
+def bar_open(ns: int, timeframe) -> int:
+    """Open time of the bar of the timeframe that ns falls in"""
+    bar = timeframe_ns(timeframe)
+    # weekly bars open on sundays, the epoch was a thursday
+    offset = 3 * DAY if bar == 7 * DAY else 0
+    return ns - (ns - offset) % bar
+
+
+def to_timestamp(ns: int) -> pd.Timestamp:
+    return pd.Timestamp(int(ns), tz="UTC")
+
+
+def to_arrow(ns: int) -> arrow.Arrow:
+    return arrow.get(to_timestamp(ns).to_pydatetime())
+
+
+def isoformat(ns: int) -> str:
+    return to_timestamp(ns).isoformat()
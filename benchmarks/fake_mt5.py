@@ -0,0 +1,189 @@
+"""Stand-in for betterMT5, for benchmarking on a box without a terminal.
+
+Has the parts of the betterMT5 interface the backtester uses (TIMEFRAME,
+Symbol with info.trade_tick_size and history, connected,
+UnexpectedValueError, are_datetimes_eq), with bars generated as a
+seeded random walk: the same symbol and day always give the same bars,
+whatever range gets asked for. Weekends have no bars, like the real
+market.
+
+    from benchmarks import fake_mt5
+    fake_mt5.install()  # before importing backtesting
+"""
+
+import sys
+import contextlib
+import enum
+import types
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+SEED = 0
+
+# symbol: (first price, tick size)
+SYMBOLS = {
+    "EURUSD": (1.13000, 0.00001),
+    "GBPUSD": (1.35000, 0.00001),
+    "USDJPY": (115.000, 0.001),
+    "GBPJPY": (154.700, 0.001),
+    "EURJPY": (130.000, 0.001),
+    "XAUUSD": (1800.00, 0.01),
+}
+
+# bars are generated from this day on
+EPOCH = pd.Timestamp("2021-01-01", tz="UTC")
+
+
+class TIMEFRAME(enum.Enum):
+    M1 = 1
+    M5 = 5
+    M15 = 15
+    M30 = 30
+    H1 = 60
+    H4 = 240
+    D1 = 1440
+
+
+class UnexpectedValueError(Exception):
+    def __init__(self, *args, diff=None, rates=None):
+        super().__init__(*args)
+        self.diff = diff
+        self.rates = rates
+
+
+def are_datetimes_eq(a: datetime, b: datetime, window: int = 60) -> bool:
+    return abs((a - b).total_seconds()) <= window
+
+
+@contextlib.contextmanager
+def connected(*args, **kwargs):
+    yield
+
+
+def _timestamp(time) -> pd.Timestamp:
+    time = pd.Timestamp(getattr(time, "datetime", time))
+    return time.tz_localize("UTC") if time.tzinfo is None else time.tz_convert("UTC")
+
+
+_days = dict()
+
+
+def _day(symbol: str, day: int) -> Optional[pd.DataFrame]:
+    """M1 bars of the day-th day since EPOCH (None on weekends)"""
+
+    key = (symbol, day)
+    if key in _days:
+        return _days[key]
+
+    start = EPOCH + timedelta(days=day)
+    if start.weekday() >= 5:
+        _days[key] = None
+        return None
+
+    first, tick = SYMBOLS[symbol]
+    symbol_seed = sum(map(ord, symbol))
+
+    # the day opens on a walk of daily steps, so days line up roughly
+    daily = np.random.default_rng([SEED, symbol_seed]).normal(0, 300, day + 1)
+    open_ = first + daily.sum() * tick
+
+    rng = np.random.default_rng([SEED, symbol_seed, day])
+    steps = rng.integers(-20, 21, 1440)
+    o = np.round(open_ / tick) + np.cumsum(steps)
+    c = o + rng.integers(-20, 21, 1440)
+    h = np.maximum(o, c) + rng.integers(0, 15, 1440)
+    l = np.minimum(o, c) - rng.integers(0, 15, 1440)
+
+    bars = pd.DataFrame(
+        dict(
+            time=pd.date_range(start, periods=1440, freq="min"),
+            open=o * tick,
+            high=h * tick,
+            low=l * tick,
+            close=c * tick,
+            tick_volume=rng.integers(1, 200, 1440),
+        )
+    )
+    _days[key] = bars
+    return bars
+
+
+def _m1(symbol: str, datetime_from: pd.Timestamp, datetime_to: pd.Timestamp) -> pd.DataFrame:
+    first = max((datetime_from - EPOCH).days, 0)
+    last = (datetime_to - EPOCH).days
+    days = [_day(symbol, d) for d in range(first, last + 1)]
+    days = [d for d in days if d is not None]
+    if not days:
+        return pd.DataFrame(
+            dict(
+                time=pd.DatetimeIndex([], tz="UTC"),
+                **{col: np.empty(0) for col in ("open", "high", "low", "close")},
+                tick_volume=np.empty(0, dtype=np.int64),
+            )
+        )
+    bars = pd.concat(days, ignore_index=True)
+    return bars[(bars.time >= datetime_from) & (bars.time < datetime_to)]
+
+
+def _resample(bars: pd.DataFrame, timeframe: TIMEFRAME) -> pd.DataFrame:
+    if timeframe == TIMEFRAME.M1 or not len(bars):
+        return bars
+    grouped = bars.set_index("time").resample(f"{timeframe.value}min")
+    return pd.concat(
+        [
+            grouped["open"].first(),
+            grouped["high"].max(),
+            grouped["low"].min(),
+            grouped["close"].last(),
+            grouped["tick_volume"].sum(),
+        ],
+        axis=1,
+    ).dropna().reset_index()
+
+
+class Symbol:
+    def __init__(self, name: str):
+        if name not in SYMBOLS:
+            raise ValueError(f"unknown symbol {name!r}, see SYMBOLS")
+        self.name = name
+        tick_size = SYMBOLS[name][1]
+        self.info = types.SimpleNamespace(
+            name=name, trade_tick_size=tick_size, digits=round(-np.log10(tick_size))
+        )
+
+    def __repr__(self):
+        return f"Symbol({self.name!r})"
+
+    def _bars(self, timeframe, datetime_from: pd.Timestamp, datetime_to: pd.Timestamp) -> pd.DataFrame:
+        """Bars opening in [datetime_from, datetime_to), each one made of
+        all of its M1 bars, wherever the range starts and ends"""
+        step = f"{timeframe.value}min"
+        bars = _resample(_m1(self.name, datetime_from.floor(step), datetime_to.ceil(step)), timeframe)
+        return bars[(bars.time >= datetime_from) & (bars.time < datetime_to)]
+
+    def history(self, timeframe, datetime_from=None, datetime_to=None, count=None, include_last=True):
+        datetime_from = _timestamp(datetime_from)
+        if count is not None:
+            # a week is enough to get over any weekend
+            bars = self._bars(timeframe, datetime_from, datetime_from + timedelta(days=7))
+            return bars.iloc[:count].reset_index(drop=True)
+
+        datetime_to = _timestamp(datetime_to)
+        bars = self._bars(timeframe, datetime_from, datetime_to)
+        if include_last:
+            bars = pd.concat([bars, self.history(timeframe, datetime_to, count=1)])
+        return bars.reset_index(drop=True)
+
+
+def install(force: bool = False):
+    """Makes `import betterMT5` give this module, unless the real one is
+    there (or force)"""
+    if not force:
+        try:
+            import betterMT5  # noqa: F401
+            return
+        except ImportError:
+            pass
+    sys.modules["betterMT5"] = sys.modules[__name__]
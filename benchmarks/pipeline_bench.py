@@ -0,0 +1,200 @@
+"""End-to-end benchmark of the backtesting pipeline on a synthetic export,
+with bars from fake_mt5 (and synthetic.interpret standing in for hermes
+when it isn't installed). Times each stage, with throughput and peak
+memory, and compares against a saved baseline, e.g.
+
+    python -m benchmarks.pipeline_bench --signals 2000 --save
+    python -m benchmarks.pipeline_bench --signals 2000 --compare
+
+--compare exits with 1 when a stage got slower than the baseline by more
+than --tolerance. Baselines only mean something on the machine they
+were saved on, so they aren't checked in."""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from . import fake_mt5, synthetic
+
+# before backtesting imports them
+fake_mt5.install()
+synthetic.install_interpreter()
+
+from backtesting import backtesting as bt, symbols  # noqa: E402
+from backtesting.history import HistoryStore  # noqa: E402
+from backtesting.preprocessing import InterpretationCache, TelegramChatPreprocessor  # noqa: E402
+
+STAGES = ("prepare_json", "preprocess", "make_positions", "run (cold store)", "run", "make_results")
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def pipeline(path: str, workdir: str, clock) -> dict:
+    """Goes through every stage once, returns what each one went through
+    (messages or positions); clock(stage) is entered around each stage"""
+
+    b = bt.Backtest(verbose=None, history=HistoryStore(os.path.join(workdir, "history")))
+    prep = TelegramChatPreprocessor()
+    items = dict()
+
+    with clock("prepare_json"):
+        data = prep.prepare_json(path)
+    items["prepare_json"] = len(data)
+
+    with clock("preprocess"):
+        cache = InterpretationCache(os.path.join(workdir, "interpretations"))
+        signals = [d for d in prep.preprocess(data, cache=cache) if "flag" in d["interpretation"]]
+    items["preprocess"] = len(data)
+
+    # runs change the positions, so each one needs its own; the last
+    # make_positions is the one that counts
+    for stage in ("run (cold store)", "run"):
+        with clock("make_positions"):
+            b.trades = bt.make_positions(signals)
+        with clock(stage):
+            b.run()
+        items[stage] = len(b.trades)
+    items["make_positions"] = len(signals)
+
+    with clock("make_results"):
+        b.make_results(b.run_results)
+    items["make_results"] = len(b.trades)
+    return items
+
+
+class Timer:
+    def __init__(self):
+        self.seconds = dict()
+
+    def __call__(self, stage: str):
+        self._stage = stage
+        return self
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.seconds[self._stage] = time.perf_counter() - self._start
+
+
+class PeakMemory:
+    def __init__(self):
+        self.peaks = dict()
+
+    def __call__(self, stage: str):
+        self._stage = stage
+        return self
+
+    def __enter__(self):
+        tracemalloc.start()
+
+    def __exit__(self, *exc):
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.peaks[self._stage] = peak
+
+
+def measure(signals: int, seed: int = 0, repeat: int = 3) -> dict:
+    """Best time of repeat passes per stage, plus the peak memory of one
+    more pass under tracemalloc (which slows it down too much to time)"""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.json")
+        messages = synthetic.make_export(path, signals, seed)
+        # specs of the fake symbols stay out of the real registry
+        symbols.set_registry(symbols.SymbolRegistry(os.path.join(tmp, "symbols.json")))
+
+        best = dict()
+        for k in range(repeat):
+            timer = Timer()
+            items = pipeline(path, os.path.join(tmp, f"pass{k}"), timer)
+            for stage, seconds in timer.seconds.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+
+        memory = PeakMemory()
+        pipeline(path, os.path.join(tmp, "memory"), memory)
+
+    return dict(
+        signals=signals,
+        seed=seed,
+        messages=messages,
+        stages={
+            stage: dict(
+                seconds=best[stage],
+                items=items[stage],
+                per_second=items[stage] / best[stage] if best[stage] else float("inf"),
+                peak_mb=memory.peaks[stage] / 2**20,
+            )
+            for stage in STAGES
+        },
+    )
+
+
+def regressions(result: dict, baseline: dict, tolerance: float, floor: float = 0.01) -> list:
+    """Stages slower than the baseline by more than tolerance (0.25 is
+    25%), leaving out the ones that take less than floor seconds, which
+    are mostly noise"""
+    slower = []
+    for stage, now in result["stages"].items():
+        before = baseline["stages"].get(stage)
+        if not before or max(now["seconds"], before["seconds"]) < floor:
+            continue
+        if now["seconds"] > before["seconds"] * (1 + tolerance):
+            slower.append((stage, before["seconds"], now["seconds"]))
+    return slower
+
+
+def report(result: dict, baseline: dict = None):
+    print(f"{result['signals']} signals, {result['messages']} messages (seed {result['seed']})")
+    print(f"{'stage':<18}{'seconds':>10}{'items/s':>12}{'peak MB':>10}{'vs baseline':>14}")
+    for stage, r in result["stages"].items():
+        versus = ""
+        if baseline and stage in baseline["stages"]:
+            versus = f"{r['seconds'] / baseline['stages'][stage]['seconds']:>13.2f}x"
+        print(f"{stage:<18}{r['seconds']:>10.3f}{r['per_second']:>12.0f}{r['peak_mb']:>10.1f}{versus}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signals", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="save the numbers as the baseline")
+    parser.add_argument("--compare", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    result = measure(args.signals, args.seed, args.repeat)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["signals"], baseline["seed"]) != (args.signals, args.seed):
+            print(f"baseline is for {baseline['signals']} signals (seed {baseline['seed']}), not comparing")
+            baseline = None
+
+    report(result, baseline)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved to {args.baseline}")
+
+    if args.compare:
+        if baseline is None:
+            print("nothing to compare against")
+            return 1
+        slower = regressions(result, baseline, args.tolerance)
+        for stage, before, now in slower:
+            print(f"{stage} regressed: {before:.3f}s -> {now:.3f}s")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""Micro-benchmarks for Price and Pips. Prints the cost of each operation
+in nanoseconds, e.g.
+
+    python -m benchmarks.price_bench
+"""
+
+import timeit
+from backtesting.classes.price import Price, Pips, candle_mean
+
+TICK_SIZE = 0.001
+
+CASES = {
+    "Price from str": lambda: Price("154.700", TICK_SIZE),
+    "Price from float": lambda: Price(154.7, TICK_SIZE),
+    "Price from candle mean": lambda: Price(candle_mean(CANDLE), TICK_SIZE),
+    "Price - Price": lambda: P1 - P2,
+    "Price + Pips": lambda: P1 + SPREAD,
+    "Price.value": lambda: P1.value,
+    # what has_candle_hit does for every candle of a stop order
+    "stop check": lambda: Price(Price(155.120, TICK_SIZE) - SPREAD, TICK_SIZE) - P1 >= 0,
+}
+
+CANDLE = {"high": 155.120, "low": 154.980}
+P1 = Price("154.700", TICK_SIZE)
+P2 = Price("154.500", TICK_SIZE)
+SPREAD = Pips(1, TICK_SIZE)
+
+
+def run(number: int = 100_000, repeat: int = 5) -> dict:
+    """Best time per call of each case, in ns"""
+    return {
+        name: min(timeit.repeat(case, number=number, repeat=repeat)) / number * 1e9
+        for name, case in CASES.items()
+    }
+
+
+def main():
+    for name, ns in run().items():
+        print(f"{name:<24}{ns:>8.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
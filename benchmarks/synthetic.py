@@ -0,0 +1,191 @@
+"""Synthetic Telegram exports, for benchmarking.
+
+make_export writes a channel export shaped like the real ones (signals,
+follow-up updates and chatter, some of it as rich text) with prices
+taken from fake_mt5, so entries, stop losses and take profits sit where
+the bars actually are.
+
+interpret is a stand-in for hermes that only understands the messages
+made here, for boxes where hermes isn't installed; with it the
+preprocess stage measures everything but the interpreter itself."""
+
+import sys
+import json
+import re
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pytz
+from . import fake_mt5
+
+__version__ = "synthetic"
+
+ALIASES = {
+    "GJ": "GBPJPY",
+    "GU": "GBPUSD",
+    "EU": "EURUSD",
+    "UJ": "USDJPY",
+    "EJ": "EURJPY",
+    "GOLD": "XAUUSD",
+}
+
+CHATTER = [
+    "Good morning traders",
+    "Market is slow today, be patient",
+    "Another great week, well done everyone",
+    "Remember to manage your risk",
+]
+
+TZ_MESSAGES = pytz.timezone("Europe/Rome")
+
+
+class TooManyFeatures(Exception):
+    pass
+
+
+def _price(value: float, tick_size: float) -> str:
+    digits = round(-np.log10(tick_size))
+    return f"{value:.{digits}f}"
+
+
+def messages(signals: int, seed: int = 0, start: str = "2022-01-03") -> list:
+    """Messages of an export with the given number of signals, a few a
+    day on weekdays, each followed by some updates"""
+
+    rng = np.random.default_rng(seed)
+    day = pd.Timestamp(start, tz="UTC")
+    out = []
+
+    def message(time: pd.Timestamp, text):
+        out.append(
+            dict(
+                id=len(out) + 1,
+                type="message",
+                date=time.tz_convert(TZ_MESSAGES).strftime("%Y-%m-%dT%H:%M:%S"),
+                text=text,
+            )
+        )
+
+    made = 0
+    while made < signals:
+        if day.weekday() < 5:
+            times = sorted(rng.integers(7 * 3600, 16 * 3600, min(3, signals - made)))
+            for seconds in times:
+                time = day + timedelta(seconds=int(seconds))
+                alias = list(ALIASES)[rng.integers(len(ALIASES))]
+                symbol = fake_mt5.Symbol(ALIASES[alias])
+                tick = symbol.info.trade_tick_size
+                bar = symbol.history(fake_mt5.TIMEFRAME.M1, time, count=1)
+                price = float(bar["close"].iloc[0])
+
+                side = 1 if rng.random() < 0.5 else -1
+                pip = tick * 10
+                market = rng.random() < 0.3
+                entry = price - side * pip * rng.integers(2, 15)
+                e = price if market else entry
+                sl = e - side * pip * rng.integers(15, 40)
+                tp = e + side * pip * rng.integers(15, 60)
+
+                lines = [
+                    "Pair: ",
+                    dict(type="bold", text=alias),
+                    f"\nSide: {'buys' if side > 0 else 'sells'}\n",
+                ]
+                if not market:
+                    lines.append(f"Entry: {_price(entry, tick)}\n")
+                lines.append(f"Stop Loss: {_price(sl, tick)}\nTP: {_price(tp, tick)}")
+                message(time, lines)
+                made += 1
+
+                later = time
+                for _ in range(rng.integers(0, 4)):
+                    later += timedelta(minutes=int(rng.integers(5, 90)))
+                    kind = rng.integers(4)
+                    if kind == 0:
+                        tp2 = tp + side * pip * rng.integers(5, 30)
+                        message(later, f"TP 2 {_price(tp2, tick)}")
+                    elif kind == 1:
+                        message(later, "Move SL to breakeven")
+                    elif kind == 2:
+                        message(later, "Take partials now")
+                    else:
+                        message(later, "Close now")
+
+                if rng.random() < 0.5:
+                    message(later + timedelta(minutes=1), CHATTER[rng.integers(len(CHATTER))])
+        day += timedelta(days=1)
+
+    return out
+
+
+def make_export(path: str, signals: int, seed: int = 0, start: str = "2022-01-03") -> int:
+    """Writes an export to path, returns the number of messages"""
+    export = dict(
+        name="Synthetic signals",
+        type="private_channel",
+        id=1,
+        messages=messages(signals, seed, start),
+    )
+    with open(path, "w", encoding="utf8") as f:
+        json.dump(export, f, indent=1, ensure_ascii=False)
+    return len(export["messages"])
+
+
+SIGNAL = re.compile(
+    r"Pair:\s*(?P<alias>\w+)\s+Side:\s*(?P<side>\w+)\s+(Entry:\s*(?P<entry>[\d.]+)\s+)?"
+    r"Stop Loss:\s*(?P<sl>[\d.]+)\s+TP:\s*(?P<tp>[\d.]+)"
+)
+UPDATE_TP = re.compile(r"TP \d ([\d.]+)")
+
+
+def interpret(text: str) -> dict:
+    """What hermes makes of the messages above"""
+
+    signal = SIGNAL.search(text)
+    if signal:
+        return dict(
+            flag="POSITION",
+            symbol=ALIASES[signal["alias"]],
+            side=signal["side"],
+            entry=signal["entry"],
+            sl=signal["sl"],
+            tp=signal["tp"],
+        )
+    update = UPDATE_TP.match(text)
+    if update:
+        return dict(flag="UPDATE_TP", tp=update[1])
+    if "breakeven" in text:
+        return dict(flag="UPDATE_BREAKEVEN")
+    if "partials" in text:
+        return dict(flag="UPDATE_PARTIALS")
+    if "Close" in text:
+        return dict(flag="UPDATE_CLOSE")
+    return dict()
+
+
+def signals(count: int, seed: int = 0, start: str = "2022-01-03") -> list:
+    """What preprocessing.preprocess makes of the export make_export
+    writes, read with interpret whether hermes is there or not"""
+
+    from backtesting.preprocessing import message_text
+
+    out = []
+    for message in messages(count, seed, start):
+        text = message_text(message)
+        interpretation = interpret(text)
+        if "flag" in interpretation:
+            time = pd.Timestamp(message["date"]).tz_localize(TZ_MESSAGES)
+            out.append(dict(id=message["id"], time=time, text=text, interpretation=interpretation))
+    return out
+
+
+def install_interpreter(force: bool = False):
+    """Makes `import hermes` give this module, unless the real one is
+    there (or force)"""
+    if not force:
+        try:
+            import hermes  # noqa: F401
+            return
+        except ImportError:
+            pass
+    sys.modules["hermes"] = sys.modules[__name__]
@@ -1,7 +1,12 @@
 import unittest
 import betterMT5 as mt5
 from backtesting import backtesting
+from backtesting.classes.constants import LABEL
+from backtesting.classes.position import PriceNotReasonableError
+from backtesting.times import to_ns
 from datetime import datetime
+import arrow
+import pandas as pd
 
 class TestMT5(unittest.TestCase):
 
@@ -46,6 +51,61 @@ class TestBacktest(unittest.TestCase):
         self.assertTrue(mt5.are_datetimes_eq(close_time, expected, window=120))
 
 
+class TestMarketEntry(unittest.TestCase):
+
+    def setUp(self):
+        with mt5.connected():
+            self.p = backtesting.make_positions([
+                dict(time=arrow.get('2022-02-01T07:00:30+00:00'), text='',
+                     interpretation=dict(flag='POSITION', symbol='GBPJPY', side='buy',
+                                         sl='154.500', tp=['155.200'])),
+                dict(time=arrow.get('2022-02-01T07:30:00+00:00'), text='',
+                     interpretation=dict(flag='UPDATE_BREAKEVEN')),
+            ])[0]
+        self.p.rates = pd.DataFrame(dict(
+            time=pd.date_range('2022-02-01 06:59', periods=3, freq='min', tz='UTC'),
+            open=154.7, high=[154.75, 154.72, 154.8], low=[154.65, 154.68, 154.6], close=154.7))
+
+    def test_entry_is_lazy(self):
+        self.assertIsNone(self.p.entry.execution)
+        self.assertIsNone(self.p.entry.price)
+
+    def test_entry_fills_in_signal_bar(self):
+        self.assertTrue(backtesting.fill_market_entry(self.p))
+        self.assertEqual(self.p.entry.execution.time, to_ns(arrow.get('2022-02-01T07:00:00+00:00')))
+        self.assertAlmostEqual(self.p.entry.price.value, 154.7)
+        self.assertEqual(self.p.get_orders()[-1].price, self.p.entry.price)
+
+    def far_entry(self, sl, tps, update_tp=None):
+        """A market position filled at 154.000, with the sl and tps given
+        and a tp update"""
+        t = arrow.get('2022-02-01T07:00:30+00:00')
+        signals = [dict(time=t, text='', interpretation=dict(
+            flag='POSITION', symbol='GBPJPY', side='buy', sl=sl, tp=tps))]
+        if update_tp is not None:
+            signals.append(dict(time=t.shift(minutes=5), text='',
+                                interpretation=dict(flag='UPDATE_TP', tp=update_tp)))
+        with mt5.connected():
+            p = backtesting.make_positions(signals)[0]
+        p.rates = pd.DataFrame(dict(
+            time=pd.date_range('2022-02-01 07:00', periods=3, freq='min', tz='UTC'),
+            open=154.0, high=154.0, low=154.0, close=154.0))
+        return p
+
+    def test_fill_price_counts_for_signal_prices(self):
+        # the sl is 1.7 below the fill, too far from it
+        p = self.far_entry('152.300', ['153.700'])
+        with self.assertRaises(PriceNotReasonableError):
+            backtesting.fill_market_entry(p)
+
+    def test_fill_price_counts_for_update_prices(self):
+        # in range of the sl and tp, not once the fill is in the mean
+        p = self.far_entry('153.900', ['155.300'], update_tp='156.000')
+        self.assertEqual([o.price.value for o in p.get_orders() if o.name == LABEL.TP], [155.3, 156.0])
+        self.assertTrue(backtesting.fill_market_entry(p))
+        self.assertEqual([o.price.value for o in p.get_orders() if o.name == LABEL.TP], [155.3])
+
+
 if __name__ == "__main__":
     unittest.main()
     
\ No newline at end of file
@@ -0,0 +1,104 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import pandas as pd
+import betterMT5 as mt5
+from backtesting import backtesting, preprocessing
+from backtesting.batch import Batch, channel_names
+from backtesting.history import HistoryStore
+from .drill_down_test import Source
+
+
+class CountingSource(Source):
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return super().__call__(*args)
+
+
+class TestBatch(unittest.TestCase):
+    """Two channels trading the same hours of GBPJPY, a few minutes apart.
+    The cache is filled beforehand, so hermes never gets asked."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.source = CountingSource()
+        self.cache = preprocessing.InterpretationCache(os.path.join(self.root, 'interpretations'))
+        closes = self.source.m1.set_index('time')['close']
+
+        self.exports = dict()
+        for channel, delay in (('first', 0), ('second', 11)):
+            messages, interpretations = [], dict()
+            for k in range(20):
+                time = pd.Timestamp('2022-01-31 07:00', tz='UTC') + pd.Timedelta(minutes=97 * k + delay)
+                if time.hour > 17:
+                    continue
+                sign = 1 if k % 2 else -1
+                price = float(closes.asof(time))
+                text = f'{channel} {k}'
+                messages.append(dict(id=len(messages) + 1, type='message',
+                                     date=time.tz_convert('Europe/Rome').strftime('%Y-%m-%dT%H:%M:%S'),
+                                     text=text))
+                interpretations[preprocessing.text_key(text)] = ('ok', dict(
+                    flag='POSITION', symbol='GBPJPY', side='buy' if sign > 0 else 'sell', entry=None,
+                    sl=round(price - sign * 0.2, 3), tp=[round(price + sign * 0.2, 3)]))
+            path = os.path.join(self.root, f'{channel}.json')
+            with open(path, 'w') as f:
+                json.dump(dict(messages=messages), f)
+            self.cache.put_many(interpretations)
+            self.exports[channel] = path
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_same_results_as_one_channel_at_a_time(self):
+        with mt5.connected():
+            expected = []
+            for channel, path in self.exports.items():
+                history = HistoryStore(os.path.join(self.root, channel), Source())
+                b = backtesting.Backtest(verbose=None, history=history)
+                b.trades = b.prepare(path, cache=self.cache)
+                results = b.run()
+                results.insert(0, 'channel', channel)
+                expected.append(results)
+
+            history = HistoryStore(os.path.join(self.root, 'shared'), self.source)
+            batch = Batch(list(self.exports.values()), history=history, cache=self.cache, verbose=None)
+            results = batch.run()
+
+        pd.testing.assert_frame_equal(results, pd.concat(expected, ignore_index=True), check_exact=True)
+        self.assertEqual(list(batch.timings().index), ['first', 'second'])
+        self.assertEqual(len(batch.portfolio().stats()), 7)
+
+    def test_fetches_shared_windows_once(self):
+        history = HistoryStore(os.path.join(self.root, 'shared'), self.source)
+        batch = Batch(self.exports, history=history, cache=self.cache, verbose=None)
+        with mt5.connected():
+            batch.run()
+        # the same day for both channels, one merged window per day
+        self.assertEqual(batch.prefetch_stats.fetches, 2)
+        self.assertEqual(self.source.calls, 2)
+        self.assertEqual(history.misses, 2)
+
+    def test_leaves_out_exports_that_cant_be_read(self):
+        exports = dict(self.exports, missing=os.path.join(self.root, 'missing.json'))
+        history = HistoryStore(os.path.join(self.root, 'shared'), self.source)
+        batch = Batch(exports, history=history, cache=self.cache, verbose=None)
+        with mt5.connected():
+            results = batch.run()
+        self.assertIn('missing', batch.failed)
+        self.assertEqual(set(results['channel']), {'first', 'second'})
+
+    def test_channel_names(self):
+        self.assertEqual(channel_names(['a/x.json', 'b/y.json']), dict(x='a/x.json', y='b/y.json'))
+        self.assertEqual(channel_names(['a/x.json', 'b/x.json']), {'a/x.json': 'a/x.json', 'b/x.json': 'b/x.json'})
+
+
+if __name__ == "__main__":
+    unittest.main()
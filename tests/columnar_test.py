@@ -0,0 +1,129 @@
+import unittest
+import os
+import shutil
+import tempfile
+import arrow
+import numpy as np
+import pandas as pd
+import betterMT5 as mt5
+from backtesting import backtesting, symbols
+from backtesting.classes.constants import LABEL
+from backtesting.classes.constants import ORDERTYPE
+from backtesting.columnar import ColumnarRun, results
+from backtesting.history import HistoryStore
+from benchmarks import synthetic
+
+
+def five_bars():
+    """GBPJPY from 07:00 on 2022-02-01: up through 155 at 07:03, then back
+    down to 154.6"""
+    high = [154.72, 154.75, 154.95, 155.05, 154.8]
+    low = [154.68, 154.65, 154.7, 154.9, 154.6]
+    return pd.DataFrame(dict(
+        time=pd.date_range('2022-02-01 07:00', periods=5, freq='min', tz='UTC'),
+        open=154.7, high=high, low=low, close=154.7))
+
+
+class TestColumnarRun(unittest.TestCase):
+
+    def setUp(self):
+        t = arrow.get('2022-02-01T07:00:00+00:00')
+        with mt5.connected():
+            self.p = backtesting.make_positions([
+                dict(time=t, text='', interpretation=dict(
+                    flag='POSITION', symbol='GBPJPY', side='buy',
+                    entry='154.700', sl='154.500', tp=['155.000', '154.900'])),
+                dict(time=t.shift(minutes=1), text='', interpretation=dict(flag='UPDATE_BREAKEVEN')),
+            ])[0]
+        self.p.rates = five_bars()
+        backtesting.resolve_position(self.p)
+        self.run = ColumnarRun([self.p])
+
+    def test_views_match_position(self):
+        view = self.run[0]
+        self.assertEqual(view.time, self.p.time)
+        self.assertIs(view.symbol, self.p.symbol)
+        self.assertEqual(view.time_ns, self.p.time_ns)
+        self.assertEqual(view.entry.execution, self.p.entry.execution)
+        self.assertEqual(view.sl, self.p.sl)
+        self.assertEqual(view.sl_delta, self.p.sl_delta)
+        self.assertEqual([o.name for o in view.tps], [LABEL.TP, LABEL.TP])
+        self.assertEqual(
+            [(o.name, o.execution) for o in view.get_orders(by='execution')],
+            [(o.name, o.execution) for o in self.p.get_orders(by='execution')],
+        )
+
+    def test_views_make_results(self):
+        view = self.run[0]
+        res = backtesting.Backtest._determine_position_result(self.p, [0.5, 0.5], [])
+        self.assertEqual(backtesting.Backtest._result_row(view, res),
+                         backtesting.Backtest._result_row(self.p, res))
+        b = backtesting.Backtest()
+        pd.testing.assert_frame_equal(b.make_results([view, view], [0.5, 0.5]),
+                                      b.make_results([self.p, self.p], [0.5, 0.5]))
+
+    def test_r_multiples(self):
+        events = backtesting.Backtest._position_events(self.p, [])
+        r = self.run.r_multiples()[self.run.execution_order()]
+        np.testing.assert_allclose(r, [e[2] for e in events])
+
+    def test_results_match_per_position(self):
+        for partials in ([1], [0.5, 0.5], [0.2, 0.3, 0.5], [0.25] * 4):
+            for ignore in ([], ['SL_TO_BE'], ['TP']):
+                expected = pd.DataFrame([backtesting.Backtest._result_row(
+                    self.p, backtesting.Backtest._determine_position_result(self.p, partials, ignore))])
+                pd.testing.assert_frame_equal(
+                    results(self.run, partials, ignore), expected, check_exact=True)
+
+    def test_results_without_executions_close_at_eop(self):
+        res = results(self.run, [1], ['TP', 'SL_TO_BE'])
+        self.assertEqual(res.loc[0, 'type'], 'EOP')
+        self.assertEqual(res.loc[0, 'close'], pd.Timestamp('2022-02-01 07:04', tz='UTC'))
+
+
+class TestResultsOnARun(unittest.TestCase):
+    """columnar.results against the per-position path, on every position
+    of a synthetic run"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        # runs before conftest's registry fixture, which is per test
+        cls.registry = symbols.set_registry(symbols.SymbolRegistry(os.path.join(cls.root, 'symbols.json')))
+        b = backtesting.Backtest(verbose=None, history=HistoryStore(os.path.join(cls.root, 'history')))
+        b.trades = backtesting.make_positions(synthetic.signals(300))
+        b.run()
+        cls.positions = b.run_results
+        cls.columns = b.columns()
+
+    @classmethod
+    def tearDownClass(cls):
+        symbols.set_registry(cls.registry)
+        shutil.rmtree(cls.root)
+
+    def test_corpus(self):
+        """has the cases the results have to get right"""
+        entries = {p.entry.ordertype for p in self.positions}
+        self.assertEqual(entries, {ORDERTYPE.MARKET, ORDERTYPE.LIMIT})
+        events = [[e[1] for e in backtesting.Backtest._position_events(p, [])] for p in self.positions]
+        self.assertTrue(any(LABEL.SL_TO_BE in names for names in events))
+        self.assertTrue(any(names == [] for names in events))
+        self.assertTrue(any(
+            names and names[0] not in (LABEL.SL, LABEL.SL_TO_BE) and (LABEL.SL in names or LABEL.SL_TO_BE in names)
+            for names in events))
+        self.assertTrue(any(LABEL.PARTIALS in names for names in events))
+
+    def test_results_match_per_position(self):
+        for partials in ([1], [0.5, 0.5], [0.3, 0.3, 0.4], [0.25] * 4):
+            for ignore in ([], ['SL_TO_BE'], ['TP'], ['PARTIALS', 'CLOSE']):
+                with self.subTest(partials=partials, ignore=ignore):
+                    expected = pd.DataFrame([
+                        backtesting.Backtest._result_row(
+                            p, backtesting.Backtest._determine_position_result(p, partials, ignore))
+                        for p in self.positions
+                    ])
+                    pd.testing.assert_frame_equal(results(self.columns, partials, ignore), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
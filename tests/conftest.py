@@ -0,0 +1,26 @@
+"""Stand-ins for betterMT5 and hermes on boxes without them (both leave
+the real packages alone when they're there), installed before the test
+modules import them."""
+
+import pytest
+from benchmarks import fake_mt5, synthetic
+
+fake_mt5.install()
+synthetic.install_interpreter()
+
+from backtesting import preprocessing, symbols  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def symbol_registry(tmp_path):
+    """Positions of the tests get their specs from a registry of their
+    own, not from (and not into) the one in the home folder"""
+    old = symbols.set_registry(symbols.SymbolRegistry(str(tmp_path / "symbols.json")))
+    yield symbols.registry()
+    symbols.set_registry(old)
+
+
+@pytest.fixture(autouse=True)
+def interpretation_cache(tmp_path, monkeypatch):
+    """Same for the default cache of interpretations"""
+    monkeypatch.setattr(preprocessing, "DEFAULT_CACHE_ROOT", str(tmp_path / "interpretations"))
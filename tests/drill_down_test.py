@@ -0,0 +1,82 @@
+import unittest
+import tempfile
+import shutil
+import arrow
+import numpy as np
+import pandas as pd
+import betterMT5 as mt5
+from backtesting import backtesting
+from backtesting.history import HistoryStore
+from backtesting.ticks import TickStore
+
+
+def random_walk(n=60 * 24 * 3, seed=3):
+    rng = np.random.default_rng(seed)
+    o = 154.7 + np.cumsum(rng.integers(-20, 21, n)) * 0.001
+    c = o + rng.integers(-20, 21, n) * 0.001
+    prices = pd.DataFrame(dict(
+        open=o, high=np.maximum(o, c) + rng.integers(0, 15, n) * 0.001,
+        low=np.minimum(o, c) - rng.integers(0, 15, n) * 0.001, close=c,
+    )).round(3)
+    prices.insert(0, 'time', pd.date_range('2022-01-31', periods=n, freq='min', tz='UTC'))
+    return prices
+
+
+class Source:
+    """M1 bars, and the H1 bars made out of them"""
+
+    def __init__(self):
+        self.m1 = random_walk()
+
+    def __call__(self, symbol, timeframe, datetime_from, datetime_to):
+        rates = self.m1[(self.m1.time >= datetime_from) & (self.m1.time < datetime_to)]
+        if getattr(timeframe, 'name', timeframe) == 'H1':
+            hours = rates.set_index('time').resample('h')
+            rates = pd.concat([hours['open'].first(), hours['high'].max(),
+                               hours['low'].min(), hours['close'].last()], axis=1).dropna().reset_index()
+        return rates
+
+
+class TestDrillDown(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.source = Source()
+        closes = self.source.m1.set_index('time')['close']
+        self.data = []
+        for k in range(12):
+            time = arrow.get('2022-01-31T07:00:00+00:00').shift(hours=5 * k, minutes=7 * k)
+            sign = 1 if k % 2 else -1
+            price = float(closes.asof(pd.Timestamp(time.datetime)))
+            entry = None if k % 3 == 0 else round(price - sign * 0.05, 3)
+            price = entry or price
+            self.data.append(dict(time=time, text='', interpretation=dict(
+                flag='POSITION', symbol='GBPJPY', side='buy' if sign > 0 else 'sell', entry=entry,
+                sl=round(price - sign * 0.2, 3), tp=[round(price + sign * 0.2, 3), round(price + sign * 0.4, 3)])))
+            if k % 4 == 1:
+                self.data.append(dict(time=time.shift(minutes=30), text='',
+                                      interpretation=dict(flag='UPDATE_BREAKEVEN')))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_backtest(self, **kwargs):
+        with mt5.connected():
+            test = backtesting.Backtest(history=HistoryStore(self.root, source=self.source))
+            test.trades = backtesting.make_positions(self.data)
+            return test.run(end_of_period=5, **kwargs), test
+
+    def test_same_results_as_full_scan(self):
+        full, full_test = self.run_backtest()
+        coarse, coarse_test = self.run_backtest(coarse_tf=mt5.TIMEFRAME.H1)
+        pd.testing.assert_frame_equal(full, coarse, check_exact=True)
+        bars = lambda test: sum(len(p.rates) for p in test.run_results)
+        self.assertLess(bars(coarse_test), bars(full_test) / 4)
+
+    def test_not_with_ticks(self):
+        with self.assertRaises(ValueError):
+            self.run_backtest(coarse_tf=mt5.TIMEFRAME.H1, ticks=TickStore(self.root, source=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
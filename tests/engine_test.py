@@ -0,0 +1,135 @@
+import unittest
+import numpy as np
+import pandas as pd
+import arrow
+from backtesting import engine
+from backtesting.backtesting import has_candle_hit
+from backtesting.classes.order import MarketOrder, LimitOrder, StopOrder
+from backtesting.classes.constants import SIDE, ORDERTYPE
+from backtesting.classes.price import Price
+
+
+def random_rates(seed, n=600, start=154.700, tick_size=0.001):
+    rng = np.random.default_rng(seed)
+    opens = start + np.cumsum(rng.integers(-40, 41, n)) * tick_size
+    closes = opens + rng.integers(-40, 41, n) * tick_size
+    high = np.maximum(opens, closes) + rng.integers(0, 30, n) * tick_size
+    low = np.minimum(opens, closes) - rng.integers(0, 30, n) * tick_size
+    time = pd.date_range("2022-02-01 06:57", periods=n, freq="min", tz="Europe/Rome")
+    prices = pd.DataFrame(dict(open=opens, high=high, low=low, close=closes))
+    return pd.concat([pd.Series(time, name="time"), prices.round(6)], axis=1)
+
+
+def reference_hit(order, rates):
+    """Row by row search, the way find_hit used to do it"""
+    for _, row in rates.iterrows():
+        if row["time"].value <= order.time:
+            continue
+        if order.ordertype == ORDERTYPE.MARKET:
+            return row.name
+        if has_candle_hit(order, row["high"], row["low"]):
+            return row.name
+    return None
+
+
+class TestFirstHit(unittest.TestCase):
+
+    tick_size = 0.001
+
+    def check_parity(self, seed):
+        rates = random_rates(seed, tick_size=self.tick_size)
+        candles = engine.Candles.from_frame(rates, self.tick_size)
+        rng = np.random.default_rng(seed + 1000)
+
+        for _ in range(20):
+            time = arrow.get(rates["time"].iloc[rng.integers(0, len(rates))])
+            side = SIDE.BUY if rng.integers(0, 2) else SIDE.SELL
+            price = Price(
+                float(rates["close"].iloc[0] + rng.integers(-300, 301) * self.tick_size),
+                self.tick_size,
+            )
+            for order in (
+                LimitOrder(time, side, price),
+                StopOrder(time, side, price),
+                MarketOrder(time, side),
+            ):
+                with self.subTest(seed=seed, order=order):
+                    self.assertEqual(
+                        engine.first_hit(order, candles), reference_hit(order, rates)
+                    )
+
+    def test_parity_with_has_candle_hit(self):
+        for seed in range(5):
+            self.check_parity(seed)
+
+    def test_parity_five_digits(self):
+        self.tick_size = 0.00001
+        self.check_parity(42)
+
+    def check_first_hits(self, rows):
+        """first_hits against first_hit, on orders starting after the
+        given rows"""
+        rates = random_rates(7, tick_size=self.tick_size)
+        candles = engine.Candles.from_frame(rates, self.tick_size)
+        rng = np.random.default_rng(7)
+
+        orders = []
+        for _ in range(60):
+            time = arrow.get(rates["time"].iloc[rng.choice(rows)])
+            side = SIDE.BUY if rng.integers(0, 2) else SIDE.SELL
+            price = Price(
+                float(rates["close"].iloc[0] + rng.integers(-300, 301) * self.tick_size),
+                self.tick_size,
+            )
+            cls = [LimitOrder, StopOrder][rng.integers(0, 2)]
+            orders.append(cls(time, side, price))
+        orders.append(MarketOrder(arrow.get(rates["time"].iloc[3]), SIDE.SELL))
+
+        hits = engine.first_hits(
+            candles,
+            [candles.start(o.time) for o in orders],
+            [o.ordertype for o in orders],
+            [o.side for o in orders],
+            [0 if o.price is None else round(o.price.value / self.tick_size) for o in orders],
+        )
+        for o, i in zip(orders, hits):
+            expected = engine.first_hit(o, candles)
+            self.assertEqual(engine.NO_HIT if expected is None else expected, i)
+
+    def test_first_hits_matches_first_hit(self):
+        # only a handful of distinct activation times, like a position
+        self.check_first_hits([0, 15, 200, 599])
+
+    def test_first_hits_with_many_starts(self):
+        # a position with lots of updates
+        self.check_first_hits(list(range(0, 600, 7)))
+
+    def test_no_candles_after_order(self):
+        rates = random_rates(0, n=10)
+        candles = engine.Candles.from_frame(rates, self.tick_size)
+        late = arrow.get(rates["time"].iloc[-1])
+        order = LimitOrder(late, SIDE.BUY, Price(999.999, self.tick_size))
+        self.assertIsNone(engine.first_hit(order, candles))
+        self.assertIsNone(engine.first_hit(MarketOrder(late, SIDE.BUY), candles))
+
+    def test_stop_needs_spread(self):
+        rates = random_rates(0, n=1)
+        candles = engine.Candles.from_frame(rates, self.tick_size)
+        high = rates["high"].iloc[0]
+        before = arrow.get(rates["time"].iloc[0]).shift(minutes=-1)
+        # the high touches the price, but not with the spread added in
+        order = StopOrder(before, SIDE.BUY, Price(high, self.tick_size))
+        self.assertIsNone(engine.first_hit(order, candles))
+        order = StopOrder(before, SIDE.BUY, Price(high - 0.010, self.tick_size))
+        self.assertEqual(engine.first_hit(order, candles), 0)
+
+    def test_limit_without_price_raises(self):
+        rates = random_rates(0, n=5)
+        candles = engine.Candles.from_frame(rates, self.tick_size)
+        order = LimitOrder(arrow.get(rates["time"].iloc[0]), SIDE.BUY, None)
+        with self.assertRaises(ValueError):
+            engine.first_hit(order, candles)
+
+
+if __name__ == "__main__":
+    unittest.main()
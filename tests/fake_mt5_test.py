@@ -0,0 +1,35 @@
+import unittest
+import pandas as pd
+from benchmarks import fake_mt5
+
+
+class TestFakeMT5(unittest.TestCase):
+    def test_same_bar_whatever_the_range(self):
+        symbol = fake_mt5.Symbol('GBPUSD')
+        bar = pd.Timestamp('2022-04-19 16:00', tz='UTC')
+        ranges = [
+            (bar, bar + pd.Timedelta(minutes=30)),
+            (bar - pd.Timedelta(minutes=20), pd.Timestamp('2022-04-19 18:00', tz='UTC')),
+            (bar + pd.Timedelta(minutes=-1), bar + pd.Timedelta(hours=1)),
+        ]
+        bars = []
+        for start, end in ranges:
+            rates = symbol.history(fake_mt5.TIMEFRAME.H1, start, end, include_last=False)
+            bars.append(rates[rates.time == bar].reset_index(drop=True))
+        for other in bars[1:]:
+            pd.testing.assert_frame_equal(other, bars[0])
+        self.assertEqual(len(bars[0]), 1)
+
+        m1 = symbol.history(fake_mt5.TIMEFRAME.M1, bar, bar + pd.Timedelta(hours=1), include_last=False)
+        self.assertAlmostEqual(bars[0].low[0], m1.low.min())
+        self.assertAlmostEqual(bars[0].high[0], m1.high.max())
+
+    def test_bars_open_in_the_range(self):
+        symbol = fake_mt5.Symbol('GBPUSD')
+        start = pd.Timestamp('2022-04-19 16:20', tz='UTC')
+        rates = symbol.history(fake_mt5.TIMEFRAME.H1, start, start + pd.Timedelta(hours=2), include_last=False)
+        self.assertEqual(list(rates.time), [pd.Timestamp('2022-04-19 17:00', tz='UTC'), pd.Timestamp('2022-04-19 18:00', tz='UTC')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+import unittest
+import os
+import tempfile
+import shutil
+import types
+from unittest import mock
+import pandas as pd
+from backtesting.history import HistoryStore, HistoryMissError, Prefetcher, merge_windows
+
+
+def minute_bars(datetime_from, datetime_to):
+    time = pd.date_range(datetime_from, datetime_to, freq="min", inclusive="left")
+    close = 1.13 + (time.hour * 60 + time.minute).to_numpy() * 0.00001
+    return pd.DataFrame(
+        dict(time=time, open=close, high=close + 0.0002, low=close - 0.0002, close=close)
+    )
+
+
+class FakeTerminal:
+    """Stand-in for the terminal, counting the requests it gets"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, symbol, timeframe, datetime_from, datetime_to):
+        self.requests.append((datetime_from, datetime_to))
+        return minute_bars(datetime_from, datetime_to)
+
+
+class FormingTerminal(FakeTerminal):
+    """Has no bars after now, and the one of now isn't over: its high is
+    still below where it ends up"""
+
+    def __init__(self, now):
+        super().__init__()
+        self.now = now
+
+    def __call__(self, symbol, timeframe, datetime_from, datetime_to):
+        bars = super().__call__(symbol, timeframe, datetime_from, datetime_to)
+        bars = bars[bars.time < self.now].copy()
+        forming = bars.time >= self.now.floor("min")
+        bars.loc[forming, "high"] = bars.loc[forming, "close"] + 0.0001
+        return bars
+
+
+def t(hhmm):
+    return pd.Timestamp(f"2022-02-01 {hhmm}", tz="UTC")
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.terminal = FakeTerminal()
+        self.store = HistoryStore(self.root, source=self.terminal)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_second_get_is_served_locally(self):
+        first = self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        second = self.store.get("EURUSD", "M1", t("07:30"), t("08:00"))
+        self.assertEqual(len(self.terminal.requests), 1)
+        self.assertEqual(len(first), 120)
+        self.assertEqual(len(second), 30)
+        self.assertEqual(second["time"].iloc[0], t("07:30"))
+        self.assertEqual(self.store.hits, 1)
+
+    def test_only_missing_range_is_fetched(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        rates = self.store.get("EURUSD", "M1", t("08:00"), t("10:00"))
+        self.assertEqual(self.terminal.requests[1], (t("09:00"), t("10:00")))
+        self.assertEqual(len(rates), 120)
+        self.assertTrue(rates["time"].is_monotonic_increasing)
+        pd.testing.assert_frame_equal(
+            rates.reset_index(drop=True),
+            minute_bars(t("08:00"), t("10:00")),
+            check_dtype=False,
+        )
+
+    def test_persists_across_instances(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        offline = HistoryStore(self.root, source=None)
+        self.assertEqual(len(offline.get("EURUSD", "M1", t("07:00"), t("08:00"))), 60)
+
+    def test_offline_miss_raises(self):
+        offline = HistoryStore(self.root, offline=True)
+        with self.assertRaises(HistoryMissError):
+            offline.get("EURUSD", "M1", t("07:00"), t("08:00"))
+
+    def test_fixture_stands_in_for_terminal(self):
+        offline = HistoryStore(self.root, offline=True)
+        offline.put("GBPJPY", "M1", minute_bars(t("00:00"), t("23:59")))
+        rates = offline.get("GBPJPY", "M1", t("06:56"), t("18:30"))
+        self.assertEqual(rates["time"].iloc[0], t("06:56"))
+        self.assertEqual(rates["time"].iloc[-1], t("18:29"))
+
+    def test_window_is_a_view(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        rates = self.store.get("EURUSD", "M1", t("07:10"), t("07:20"))
+        self.assertFalse(rates["high"].to_numpy().flags.owndata)
+
+    def test_same_segment_written_by_two_stores(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        # another process fetched the same range at the same time
+        other = HistoryStore(self.root, source=FakeTerminal())
+        start, end = self.store.segments("EURUSD", "M1")[0]
+        other._write_segment("EURUSD", "M1", start, end, minute_bars(t("07:00"), t("09:00")))
+        self.assertEqual(os.listdir(os.path.join(self.root, "EURUSD", "M1")), [f"{start}-{end}"])
+        self.assertEqual(len(other.get("EURUSD", "M1", t("07:00"), t("09:00"))), 120)
+
+    def test_sees_segments_of_other_stores(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        other = HistoryStore(self.root, source=FakeTerminal())
+        other.get("EURUSD", "M1", t("09:00"), t("10:00"))
+        rates = self.store.get("EURUSD", "M1", t("07:00"), t("10:00"))
+        self.assertEqual(len(self.terminal.requests), 1)
+        self.assertEqual(len(rates), 180)
+
+    def test_overlapping_segments(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        # written by another process that hadn't seen the first one
+        other = HistoryStore(self.root, source=FakeTerminal())
+        other._write_segment("EURUSD", "M1", t("08:30").value, t("09:30").value,
+                             minute_bars(t("08:30"), t("09:30")))
+        rates = HistoryStore(self.root, offline=True).get("EURUSD", "M1", t("07:00"), t("09:30"))
+        pd.testing.assert_frame_equal(rates, minute_bars(t("07:00"), t("09:30")), check_dtype=False)
+
+    def test_small_segments_get_merged(self):
+        # a few bars at a time, like drill_down asks for them
+        for hour in (t("07:00"), t("09:00"), t("08:00")):
+            for k in range(4):
+                start = hour + pd.Timedelta(minutes=15 * k)
+                self.store.get("EURUSD", "M1", start, start + pd.Timedelta(minutes=15))
+        self.assertEqual(self.store.segments("EURUSD", "M1"), [(t("07:00").value, t("10:00").value)])
+        self.assertEqual(os.listdir(os.path.join(self.root, "EURUSD", "M1")), [f"{t('07:00').value}-{t('10:00').value}"])
+        rates = HistoryStore(self.root, offline=True).get("EURUSD", "M1", t("07:00"), t("10:00"))
+        pd.testing.assert_frame_equal(rates, minute_bars(t("07:00"), t("10:00")), check_dtype=False)
+
+    def test_big_segments_are_left_alone(self):
+        with mock.patch("backtesting.history.MAX_SEGMENT_BARS", 90):
+            self.store.get("EURUSD", "M1", t("07:00"), t("08:00"))
+            self.store.get("EURUSD", "M1", t("08:00"), t("08:20"))
+            self.store.get("EURUSD", "M1", t("08:20"), t("09:00"))
+        self.assertEqual(
+            self.store.segments("EURUSD", "M1"),
+            [(t("07:00").value, t("08:20").value), (t("08:20").value, t("09:00").value)],
+        )
+        self.assertEqual(len(self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))), 120)
+
+    def test_merged_segments_left_behind_are_skipped(self):
+        self.store.get("EURUSD", "M1", t("07:00"), t("09:00"))
+        # a merge that couldn't remove what it merged
+        shutil.copytree(os.path.join(self.root, "EURUSD", "M1", f"{t('07:00').value}-{t('09:00').value}"),
+                        os.path.join(self.root, "EURUSD", "M1", f"{t('07:30').value}-{t('08:00').value}"))
+        store = HistoryStore(self.root, offline=True)
+        self.assertEqual(store.segments("EURUSD", "M1"), [(t("07:00").value, t("09:00").value)])
+        self.assertEqual(len(store.get("EURUSD", "M1", t("07:00"), t("09:00"))), 120)
+
+    def test_forming_bar_is_fetched_again(self):
+        terminal = FormingTerminal(t("08:30") + pd.Timedelta(seconds=30))
+        store = HistoryStore(self.root, source=terminal)
+        clock = types.SimpleNamespace(time_ns=lambda: terminal.now.value)
+        with mock.patch("backtesting.history._time", clock):
+            first = store.get("EURUSD", "M1", t("08:00"), t("09:00"))
+            self.assertEqual(first["time"].iloc[-1], t("08:30"))
+            self.assertAlmostEqual(first["high"].iloc[-1] - first["close"].iloc[-1], 0.0001)
+            # only the bars that are over got stored
+            self.assertEqual(store.segments("EURUSD", "M1"), [(t("08:00").value, t("08:30").value)])
+
+            terminal.now = t("08:45") + pd.Timedelta(seconds=30)
+            second = store.get("EURUSD", "M1", t("08:00"), t("09:00"))
+        self.assertEqual(second["time"].iloc[-1], t("08:45"))
+        bar = second[second.time == t("08:30")]
+        self.assertAlmostEqual(bar["high"].iloc[0] - bar["close"].iloc[0], 0.0002)
+        pd.testing.assert_frame_equal(
+            second.iloc[:-1].reset_index(drop=True), minute_bars(t("08:00"), t("08:45")), check_dtype=False
+        )
+
+
+class TestPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.terminal = FakeTerminal()
+        self.store = HistoryStore(self.root, source=self.terminal)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_merge_windows(self):
+        self.assertEqual(merge_windows([(5, 9), (0, 3), (2, 6), (10, 12)]), [(0, 9), (10, 12)])
+
+    def test_one_fetch_per_merged_window(self):
+        windows = {
+            0: ("EURUSD", t("07:00"), t("09:00")),
+            1: ("EURUSD", t("08:00"), t("10:00")),
+            2: ("GBPJPY", t("08:30"), t("09:30")),
+            3: ("EURUSD", t("12:00"), t("13:00")),
+        }
+        with Prefetcher(self.store, "M1") as prefetcher:
+            prefetcher.plan(windows)
+            rates = {key: prefetcher.rates(key) for key in windows}
+
+        self.assertEqual(len(self.terminal.requests), 3)
+        self.assertEqual(prefetcher.stats.saved, 1)
+        self.assertEqual(rates[1]["time"].iloc[0], t("08:00"))
+        self.assertEqual(rates[1]["time"].iloc[-1], t("09:59"))
+        self.assertEqual(len(rates[3]), 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
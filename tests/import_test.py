@@ -0,0 +1,47 @@
+import unittest
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds the package itself may take to import, on top of numpy, pandas
+# and arrow (about 0.1 on a laptop)
+BUDGET = 0.5
+
+SCRIPT = """
+import sys, time
+import numpy, pandas, arrow, pytz
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(",".join(m for m in ("hermes", "betterMT5", "MetaTrader5", "rich") if m in sys.modules))
+"""
+
+
+def import_in_subprocess(module: str):
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split("\n")
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+class TestImport(unittest.TestCase):
+
+    def test_heavy_dependencies_are_lazy(self):
+        for module in ("backtesting.backtesting", "backtesting.engine", "backtesting.preprocessing"):
+            with self.subTest(module=module):
+                _, loaded = import_in_subprocess(module)
+                self.assertEqual(loaded, [])
+
+    def test_import_time(self):
+        seconds = min(import_in_subprocess("backtesting.backtesting")[0] for _ in range(3))
+        self.assertLess(seconds, BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
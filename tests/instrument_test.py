@@ -0,0 +1,70 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+from backtesting.instrument import Instrument, NULL, Recorder
+
+
+class TestInstrument(unittest.TestCase):
+
+    def test_null_does_nothing(self):
+        with NULL.stage("simulate", positions=3):
+            NULL.count("bars scanned", 10)
+        self.assertFalse(NULL.enabled)
+        self.assertIs(NULL.stage("a"), NULL.stage("b"))
+
+    def test_report(self):
+        rec = Recorder()
+        with rec.stage("simulate"):
+            for i in range(3):
+                with rec.stage("resolve", position=i):
+                    rec.count("orders resolved", 2)
+        report = rec.report()
+
+        self.assertEqual(list(report["stages"]), ["simulate", "resolve"])
+        self.assertEqual(report["stages"]["resolve"]["calls"], 3)
+        self.assertGreaterEqual(
+            report["stages"]["simulate"]["seconds"], report["stages"]["resolve"]["seconds"]
+        )
+        self.assertEqual(report["counters"], {"orders resolved": 6})
+
+    def test_stage_is_recorded_when_it_raises(self):
+        rec = Recorder()
+        with self.assertRaises(ValueError):
+            with rec.stage("fetch", symbol="GBPJPY"):
+                raise ValueError
+        self.assertEqual([(s.name, s.args) for s in rec.spans], [("fetch", dict(symbol="GBPJPY"))])
+
+    def test_chrome_trace(self):
+        rec = Recorder()
+        with rec.stage("simulate"):
+            with rec.stage("history", position=0):
+                pass
+        worker = threading.Thread(target=self._fetch, args=(rec,))
+        worker.start()
+        worker.join()
+        rec.count("history fetches")
+
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "trace.json")
+            rec.save_chrome_trace(path)
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+
+        spans = {e["name"]: e for e in events if e["ph"] == "X"}
+        self.assertEqual(set(spans), {"simulate", "history", "fetch"})
+        self.assertEqual(spans["history"]["args"], dict(position=0))
+        self.assertLessEqual(spans["simulate"]["ts"], spans["history"]["ts"])
+        self.assertNotEqual(spans["fetch"]["tid"], spans["simulate"]["tid"])
+        self.assertEqual(events[-1]["ph"], "C")
+        self.assertEqual(events[-1]["args"], {"history fetches": 1})
+
+    @staticmethod
+    def _fetch(rec: Instrument):
+        with rec.stage("fetch"):
+            pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import logging
+from backtesting import backtesting  # sets nothing up on import
+from backtesting.logs import configure_logging, PACKAGE
+import arrow
+
+
+class TestLogs(unittest.TestCase):
+
+    def tearDown(self):
+        logger = logging.getLogger(PACKAGE)
+        logger.handlers.clear()
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+
+    def test_import_configures_nothing(self):
+        self.assertEqual(logging.getLogger(PACKAGE).handlers, [])
+        self.assertEqual(logging.getLogger("backtesting.backtesting").level, logging.NOTSET)
+        backtesting.Backtest(verbose=True)
+        self.assertEqual(logging.getLogger(PACKAGE).level, logging.NOTSET)
+
+    def test_configure_logging_replaces_its_handler(self):
+        configure_logging(logging.DEBUG, rich=False, loggers=(PACKAGE,))
+        configure_logging(logging.WARNING, rich=False, loggers=(PACKAGE,))
+        logger = logging.getLogger(PACKAGE)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertEqual(logger.level, logging.WARNING)
+        self.assertFalse(logging.getLogger("backtesting.history").isEnabledFor(logging.INFO))
+
+    def test_per_order_warnings_are_summed_up(self):
+        t = arrow.get('2022-02-01T07:00:00+00:00')
+        data = [
+            dict(time=t, text='', interpretation=dict(
+                flag='POSITION', symbol='GBPJPY', side='buy', entry='154700', sl='154.500', tp=['155.000', '155.000', '155.100'])),
+            dict(time=t.shift(days=2), text='', interpretation=dict(flag='UPDATE_CLOSE')),
+        ]
+        with self.assertLogs('backtesting.backtesting', logging.DEBUG) as logged:
+            backtesting.make_positions(data)
+        warnings = [r.getMessage() for r in logged.records if r.levelno >= logging.WARNING]
+        self.assertEqual(warnings, [
+            '1 prices with an inferred dot, 1 duplicate orders dropped, '
+            '1 orders over 24 hours after their position'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import arrow
+from backtesting.classes.constants import SIDE, LABEL
+from backtesting.classes.order import TP, SL, StopOrder
+from backtesting.classes.orderbook import OrderBook
+from backtesting.classes.price import Price
+
+TICK = 0.001
+
+
+def at(minute):
+    return arrow.get(2022, 2, 1, 7, minute)
+
+
+class TestOrderBook(unittest.TestCase):
+
+    def setUp(self):
+        self.book = OrderBook()
+        self.sl = SL(at(0), SIDE.SELL, Price("154.500", TICK))
+        self.tp2 = TP(at(5), SIDE.SELL, Price("155.200", TICK))
+        self.tp1 = TP(at(5), SIDE.SELL, Price("154.900", TICK))
+        self.early = TP(at(1), SIDE.SELL, Price("155.000", TICK))
+        for o in (self.sl, self.tp2, self.tp1, self.early):
+            self.book.add(o)
+
+    def test_by_time_keeps_insertion_order_on_ties(self):
+        self.assertEqual(self.book.by_time(), [self.sl, self.early, self.tp2, self.tp1])
+
+    def test_duplicates(self):
+        self.assertIn(TP(at(5), SIDE.SELL, Price(154.9, TICK)), self.book)
+        self.assertNotIn(TP(at(6), SIDE.SELL, Price(154.9, TICK)), self.book)
+
+    def test_price_sum(self):
+        self.assertEqual(self.book.price_count, 4)
+        self.assertAlmostEqual(self.book.price_sum, 154.5 + 155.2 + 154.9 + 155.0)
+        self.book.remove(self.early)
+        self.assertEqual(self.book.price_count, 3)
+        self.assertAlmostEqual(self.book.price_sum, 154.5 + 155.2 + 154.9)
+
+    def test_by_execution(self):
+        self.book.set_execution(self.tp2, at(30), self.tp2.price)
+        self.book.set_execution(self.sl, at(10), self.sl.price)
+        self.book.set_execution(self.tp1, at(10), self.tp1.price)
+        self.assertEqual(self.book.by_execution(), [self.sl, self.tp1, self.tp2])
+
+    def test_set_price_keeps_place(self):
+        be = StopOrder(at(1), SIDE.SELL, None, name=LABEL.SL_TO_BE)
+        self.book.add(be)
+        self.book.set_price(be, Price("154.700", TICK))
+        self.assertEqual(self.book.by_time(), [self.sl, self.early, be, self.tp2, self.tp1])
+        self.assertIn(StopOrder(at(1), SIDE.SELL, Price("154.700", TICK)), self.book)
+        self.assertEqual(self.book.price_count, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
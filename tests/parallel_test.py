@@ -0,0 +1,36 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+from backtesting import backtesting
+from backtesting.history import HistoryStore
+from benchmarks import synthetic
+
+
+class TestParallelRun(unittest.TestCase):
+    """A synthetic export run on worker processes and on this one"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.signals = synthetic.signals(150)
+        self.history = HistoryStore(os.path.join(self.root, 'history'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_backtest(self, **kwargs):
+        b = backtesting.Backtest(verbose=None, history=self.history)
+        b.trades = backtesting.make_positions(self.signals)
+        return b.run(end_of_period=5, **kwargs), b
+
+    def test_same_results_as_sequential(self):
+        sequential, b = self.run_backtest()
+        # more than one chunk of positions per worker
+        self.assertGreater(len(b.run_results), 2 * backtesting.RESOLVE_CHUNK)
+        parallel, _ = self.run_backtest(workers=2)
+        pd.testing.assert_frame_equal(sequential, parallel, check_exact=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
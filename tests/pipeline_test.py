@@ -0,0 +1,106 @@
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import pandas as pd
+import betterMT5 as mt5
+from backtesting import backtesting, preprocessing
+from backtesting.classes.constants import LABEL
+from backtesting.history import HistoryStore
+from backtesting.pipeline import Pipeline
+from .drill_down_test import Source
+
+
+class TestPipeline(unittest.TestCase):
+    """Same export through Backtest and through the pipeline. The cache is
+    filled beforehand, so hermes never gets asked."""
+
+    # signals followed by one that gets rejected
+    rejected = (1, 5)
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'export.json')
+        self.cache_root = os.path.join(self.root, 'interpretations')
+        source = Source()
+        closes = source.m1.set_index('time')['close']
+
+        messages, interpretations = [], dict()
+
+        def message(time, text, interpretation):
+            messages.append(dict(id=len(messages) + 1, type='message',
+                                 date=time.tz_convert('Europe/Rome').strftime('%Y-%m-%dT%H:%M:%S'),
+                                 text=text))
+            interpretations[preprocessing.text_key(text)] = ('ok', interpretation)
+
+        for k in range(30):
+            time = pd.Timestamp('2022-01-31 07:00', tz='UTC') + pd.Timedelta(minutes=97 * k)
+            if time.hour > 17:
+                continue
+            sign = 1 if k % 2 else -1
+            price = float(closes.asof(time))
+            entry = None if k % 3 == 0 else round(price - sign * 0.05, 3)
+            price = entry or price
+            message(time, f'signal {k}', dict(
+                flag='POSITION', symbol='GBPJPY', side='buy' if sign > 0 else 'sell', entry=entry,
+                sl=round(price - sign * 0.2, 3), tp=[round(price + sign * 0.2, 3), round(price + sign * 0.4, 3)]))
+            if k in self.rejected:
+                # sl on the wrong side: the breakeven after it is still the previous position's
+                message(time + pd.Timedelta(minutes=10), f'rejected {k}', dict(
+                    flag='POSITION', symbol='GBPJPY', side='buy' if sign > 0 else 'sell', entry=price,
+                    sl=round(price + sign * 0.2, 3), tp=[round(price + sign * 0.4, 3)]))
+            if k % 4 == 1:
+                message(time + pd.Timedelta(minutes=30), f'breakeven {k}', dict(flag='UPDATE_BREAKEVEN'))
+            message(time + pd.Timedelta(minutes=31), f'hello {k}', dict())
+
+        with open(self.path, 'w') as f:
+            json.dump(dict(messages=messages), f)
+        preprocessing.InterpretationCache(self.cache_root).put_many(interpretations)
+        self.history = HistoryStore(os.path.join(self.root, 'history'), source)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_same_results_as_backtest(self):
+        with mt5.connected():
+            b = backtesting.Backtest(verbose=None, history=self.history)
+            cache = preprocessing.InterpretationCache(self.cache_root)
+            b.trades = backtesting.make_positions(preprocessing.preprocess(self.path, cache=cache))
+            expected = b.run()
+
+            pipeline = Pipeline(history=self.history, cache_root=self.cache_root, queue_size=2)
+            results = pipeline.run(self.path)
+
+        self.assertGreater(len(expected), 5)
+        pd.testing.assert_frame_equal(results, expected, check_exact=True)
+        self.assertEqual(len(pipeline.run_results), len(b.run_results))
+
+    def test_rejected_signal(self):
+        with mt5.connected():
+            b = backtesting.Backtest(verbose=None, history=self.history)
+            cache = preprocessing.InterpretationCache(self.cache_root)
+            b.trades = backtesting.make_positions(preprocessing.preprocess(self.path, cache=cache))
+            pipeline = Pipeline(history=self.history, cache_root=self.cache_root)
+            pipeline.run(self.path)
+
+        starts = [pd.Timestamp('2022-01-31 07:00', tz='UTC') + pd.Timedelta(minutes=97 * k) for k in self.rejected]
+        for trades in (b.trades, pipeline.run_results):
+            self.assertFalse(any(p.time - start == pd.Timedelta(minutes=10) for p in trades for start in starts))
+            with_be = [p for p in trades if any(o.name == LABEL.SL_TO_BE for o in p.orders)]
+            self.assertTrue(all(any(p.time == start for p in with_be) for start in starts))
+
+    def test_stops_early(self):
+        async def first():
+            pipeline = Pipeline(history=self.history, cache_root=self.cache_root, queue_size=1)
+            async for index, p, row in pipeline.results(self.path):
+                return row
+
+        with mt5.connected():
+            row = asyncio.run(first())
+        self.assertEqual(row['symbol'], 'GBPJPY')
+
+
+if __name__ == "__main__":
+    unittest.main()
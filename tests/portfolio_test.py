@@ -0,0 +1,106 @@
+import unittest
+import arrow
+import numpy as np
+import pandas as pd
+import betterMT5 as mt5
+from backtesting import backtesting
+from backtesting.columnar import ColumnarRun, results
+from backtesting.portfolio import Portfolio, drawdown, time_under_water
+from .columnar_test import five_bars
+
+
+class TestPortfolio(unittest.TestCase):
+
+    def setUp(self):
+        t = arrow.get('2022-02-01T07:00:00+00:00')
+        with mt5.connected():
+            positions = backtesting.make_positions([
+                dict(time=t, text='', interpretation=dict(
+                    flag='POSITION', symbol='GBPJPY', side='buy',
+                    entry='154.700', sl='154.500', tp=['155.000', '154.900'])),
+                dict(time=t.shift(minutes=1), text='', interpretation=dict(flag='UPDATE_BREAKEVEN')),
+                dict(time=t.shift(minutes=2), text='', interpretation=dict(
+                    flag='POSITION', symbol='GBPJPY', side='sell',
+                    entry=None, sl='155.000', tp='154.500')),
+            ])
+        rates = five_bars()
+        for p in positions:
+            p.rates = rates
+            if p.entry.execution is None and p.entry_price is None:
+                backtesting.fill_market_entry(p)
+            backtesting.resolve_position(p)
+        self.run = ColumnarRun(positions)
+
+    def test_events_add_up_to_results(self):
+        for partials in ([1], [0.5, 0.5], [0.2, 0.3, 0.5]):
+            for ignore in ([], ['SL_TO_BE']):
+                pf = Portfolio(self.run, risk=1.0, compounding=False, partials=partials, ignore=ignore)
+                res = results(self.run, partials, ignore)
+                np.testing.assert_allclose(np.bincount(pf.position, weights=pf.r), res.result)
+                np.testing.assert_allclose(np.bincount(pf.position, weights=pf.fraction), 0, atol=1e-12)
+                self.assertTrue((np.diff(pf.time) >= 0).all())
+                self.assertEqual(pf.open_positions[-1], 0)
+
+    def test_channels_and_exposure(self):
+        pf = Portfolio({"a": self.run, "b": self.run}, risk=0.01)
+        curve = pf.curve()
+        self.assertEqual(set(curve.channel), {"a", "b"})
+        self.assertEqual(pf.stats()["max_open_positions"], 4)
+        self.assertAlmostEqual(pf.open_risk[-1], 0)
+
+    def test_fixed_fractional_sizing(self):
+        pf = Portfolio(self.run, risk=0.1, capital=100.0)
+        # the second position opens before the first one closes anything
+        np.testing.assert_allclose(pf.risked, [10.0, 10.0])
+        fixed = Portfolio(self.run, risk=0.1, capital=100.0, compounding=False)
+        np.testing.assert_allclose(pf.equity, fixed.equity)
+
+    def test_mark_to_market_is_realized_equity_when_flat(self):
+        pf = Portfolio(self.run, risk=0.01)
+        prices = {"GBPJPY": pd.DataFrame(dict(
+            time=pd.date_range('2022-02-01 06:00', periods=300, freq='min', tz='UTC'), close=154.7))}
+        mtm = pf.mark_to_market(prices, every="1min")
+        self.assertEqual(mtm.time.iloc[-1].value, pf.time[-1])
+        self.assertAlmostEqual(mtm.equity.iloc[-1], pf.equity[-1])
+
+    def test_mark_to_market_with_offsetting_positions(self):
+        t = arrow.get('2022-02-01T07:00:00+00:00')
+        with mt5.connected():
+            # same size both ways, a long from 154.700 and a short from 154.825
+            positions = backtesting.make_positions([
+                dict(time=t, text='', interpretation=dict(
+                    flag='POSITION', symbol='GBPJPY', side='buy',
+                    entry='154.700', sl='154.200', tp='155.500')),
+                dict(time=t, text='', interpretation=dict(
+                    flag='POSITION', symbol='GBPJPY', side='sell',
+                    entry='154.900', sl='155.325', tp='153.900')),
+            ])
+        for p in positions:
+            p.rates = five_bars()
+            backtesting.resolve_position(p)
+        self.assertEqual([p.sl_delta for p in positions], [0.5, 0.5])
+        pf = Portfolio(ColumnarRun(positions), risk=0.01, compounding=False)
+        prices = {"GBPJPY": pd.DataFrame(dict(
+            time=pd.date_range('2022-02-01 06:00', periods=300, freq='min', tz='UTC'), close=154.72))}
+        mtm = pf.mark_to_market(prices, every="1min").set_index('time')
+        # both open, worth the 0.125 between their entries
+        both = pd.Timestamp('2022-02-01 07:03', tz='UTC')
+        expected = 1 + 0.01 / 0.5 * ((154.72 - 154.700) + (154.825 - 154.72))
+        self.assertAlmostEqual(mtm.equity[both], expected)
+
+
+class TestDrawdown(unittest.TestCase):
+
+    def test_drawdown(self):
+        np.testing.assert_allclose(drawdown(np.array([1, 2, 1, 3, 1.5])), [0, 0, -0.5, 0, -0.5])
+
+    def test_time_under_water(self):
+        time = np.arange(6) * 10
+        self.assertEqual(time_under_water(time, np.array([1, 2, 1, 1.5, 2, 3.0])), 30)
+        # never recovered, runs to the end
+        self.assertEqual(time_under_water(time, np.array([1, 3, 1, 1, 2, 1.0])), 40)
+        self.assertEqual(time_under_water(time, np.arange(6.0)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
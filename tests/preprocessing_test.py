@@ -0,0 +1,77 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from backtesting import preprocessing
+from backtesting.preprocessing import InterpretationCache, TelegramChatPreprocessor, text_key
+
+
+class Interpreter:
+    """Counts the texts that get to hermes"""
+
+    def __init__(self):
+        self.asked = []
+
+    def __call__(self, text):
+        self.asked.append(text)
+        return ('ok', dict(flag='POSITION', text=text)) if text.startswith('buy') else ('ok', dict())
+
+
+class TestInterpretationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.interpreter = Interpreter()
+        self._interpret, preprocessing._interpret = preprocessing._interpret, self.interpreter
+
+    def tearDown(self):
+        preprocessing._interpret = self._interpret
+        shutil.rmtree(self.root)
+
+    def test_hits_and_misses(self):
+        prep = TelegramChatPreprocessor()
+        with InterpretationCache(self.root, version='1') as cache:
+            first = prep.interpret(['buy GJ', 'hello', 'buy GJ'], cache=cache)
+            self.assertEqual(self.interpreter.asked, ['buy GJ', 'hello'])
+            again = prep.interpret(['hello', 'buy EU', 'buy GJ'], cache=cache)
+        # only the new text went to hermes
+        self.assertEqual(self.interpreter.asked, ['buy GJ', 'hello', 'buy EU'])
+        self.assertEqual(again[text_key('buy GJ')], first[text_key('buy GJ')])
+        self.assertEqual(again[text_key('buy EU')], ('ok', dict(flag='POSITION', text='buy EU')))
+
+    def test_put_many(self):
+        items = {text_key(str(k)): ('ok', dict(k=k)) for k in range(1200)}
+        items[text_key('bad')] = ('error', 'TooManyFeatures()')
+        with InterpretationCache(self.root, version='1') as cache:
+            cache.put_many(items)
+            # replaces what was there
+            cache.put_many({text_key('0'): ('ok', dict(k='zero'))})
+        with InterpretationCache(self.root, version='1') as cache:
+            found = cache.get_many(list(items) + [text_key('missing')])
+        self.assertEqual(len(found), len(items))
+        self.assertEqual(found[text_key('0')], ('ok', dict(k='zero')))
+        self.assertEqual(found[text_key('1199')], ('ok', dict(k=1199)))
+        self.assertEqual(found[text_key('bad')], ('error', 'TooManyFeatures()'))
+
+    def test_keyed_by_hermes_version(self):
+        with InterpretationCache(self.root, version='1') as cache:
+            cache.put_many({text_key('buy GJ'): ('ok', dict(flag='POSITION'))})
+        with InterpretationCache(self.root, version='2') as cache:
+            self.assertEqual(cache.get_many([text_key('buy GJ')]), dict())
+            self.assertNotEqual(os.path.basename(cache.path), 'hermes-1.sqlite')
+        # the installed version by default
+        with InterpretationCache(self.root) as cache:
+            self.assertEqual(
+                os.path.basename(cache.path), f'hermes-{preprocessing.hermes_version()}.sqlite'
+            )
+
+    def test_close(self):
+        cache = InterpretationCache(self.root, version='1')
+        cache.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            cache.get_many(['key'])
+
+
+if __name__ == "__main__":
+    unittest.main()
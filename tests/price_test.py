@@ -0,0 +1,35 @@
+import unittest
+from backtesting.classes.price import Price, Pips, candle_mean
+
+
+class TestPrice(unittest.TestCase):
+
+    def test_parsing(self):
+        self.assertEqual(Price("150.55", 0.001).value, 150.55)
+        self.assertEqual(Price("1:1355", 0.00001).value, 1.1355)
+        self.assertEqual(Price(113555, 0.00001).value, 1.13555)
+        self.assertEqual(Price(10, 0.01).value, 10.0)
+
+    def test_float_and_str_are_the_same_price(self):
+        self.assertEqual(Price(154.7, 0.001), Price("154.700", 0.001))
+        self.assertEqual(hash(Price(154.7, 0.001)), hash(Price("154.700", 0.001)))
+        self.assertNotEqual(Price(154.7, 0.001), Price(154.701, 0.001))
+
+    def test_arithmetic_is_exact(self):
+        self.assertEqual(Price(1.1381, 0.00001) - Price(1.1355, 0.00001), 0.0026)
+        self.assertEqual(Price(151.11, 0.001) - Pips(27, 0.001), 150.84)
+        self.assertEqual(Price(0.3, 0.00001) - Price(0.1, 0.00001), 0.2)
+        self.assertEqual(Pips(100, 0.001) - Pips(80, 0.001), 0.2)
+
+    def test_candle_mean_half_ticks(self):
+        mean = Price(candle_mean({"high": 155.001, "low": 155.000}), 0.001)
+        self.assertEqual(mean.value, 155.0005)
+        self.assertEqual(mean - Price(154.8, 0.001), 0.2005)
+
+    def test_ticks(self):
+        self.assertEqual(Price("154.700", 0.001).ticks, 154700)
+        self.assertEqual(Price.from_units(1547000, 0.001), Price(154.7, 0.001))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import pandas as pd
+from backtesting import preprocessing
+from backtesting.runstore import RunStore
+from backtesting.backtesting import Backtest, split_chains, chain_key
+from backtesting.history import HistoryMissError, HistoryStore
+from .drill_down_test import Source
+
+
+def signal(flag, time, **interpretation):
+    return dict(time=time, text="", interpretation=dict(flag=flag, **interpretation))
+
+
+class TestRunStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "runs.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_persists_messages_and_positions(self):
+        store = RunStore(self.path)
+        store.put_messages([(1, "a", dict(text="Pair: GJ")), (2, "b", None)])
+        store.put_positions({"x": [dict(result=1.5)], "y": []})
+
+        store = RunStore(self.path)
+        self.assertEqual(store.messages(), {1: ("a", dict(text="Pair: GJ")), 2: ("b", None)})
+        self.assertEqual(store.positions(), {"x": [dict(result=1.5)], "y": []})
+
+    def test_keep_positions(self):
+        store = RunStore(self.path)
+        store.put_positions({"x": [], "y": []})
+        store.keep_positions(["y", "z"])
+        self.assertEqual(list(store.positions()), ["y"])
+
+
+class TestChains(unittest.TestCase):
+
+    def test_split_chains(self):
+        data = [
+            signal("UPDATE_CLOSE", 0),
+            signal("POSITION", 1),
+            signal("UPDATE_BREAKEVEN", 2),
+            signal("POSITION", 3),
+        ]
+        chains = split_chains(data)
+        self.assertEqual([[d["time"] for d in c] for c in chains], [[1, 2], [3]])
+
+    def test_chain_key_changes_with_updates(self):
+        chain = [signal("POSITION", 1, sl="154.500")]
+        key = chain_key(chain, end_of_period=0)
+        self.assertEqual(key, chain_key(list(chain), end_of_period=0))
+        self.assertNotEqual(key, chain_key(chain + [signal("UPDATE_CLOSE", 2)], end_of_period=0))
+        self.assertNotEqual(key, chain_key(chain, end_of_period=1))
+
+
+class FlakySource(Source):
+    """Source that fails while down is set, like a terminal that isn't
+    running"""
+
+    down = False
+
+    def __call__(self, *args):
+        if self.down:
+            raise HistoryMissError("terminal down")
+        return super().__call__(*args)
+
+
+class TestRefresh(unittest.TestCase):
+    """An export refreshed again and again. The cache is filled
+    beforehand, so hermes never gets asked."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "export.json")
+        self.source = FlakySource()
+        self.cache = preprocessing.InterpretationCache(os.path.join(self.root, "interpretations"))
+        self.store = RunStore(os.path.join(self.root, "runs.sqlite"))
+        self.history = HistoryStore(os.path.join(self.root, "history"), self.source)
+        closes = self.source.m1.set_index("time")["close"]
+
+        self.messages = []
+        for k in range(8):
+            time = pd.Timestamp("2022-01-31 07:00", tz="UTC") + pd.Timedelta(minutes=83 * k)
+            sign = 1 if k % 2 else -1
+            price = float(closes.asof(time))
+            self.message(time, f"signal {k}", dict(
+                flag="POSITION", symbol="GBPJPY", side="buy" if sign > 0 else "sell", entry=None,
+                sl=round(price - sign * 0.2, 3), tp=[round(price + sign * 0.2, 3)]))
+            if k % 3 == 1:
+                self.message(time + pd.Timedelta(minutes=20), f"breakeven {k}", dict(flag="UPDATE_BREAKEVEN"))
+        self.write()
+
+    def tearDown(self):
+        self.cache.close()
+        self.store.conn.close()
+        shutil.rmtree(self.root)
+
+    def message(self, time, text, interpretation):
+        self.messages.append(dict(
+            id=len(self.messages) + 1, type="message",
+            date=time.tz_convert("Europe/Rome").strftime("%Y-%m-%dT%H:%M:%S"), text=text))
+        self.cache.put_many({preprocessing.text_key(text): ("ok", interpretation)})
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump(dict(messages=self.messages), f)
+
+    def refresh(self):
+        b = Backtest(verbose=None, history=self.history)
+        return b.refresh(self.path, self.store, cache=self.cache), b
+
+    def test_second_refresh_reuses_rows(self):
+        first, b = self.refresh()
+        self.assertEqual(len(b.trades), 8)
+        again, b = self.refresh()
+        # only the last position, which might still get updates
+        self.assertEqual(len(b.trades), 1)
+        pd.testing.assert_frame_equal(again, first)
+
+    def test_edited_message_is_simulated_again(self):
+        first, _ = self.refresh()
+        signal = next(m for m in self.messages if m["text"] == "signal 2")
+        signal["text"] = "signal 2, edited"
+        interpretation = dict(self.cache.get_many([preprocessing.text_key("signal 2")])[
+            preprocessing.text_key("signal 2")][1], tp=[])
+        self.cache.put_many({preprocessing.text_key(signal["text"]): ("ok", interpretation)})
+        self.write()
+
+        edited, b = self.refresh()
+        self.assertEqual(len(b.trades), 2)
+        self.assertEqual(b.trades[0].time, pd.Timestamp("2022-01-31 09:46", tz="UTC"))
+        changed = (edited != first).any(axis=1)
+        self.assertEqual(list(changed[changed].index), [2])
+
+    def test_failed_fetch_is_retried(self):
+        self.source.down = True
+        failed, b = self.refresh()
+        self.assertEqual(len(failed), 0)
+        self.assertEqual(self.store.positions(), dict())
+
+        self.source.down = False
+        results, b = self.refresh()
+        self.assertEqual(len(b.trades), 8)
+        self.assertEqual(len(results), len(b.run_results))
+        self.assertEqual(len(self.store.positions()), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
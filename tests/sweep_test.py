@@ -0,0 +1,87 @@
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+from backtesting import backtesting
+from backtesting.backtesting import Backtest
+from backtesting.classes.constants import LABEL
+from backtesting.history import HistoryStore
+from benchmarks import synthetic
+
+EOP = (900, 0.4)
+
+
+class TestResultFromEvents(unittest.TestCase):
+
+    def result(self, events, partials):
+        return Backtest._result_from_events(events, EOP, partials)
+
+    def test_no_events(self):
+        self.assertEqual(self.result([], [0.5, 0.5]), (900, 0.4, 'EOP'))
+
+    def test_stop_first(self):
+        self.assertEqual(self.result([(100, LABEL.SL, -1.0)], [0.5, 0.5]), (100, -1.0, 'SL'))
+
+    def test_stop_after_partials(self):
+        # the rest gets closed at breakeven
+        events = [(100, LABEL.TP, 1.0), (200, LABEL.SL_TO_BE, 0.0)]
+        self.assertEqual(self.result(events, [0.5, 0.5]), (200, 0.5, 'TP'))
+        events = [(100, LABEL.TP, 1.0), (200, LABEL.SL, -1.0)]
+        self.assertEqual(self.result(events, [0.5, 0.5]), (200, 0.5, 'TP'))
+
+    def test_fewer_events_than_partials(self):
+        # what's left is closed at the end of period
+        close, result, kind = self.result([(100, LABEL.TP, 1.0)], [0.3, 0.3, 0.4])
+        self.assertEqual((close, kind), (900, 'TP'))
+        self.assertAlmostEqual(result, 0.3 + 0.4 * 0.7)
+
+    def test_more_events_than_partials(self):
+        events = [(100, LABEL.TP, 1.0), (200, LABEL.TP, 2.0), (300, LABEL.TP, 3.0)]
+        self.assertEqual(self.result(events, [0.5, 0.5]), (200, 1.5, 'TP'))
+
+
+class TestSweep(unittest.TestCase):
+    """Every grid point of a sweep against a separate run with it, on a
+    synthetic export"""
+
+    grid = dict(partials=[[1], [0.5, 0.5], [0.3, 0.3, 0.4]], ignore=[[], ['SL_TO_BE']], end_of_period=[0, 5])
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.signals = synthetic.signals(400)
+        self.history = HistoryStore(os.path.join(self.root, 'history'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def backtest(self):
+        b = Backtest(verbose=None, history=self.history)
+        b.trades = backtesting.make_positions(self.signals)
+        return b
+
+    def test_same_results_as_separate_runs(self):
+        sweep = self.backtest().sweep(**self.grid)
+        self.assertEqual(
+            len(sweep.groupby(['partials', 'ignore', 'end_of_period', 'end_of_day'])),
+            3 * 2 * 2,
+        )
+        for end_of_period in self.grid['end_of_period']:
+            b = self.backtest()
+            b.run(end_of_period=end_of_period)
+            for partials in self.grid['partials']:
+                for ignore in self.grid['ignore']:
+                    with self.subTest(partials=partials, ignore=ignore, end_of_period=end_of_period):
+                        expected = b.make_results(partials=partials, ignore=ignore)
+                        point = sweep[
+                            (sweep.partials == tuple(partials))
+                            & (sweep.ignore == tuple(ignore))
+                            & (sweep.end_of_period == end_of_period)
+                        ]
+                        point = point.drop(columns=['partials', 'ignore', 'end_of_period', 'end_of_day'])
+                        self.assertGreater(len(point), 100)
+                        pd.testing.assert_frame_equal(point.reset_index(drop=True), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+import arrow
+from backtesting import symbols
+from backtesting.classes.position import Position
+from backtesting.symbols import SymbolMissError, SymbolRegistry, SymbolSpec
+
+SPECS = dict(GBPJPY=SymbolSpec('GBPJPY', 0.001, 3), EURUSD=SymbolSpec('EURUSD', 0.00001, 5))
+
+
+class Source:
+
+    def __init__(self):
+        self.asked = []
+
+    def __call__(self, name):
+        self.asked.append(name)
+        return SPECS[name]
+
+
+class TestSymbolRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'symbols.json')
+        self.source = Source()
+        self.registry = SymbolRegistry(self.path, self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_one_symbol_per_name(self):
+        gbpjpy = self.registry.get('GBPJPY')
+        self.assertIs(self.registry.get('GBPJPY'), gbpjpy)
+        self.assertIs(self.registry.get('gj'), gbpjpy)
+        self.assertIs(self.registry.get(' GJ '), gbpjpy)
+        self.assertIs(self.registry.get('gbpjpy'), gbpjpy)
+        self.assertIs(self.registry.get('GbpJpy'), gbpjpy)
+        self.assertEqual(gbpjpy.info.trade_tick_size, 0.001)
+        self.assertEqual(self.source.asked, ['GBPJPY'])
+
+    def test_aliases(self):
+        self.registry.alias('fiber', 'EURUSD')
+        self.assertEqual(self.registry.resolve('Fiber'), 'EURUSD')
+        self.assertEqual(self.registry.resolve('EURUSD.a'), 'EURUSD.a')
+        self.assertEqual(self.registry.resolve('eurusd.a'), 'EURUSD.a')
+        self.assertEqual(self.registry.resolve('xauusd'), 'XAUUSD')
+        # kept with the specs, the default ones aren't
+        again = SymbolRegistry(self.path, None)
+        self.assertEqual(again.resolve('FIBER'), 'EURUSD')
+        self.assertEqual(again._added, dict(FIBER='EURUSD'))
+
+    def test_specs_are_saved(self):
+        self.registry.get('GBPJPY')
+        offline = SymbolRegistry(self.path, offline=True)
+        self.assertEqual(offline.spec('GJ'), SPECS['GBPJPY'])
+        with self.assertRaises(SymbolMissError):
+            offline.get('EURUSD')
+
+    def test_refresh_and_forget(self):
+        self.registry.get('GBPJPY')
+        SPECS['GBPJPY'], old = SymbolSpec('GBPJPY', 0.01, 2), SPECS['GBPJPY']
+        try:
+            self.registry.refresh('GJ')
+            self.assertEqual(self.registry.spec('GBPJPY').trade_tick_size, 0.01)
+            self.assertEqual(SymbolRegistry(self.path, offline=True).spec('GBPJPY').digits, 2)
+        finally:
+            SPECS['GBPJPY'] = old
+        self.registry.forget()
+        self.registry.get('GBPJPY')
+        self.assertEqual(self.source.asked, ['GBPJPY'] * 3)
+        with self.assertRaises(SymbolMissError):
+            SymbolRegistry(self.path, offline=True).refresh()
+
+    def test_positions_without_a_terminal(self):
+        self.registry.put(SPECS['GBPJPY'])
+        old = symbols.set_registry(SymbolRegistry(self.path, offline=True))
+        try:
+            p1 = Position(arrow.get('2022-01-31T07:00:00+00:00'), 'GJ', 'buy', 154.5, 154.3, [154.7])
+            p2 = Position(arrow.get('2022-01-31T08:00:00+00:00'), 'GBPJPY', 'sell', 154.5, 154.7, [154.3])
+            self.assertIs(p1.symbol, p2.symbol)
+            self.assertEqual(p1.symbol.name, 'GBPJPY')
+            # the same object again once unpickled
+            self.assertIs(pickle.loads(pickle.dumps(p1.symbol)), p1.symbol)
+        finally:
+            symbols.set_registry(old)
+
+
+if __name__ == "__main__":
+    unittest.main()
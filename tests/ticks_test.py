@@ -0,0 +1,100 @@
+import unittest
+import tempfile
+import shutil
+import arrow
+import numpy as np
+import pandas as pd
+import betterMT5 as mt5
+from backtesting import backtesting, engine
+from backtesting.classes.constants import SIDE, ORDERTYPE
+from backtesting.ticks import TickStore
+
+
+def t(hhmmss):
+    return pd.Timestamp(f"2022-02-01 {hhmmss}", tz="UTC")
+
+
+def ticks(*quotes):
+    """(time, bid) pairs, with a 2 tick spread"""
+    return pd.DataFrame(dict(
+        time=[t(q[0]) for q in quotes],
+        bid=[q[1] for q in quotes],
+        ask=[round(q[1] + 0.002, 3) for q in quotes],
+    ))
+
+
+class TestTickHits(unittest.TestCase):
+
+    def test_buys_trade_at_the_ask(self):
+        bid = np.array([100, 98, 97, 99, 103])
+        hits = engine.tick_hits(
+            np.arange(5), bid, bid + 2, np.zeros(4, dtype=np.int64),
+            [ORDERTYPE.LIMIT, ORDERTYPE.LIMIT, ORDERTYPE.STOP, ORDERTYPE.STOP],
+            [SIDE.BUY, SIDE.SELL, SIDE.BUY, SIDE.SELL],
+            [99, 103, 104, 97],
+        )
+        self.assertEqual(list(hits), [2, 4, 4, 2])
+
+    def test_start(self):
+        hits = engine.tick_hits(
+            np.arange(3), np.array([1, 1, 1]), np.array([2, 2, 2]),
+            [1, 5], [ORDERTYPE.MARKET] * 2, [SIDE.BUY] * 2, [0, 0])
+        self.assertEqual(list(hits), [1, engine.NO_HIT])
+
+
+class TestTickMode(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.ticks = TickStore(self.root, offline=True)
+        time = arrow.get('2022-02-01T07:00:00+00:00')
+        with mt5.connected():
+            self.p = backtesting.make_positions([dict(
+                time=time, text='', interpretation=dict(
+                    flag='POSITION', symbol='GBPJPY', side='buy',
+                    entry='154.700', sl='154.500', tp=['154.900']))])[0]
+        # sl and tp are both inside the 07:02 candle
+        self.p.rates = pd.DataFrame(dict(
+            time=pd.date_range('2022-02-01 07:00', periods=4, freq='min', tz='UTC'),
+            open=154.7, high=[154.72, 154.75, 154.95, 154.8],
+            low=[154.68, 154.65, 154.45, 154.6], close=154.7))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def resolve(self, ticks=None):
+        orders, task = backtesting._resolution_task(self.p)
+        entry_hit, hits = engine.resolve(*task)
+        fills = None
+        if ticks is not None:
+            fills = backtesting._refine_with_ticks(self.p, orders, hits, ticks, mt5.TIMEFRAME.M1)
+        backtesting._apply_resolution(self.p, orders, entry_hit, hits, fills)
+        return self.p.get_orders(by='execution')
+
+    def test_bars_alone_are_ambiguous(self):
+        events = self.resolve()
+        self.assertEqual(events[0].execution.time, events[1].execution.time)
+
+    def test_ticks_settle_the_candle(self):
+        self.ticks.put('GBPJPY', ticks(('07:02:00', 154.7), ('07:02:10', 154.9),
+                                       ('07:02:20', 154.5)), t('07:02'), t('07:03'))
+        events = self.resolve(self.ticks)
+        self.assertEqual(events[0].name.name, 'TP')
+        self.assertEqual(events[0].execution.time, t('07:02:10').value)
+        self.assertEqual(events[1].execution.time, t('07:02:20').value)
+
+    def test_order_not_triggered_on_ticks_moves_on(self):
+        # the bid never reaches the tp in 07:02, only later on
+        self.ticks.put('GBPJPY', ticks(('07:02:00', 154.7), ('07:02:20', 154.5)),
+                       t('07:02'), t('07:03'))
+        events = self.resolve(self.ticks)
+        self.assertEqual(events[0].name.name, 'SL')
+        self.assertEqual(len(events), 1)
+
+    def test_missing_ticks_keep_the_bars(self):
+        events = self.resolve(self.ticks)
+        self.assertEqual(events[0].execution.time, events[1].execution.time)
+
+
+if __name__ == "__main__":
+    unittest.main()
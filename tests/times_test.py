@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime, timezone
+import arrow
+import numpy as np
+import pandas as pd
+from backtesting.classes.constants import SIDE
+from backtesting.classes.order import SL
+from backtesting.classes.price import Price
+from backtesting.times import isoformat, to_arrow, to_ns
+
+NS = pd.Timestamp('2022-02-01 07:00:30.000123', tz='UTC').value
+
+
+class TestToNs(unittest.TestCase):
+
+    def test_scalars(self):
+        for time in (NS, np.int64(NS), pd.Timestamp(NS, tz='UTC'),
+                     pd.Timestamp(NS, tz='UTC').tz_convert('Europe/Rome'),
+                     pd.Timestamp(NS), arrow.get(pd.Timestamp(NS, tz='UTC').to_pydatetime()),
+                     datetime(2022, 2, 1, 7, 0, 30, 123, tzinfo=timezone.utc),
+                     datetime(2022, 2, 1, 7, 0, 30, 123), '2022-02-01T08:00:30.000123+01:00'):
+            with self.subTest(time=time):
+                self.assertEqual(to_ns(time), NS)
+
+    def test_columns(self):
+        times = pd.date_range('2022-02-01 08:00', periods=3, freq='min', tz='Europe/Rome')
+        expected = np.array([t.value for t in times])
+        for column in (pd.Series(times), times, pd.Series(times.tz_convert('UTC').tz_localize(None)),
+                       [t.isoformat() for t in times]):
+            with self.subTest(column=column):
+                np.testing.assert_array_equal(to_ns(column), expected)
+
+    def test_edges(self):
+        self.assertEqual(to_ns(to_arrow(NS)), NS)
+        self.assertEqual(isoformat(NS), '2022-02-01T07:00:30.000123+00:00')
+
+    def test_orders_keep_ns(self):
+        order = SL(arrow.get('2022-02-01T08:00:30.000123+01:00'), SIDE.SELL, Price(154.5, 0.001))
+        self.assertEqual(order.time, NS)
+        order.set_execution(pd.Timestamp(NS, tz='UTC'), order.price)
+        self.assertEqual(order.execution.time, NS)
+        self.assertIn('time=2022-02-01T07:00:30.000123+00:00', repr(order))
+
+
+if __name__ == "__main__":
+    unittest.main()